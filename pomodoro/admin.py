@@ -1,9 +1,35 @@
 from django.contrib import admin
-from pomodoro.models import TaskSheet, Task, InboxItem, Reflection, Pomodoro, Mark
-
-admin.site.register(TaskSheet)
-admin.site.register(Task)
-admin.site.register(InboxItem)
-admin.site.register(Reflection)
-admin.site.register(Pomodoro)
-admin.site.register(Mark)
+from pomodoro.models import TaskSheet, Task, InboxItem, Reflection, Pomodoro, ArchivedTaskSheet
+from pomodoro.replica import route
+
+class ReplicaAdmin(admin.ModelAdmin):
+    """
+    Reads change lists from the replica when there is a fresh one.
+    Everything else - the change form and the list's actions, which
+    edit what they read - stays on the database.
+    """
+    def changelist_view(self, request, extra_context=None):
+        request.read_from_replica = request.method == 'GET'
+        return super(ReplicaAdmin, self).changelist_view(request, extra_context)
+
+    def queryset(self, request):
+        qs = super(ReplicaAdmin, self).queryset(request)
+        if getattr(request, 'read_from_replica', False):
+            qs = route(qs)
+        return qs
+
+class TaskAdmin(ReplicaAdmin):
+    # marks are kept on the task rather than as rows of their own, so
+    # they are listed with it instead of having a page of their own
+    list_display = ('name', 'task_sheet', 'estimate', 'pomodoro_count', 'marks')
+
+    def marks(self, task):
+        return u', '.join([u'%s %s' % (mark.get_type_display(), mark.time.strftime('%Y-%m-%d %H:%M:%S'))
+                for mark in task.get_marks()])
+
+admin.site.register(TaskSheet, ReplicaAdmin)
+admin.site.register(Task, TaskAdmin)
+admin.site.register(InboxItem, ReplicaAdmin)
+admin.site.register(Reflection, ReplicaAdmin)
+admin.site.register(Pomodoro, ReplicaAdmin)
+admin.site.register(ArchivedTaskSheet, ReplicaAdmin)
@@ -0,0 +1,121 @@
+"""
+Folds old closed task sheets into ArchivedTaskSheet rows.
+
+Each sheet closed before the cutoff becomes one archive row holding
+its tasks, counters, run-length encoded marks and reflections. Its
+rows in the task sheet, task, pomodoro and reflection tables
+are then deleted with a few bulk DELETEs per batch, so the hot tables
+only hold recent history. The sheet detail, list and export views
+read archived sheets back from the archive rows.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from pomodoro.models import TaskSheet, Task, Reflection, Pomodoro, ArchivedTaskSheet
+from pomodoro.models import bump_task_sheet_version, bump_task_sheets_version
+from pomodoro import search
+
+BATCH_SIZE = 100
+# ids per IN (...), under SQLite's default limit of 999 parameters
+# a statement
+CHUNK_SIZE = 900
+
+def get_pinned_ids():
+    """
+    The ids of the sheets holding the newest task sheet, task and
+    reflection. SQLite gives a new row the highest id in its table
+    plus one, so while these rows stay an archived id is never handed
+    out again.
+    """
+    pinned = set()
+    for model, field in ((TaskSheet, 'id'), (Task, 'task_sheet'), (Reflection, 'task_sheet')):
+        newest = model.objects.aggregate(newest=Max('id'))['newest']
+        if newest is not None:
+            pinned.add(model.objects.filter(id=newest).values_list(field, flat=True)[0])
+    return pinned
+
+def get_archivable(before):
+    """
+    The closed sheets to archive: closed before before, not pinned
+    and without a running pomodoro.
+    """
+    qs = TaskSheet.objects.filter(is_open__isnull=True, closed__lt=before).exclude(
+            tasks__pomodoros__is_ongoing=True)
+    pinned = get_pinned_ids()
+    if pinned:
+        qs = qs.exclude(id__in=pinned)
+    return qs
+
+def chunks(ids):
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+def delete_rows(task_sheet_ids):
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    for chunk in chunks(task_sheet_ids):
+        placeholders = ', '.join(['%s'] * len(chunk))
+        task_ids = 'SELECT %s FROM %s WHERE %s IN (%s)' % (
+                qn('id'), qn(Task._meta.db_table), qn('task_sheet_id'), placeholders)
+        for model, column, ids in (
+                (Pomodoro, 'task_id', task_ids),
+                (Reflection, 'task_sheet_id', placeholders),
+                (Task, 'task_sheet_id', placeholders),
+                (TaskSheet, 'id', placeholders),
+                ):
+            cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (qn(model._meta.db_table), qn(column), ids),
+                    chunk)
+
+@transaction.commit_on_success
+def archive_batch(task_sheet_ids):
+    """
+    Archives the given task sheets and deletes their rows, all in
+    one transaction, and returns the (id, owner id) of each. The rows
+    go with raw DELETEs rather than the ORM's, which would load and
+    signal them one by one, so the search index is seen to here.
+    """
+    task_sheets, tasks, reflections = [], {}, {}
+    for chunk in chunks(list(task_sheet_ids)):
+        task_sheets.extend(TaskSheet.objects.filter(id__in=chunk))
+        for task in Task.objects.filter(task_sheet__in=chunk).order_by('id'):
+            tasks.setdefault(task.task_sheet_id, []).append(task)
+        for reflection in Reflection.objects.filter(task_sheet__in=chunk).order_by('id'):
+            reflections.setdefault(reflection.task_sheet_id, []).append(reflection)
+
+    for task_sheet in task_sheets:
+        archived = ArchivedTaskSheet(id=task_sheet.id, owner_id=task_sheet.owner_id,
+                date=task_sheet.date, location=task_sheet.location, closed=task_sheet.closed)
+        archived.pack(tasks.get(task_sheet.id, []), reflections.get(task_sheet.id, []))
+        archived.save(force_insert=True)
+    delete_rows([task_sheet.id for task_sheet in task_sheets])
+
+    documents = []
+    for task_list in tasks.values():
+        documents.extend([('task', task.id) for task in task_list])
+    for reflection_list in reflections.values():
+        documents.extend([('reflection', reflection.id) for reflection in reflection_list])
+    search.unindex_documents(documents)
+    return [(task_sheet.id, task_sheet.owner_id) for task_sheet in task_sheets]
+
+def archive(before, batch_size=BATCH_SIZE, log=None):
+    """
+    Archives every sheet closed before before, batch_size sheets per
+    transaction, and returns how many were archived. log, if given,
+    is called with the running total after each batch.
+    """
+    total = 0
+    while True:
+        ids = list(get_archivable(before).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        archived = archive_batch(ids)
+        # only once committed, so nothing is cached for the new
+        # versions from the rows being archived
+        for task_sheet_id, owner_id in archived:
+            bump_task_sheet_version(task_sheet_id)
+        for owner_id in set([owner_id for task_sheet_id, owner_id in archived]):
+            bump_task_sheets_version(owner_id)
+        total += len(archived)
+        if log is not None:
+            log(total)
@@ -0,0 +1,152 @@
+"""
+Fingerprinted, precompressed static assets.
+
+build copies everything under MEDIA_ROOT to POMODORO_ASSETS_ROOT with
+a hash of its content in the name - pypomo.css becomes
+pypomo.<hash>.css - along with a gzipped .gz copy where that is
+smaller, and writes a manifest of source name to fingerprinted name. A fingerprinted name never
+changes content, so it can be cached forever; changing a file gives
+it a new name.
+
+The {% asset %} tag in asset_tags resolves names through the manifest
+and the asset view answers requests for them out of memory. Until build has
+been run the tag falls back to MEDIA_URL.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+from django.conf import settings
+from django.utils import simplejson
+
+ASSETS_ROOT = getattr(settings, 'POMODORO_ASSETS_ROOT',
+        os.path.join(os.path.dirname(settings.MEDIA_ROOT), 'assets'))
+ASSETS_URL = getattr(settings, 'POMODORO_ASSETS_URL', '/assets/')
+
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+# a year, the most HTTP/1.1 allows
+MAX_AGE = 60 * 60 * 24 * 365
+
+def fingerprint(name, content):
+    base, ext = os.path.splitext(name)
+    return '%s.%s%s' % (base, hashlib.md5(content).hexdigest()[:HASH_LENGTH], ext)
+
+def compress(content):
+    # a fixed mtime so the same content always compresses the same
+    buffer = StringIO()
+    zipped = gzip.GzipFile(filename='', mode='wb', fileobj=buffer, mtime=0)
+    zipped.write(content)
+    zipped.close()
+    return buffer.getvalue()
+
+def write(path, content):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    f = open(path, 'wb')
+    try:
+        f.write(content)
+    finally:
+        f.close()
+
+def read(path):
+    f = open(path, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def build(source=None, target=None):
+    """
+    Writes the fingerprinted and gzipped copies of everything under
+    source to target and returns the manifest. Earlier builds are left
+    in place so pages cached with their names keep working.
+    """
+    source = source or settings.MEDIA_ROOT
+    target = target or ASSETS_ROOT
+    manifest = {}
+    for directory, dirnames, filenames in os.walk(source):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, source).replace(os.sep, '/')
+            content = read(path)
+            manifest[name] = fingerprint(name, content)
+            write(os.path.join(target, manifest[name]), content)
+            zipped = compress(content)
+            if len(zipped) < len(content):
+                write(os.path.join(target, manifest[name] + '.gz'), zipped)
+    write(os.path.join(target, MANIFEST), simplejson.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+def accepts_gzip(accept_encoding):
+    """
+    True if an Accept-Encoding header allows gzip.
+    """
+    for coding in accept_encoding.split(','):
+        params = [param.strip() for param in coding.split(';')]
+        if params[0].lower() not in ('gzip', '*'):
+            continue
+        for param in params[1:]:
+            if param.startswith('q='):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class AssetStore(object):
+    """
+    The manifest and contents of a built assets directory, read into
+    memory in one go.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.manifest = {}
+        # fingerprinted name: (content type, content, gzipped content or None)
+        self.files = {}
+        if not os.path.isdir(root):
+            return
+        manifest = os.path.join(root, MANIFEST)
+        if os.path.exists(manifest):
+            self.manifest = simplejson.loads(read(manifest))
+        for directory, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if name == MANIFEST or name.endswith('.gz'):
+                    continue
+                zipped = None
+                if os.path.exists(path + '.gz'):
+                    zipped = read(path + '.gz')
+                content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                self.files[name] = (content_type, read(path), zipped)
+
+    def url(self, name):
+        if name in self.manifest:
+            return ASSETS_URL + self.manifest[name]
+        return settings.MEDIA_URL + name
+
+    def get(self, name):
+        return self.files.get(name)
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = AssetStore(ASSETS_ROOT)
+    return _store
+
+def asset_url(name):
+    return get_store().url(name)
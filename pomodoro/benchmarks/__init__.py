@@ -0,0 +1,43 @@
+"""
+Synthetic data and timing runs for the pomodoro views, one module
+per area.
+
+seeding.seed() fills the database with a realistic looking history
+and views.run() requests every route against it with the test
+client, recording the wall time, number of queries and memory
+high-water mark of each. See the seed_pomodoros and benchmark_views
+management commands.
+
+lookups.run_get_current() times the current task sheet and pomodoro lookups
+as the number of users grows - see the benchmark_get_current command.
+
+fulltext.run_search() times full-text queries against a search table filled
+with synthetic documents - see the benchmark_search command.
+
+marks.run_marks() compares the size and read time of task mark logs with
+the one-row-per-mark table they replaced - see the benchmark_marks
+command.
+
+stress.run_transitions() has threads start, interrupt and complete one
+owner's pomodoros at once, through pomodoro.transitions or the
+read-then-save code the views used before, and counts duplicates,
+errors and queries - see the stress_transitions command.
+
+shortcuts.run_shortcuts() serves the site from a local server in this process,
+either a fixed pool of worker threads or gevent's greenlets, and has
+clients hammer the shortcut endpoints while others sit in state
+long-polls - see the benchmark_shortcuts command.
+
+replicas.run_replica() times pomodoro writes while other threads export every
+mark over and over, reading from the database and then from a
+replica - see the benchmark_replica command.
+"""
+
+from pomodoro.benchmarks.seeding import USERNAME, PASSWORD, get_user, seed, clear, make_owner
+from pomodoro.benchmarks.views import get_routes, time_request, run, compare
+from pomodoro.benchmarks.lookups import seed_users, run_get_current
+from pomodoro.benchmarks.fulltext import seed_search, run_search
+from pomodoro.benchmarks.marks import seed_marks, run_marks
+from pomodoro.benchmarks.stress import TRANSITIONS, count_transition_queries, run_transitions
+from pomodoro.benchmarks.shortcuts import SERVERS, start_server, run_shortcuts
+from pomodoro.benchmarks.replicas import time_writes, run_replica
@@ -0,0 +1,81 @@
+"""
+run_search() times full-text queries against a search table filled
+with synthetic documents - see the benchmark_search command.
+"""
+
+import random
+import time
+
+from django.db import connection, transaction
+
+from pomodoro import search
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'shi', 'pe', 'da', 'gri', 'fon')
+
+def make_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join([rng.choice(SYLLABLES) for i in range(rng.randint(2, 4))]))
+    return sorted(words)
+
+@transaction.commit_on_success
+def seed_search(rows, owners=100, vocabulary_size=5000, seed=0):
+    """
+    Fills the search table with rows synthetic documents of three to
+    eight words, spread over owners owners. Word frequencies are skewed
+    the way real text is. Returns the vocabulary used.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, vocabulary_size)
+    search.rebuild()
+    cursor = connection.cursor()
+    sql = 'INSERT INTO %s (rowid, body, owner) VALUES (%%s, %%s, %%s)' % search.TABLE
+    batch = []
+    for i in range(1, rows + 1):
+        words = [vocabulary[min(int(rng.expovariate(10.0 / vocabulary_size)), vocabulary_size - 1)]
+                for j in range(rng.randint(3, 8))]
+        batch.append((search.get_rowid('task', i), ' '.join(words), search.owner_token(i % owners + 1)))
+        if len(batch) == 10000:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+    cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (search.TABLE, search.TABLE))
+    return vocabulary
+
+def run_search(rows, owners=100, queries=50, repeat=5, seed=0, log=None):
+    """
+    Seeds the search table and times queries - whole words, prefixes
+    and two word queries - for random owners. Returns a dict of query
+    type to (mean, worst) seconds.
+    """
+    rng = random.Random(seed)
+    vocabulary = seed_search(rows, owners, seed=seed)
+    # the commonest words are at the start of the vocabulary
+    common = vocabulary[:50]
+    # queried as you type them, so whole words end in a space - see
+    # search.parse_query
+    kinds = (
+        ('word', lambda: rng.choice(vocabulary) + ' '),
+        ('common word', lambda: rng.choice(common) + ' '),
+        ('prefix', lambda: rng.choice(common)[:3]),
+        ('two words', lambda: '%s %s ' % (rng.choice(common), rng.choice(vocabulary))),
+        ('word and prefix', lambda: '%s %s' % (rng.choice(common), rng.choice(common)[:3])),
+        )
+    results = {}
+    for name, make_query in kinds:
+        times = []
+        for i in range(queries):
+            query, owner_id = make_query(), rng.randint(1, owners)
+            best = None
+            for j in range(repeat):
+                started = time.time()
+                search.search(owner_id, query, as_you_type=True)
+                elapsed = time.time() - started
+                if best is None or elapsed < best:
+                    best = elapsed
+            times.append(best)
+        results[name] = (sum(times) / len(times), max(times))
+        if log is not None:
+            log(name, results[name])
+    return results
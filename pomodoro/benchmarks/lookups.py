@@ -0,0 +1,95 @@
+"""
+run_get_current() times the current task sheet and pomodoro lookups
+as the number of users grows - see the benchmark_get_current command.
+"""
+
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from pomodoro.benchmarks.seeding import USERNAME
+from pomodoro.models import TaskSheet, Task, Pomodoro, POMODORO_LENGTH
+
+@transaction.commit_on_success
+def seed_users(count):
+    """
+    Adds users until there are count of them, each with an open task
+    sheet and a running pomodoro. Written with executemany since the
+    larger runs need tens of thousands of rows.
+    """
+    existing = User.objects.count()
+    if existing >= count:
+        return
+    qn = connection.ops.quote_name
+    to_db = connection.ops.value_to_db_datetime
+    now = datetime.datetime.now()
+    cursor = connection.cursor()
+
+    def insert(model, columns, rows):
+        cursor.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(model._meta.db_table),
+            ', '.join([qn(column) for column in columns]),
+            ', '.join(['%s'] * len(columns))), rows)
+
+    usernames = ['%s%d' % (USERNAME, i) for i in range(existing, count)]
+    insert(User, ('username', 'first_name', 'last_name', 'email', 'password', 'is_staff',
+        'is_active', 'is_superuser', 'last_login', 'date_joined'),
+        [(username, '', '', '', '!', False, True, False, to_db(now), to_db(now))
+            for username in usernames])
+    owner_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+    insert(TaskSheet, ('owner_id', 'date', 'location', 'closed', 'is_open', 'updated'),
+        [(owner_id, to_db(now), 'office', None, True, to_db(now)) for owner_id in owner_ids])
+    task_sheets = TaskSheet.objects.filter(owner__in=owner_ids).values_list('id', 'owner')
+    insert(Task, ('owner_id', 'task_sheet_id', 'name', 'estimate', 'completed', 'pomodoro_count',
+        'internal_count', 'external_count', 'mark_string', 'mark_log', 'mark_log_time', 'updated'),
+        [(owner_id, task_sheet_id, 'benchmark', 1, None, 0, 0, 0, '', '', 0, to_db(now))
+            for task_sheet_id, owner_id in task_sheets])
+    tasks = Task.objects.filter(owner__in=owner_ids).values_list('id', 'owner')
+    deadline = now + datetime.timedelta(minutes=POMODORO_LENGTH)
+    insert(Pomodoro, ('owner_id', 'task_id', 'start', 'deadline', 'completed', 'is_ongoing', 'updated'),
+        [(owner_id, task_id, to_db(now), to_db(deadline), None, True, to_db(now))
+            for task_id, owner_id in tasks])
+
+def time_lookup(lookup, owner_ids, repeat):
+    """
+    Returns the mean of the best of repeat calls of lookup per owner, in seconds.
+    """
+    total = 0
+    for owner_id in owner_ids:
+        best = None
+        for i in range(repeat):
+            started = time.time()
+            lookup(owner_id)
+            elapsed = time.time() - started
+            if best is None or elapsed < best:
+                best = elapsed
+        total += best
+    return total / len(owner_ids)
+
+def run_get_current(user_counts, repeat=5, sample=100, seed=0, log=None):
+    """
+    Grows the number of users through user_counts and times
+    TaskSheet.objects.get_current and Pomodoro.objects.get_current for
+    a random sample of them at each step. Returns {user count:
+    {lookup name: mean seconds}}; with the lookups on (owner, is_open)
+    and (owner, is_ongoing) the times should stay flat.
+    """
+    rng = random.Random(seed)
+    lookups = (
+        ('task_sheet', TaskSheet.objects.get_current),
+        ('pomodoro', Pomodoro.objects.get_current),
+        )
+    results = {}
+    for count in sorted(user_counts):
+        seed_users(count)
+        owner_ids = list(User.objects.values_list('id', flat=True))
+        owner_ids = rng.sample(owner_ids, min(sample, len(owner_ids)))
+        results[count] = {}
+        for name, lookup in lookups:
+            results[count][name] = time_lookup(lookup, owner_ids, repeat)
+            if log is not None:
+                log(count, name, results[count][name])
+    return results
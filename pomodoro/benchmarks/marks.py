@@ -0,0 +1,120 @@
+"""
+run_marks() compares the size and read time of task mark logs with
+the one-row-per-mark table they replaced - see the benchmark_marks
+command.
+"""
+
+import random
+import time
+
+from django.db import connection, transaction
+
+from pomodoro.benchmarks.seeding import seed
+from pomodoro.models import Task, decode_mark_log
+
+# the mark table as it was before Task.mark_log, with the index
+# it had in sql/mark.sql, and a table holding only the mark log
+# columns so each can be measured on its own
+LEGACY_MARK_TABLE = 'benchmark_mark'
+MARK_LOG_TABLE = 'benchmark_mark_log'
+MARK_TABLES = (
+    """CREATE TABLE benchmark_mark (
+        id integer NOT NULL PRIMARY KEY,
+        task_id integer NOT NULL,
+        time datetime NOT NULL,
+        type varchar(50) NOT NULL)""",
+    'CREATE INDEX benchmark_mark_task_id ON benchmark_mark (task_id)',
+    'CREATE INDEX benchmark_mark_task_id_type_time ON benchmark_mark (task_id, type, time)',
+    """CREATE TABLE benchmark_mark_log (
+        task_id integer NOT NULL PRIMARY KEY,
+        mark_log text NOT NULL,
+        mark_log_time integer NOT NULL)""",
+    )
+
+def used_bytes(cursor):
+    """
+    The bytes in the database file holding data, leaving out free pages.
+    """
+    values = []
+    for pragma in ('page_count', 'freelist_count', 'page_size'):
+        cursor.execute('PRAGMA %s' % pragma)
+        values.append(cursor.fetchone()[0])
+    page_count, freelist_count, page_size = values
+    return (page_count - freelist_count) * page_size
+
+@transaction.commit_on_success
+def seed_marks(tasks):
+    """
+    Copies the mark logs of the seeded tasks into the two benchmark
+    tables, one row per mark in the legacy one, and returns the bytes
+    each took.
+    """
+    cursor = connection.cursor()
+    for sql in MARK_TABLES:
+        cursor.execute(sql)
+    sizes = {}
+    before = used_bytes(cursor)
+    rows = []
+    for task_id, mark_log, mark_log_time in tasks:
+        rows.extend([(task_id, connection.ops.value_to_db_datetime(mark_time), type)
+            for mark_time, type in decode_mark_log(mark_log)])
+        if len(rows) >= 10000:
+            cursor.executemany('INSERT INTO %s (task_id, time, type) VALUES (%%s, %%s, %%s)' % (
+                LEGACY_MARK_TABLE), rows)
+            rows = []
+    if rows:
+        cursor.executemany('INSERT INTO %s (task_id, time, type) VALUES (%%s, %%s, %%s)' % (
+            LEGACY_MARK_TABLE), rows)
+    sizes['rows'] = used_bytes(cursor) - before
+    before = used_bytes(cursor)
+    cursor.executemany('INSERT INTO %s (task_id, mark_log, mark_log_time) VALUES (%%s, %%s, %%s)' % (
+        MARK_LOG_TABLE), tasks)
+    sizes['log'] = used_bytes(cursor) - before
+    return sizes
+
+def read_rows(cursor, task_ids):
+    cursor.execute('SELECT task_id, time, type FROM %s WHERE task_id IN (%s) ORDER BY task_id, time, id' % (
+        LEGACY_MARK_TABLE, ', '.join(['%s'] * len(task_ids))), task_ids)
+    marks = {}
+    for task_id, mark_time, type in cursor.fetchall():
+        marks.setdefault(task_id, []).append((mark_time, type))
+    return marks
+
+def read_log(cursor, task_ids):
+    cursor.execute('SELECT task_id, mark_log FROM %s WHERE task_id IN (%s)' % (
+        MARK_LOG_TABLE, ', '.join(['%s'] * len(task_ids))), task_ids)
+    return dict([(task_id, decode_mark_log(mark_log)) for task_id, mark_log in cursor.fetchall()])
+
+def run_marks(marks=1000000, tasks=10, per_task=8, sheets=200, repeat=5, log=None):
+    """
+    Seeds about marks marks, per_task to a task and tasks tasks to a
+    sheet, and compares the one-row-per-mark table with the mark
+    logs: the bytes each takes and the mean time to read back every
+    mark of a sheet, for a random sample of sheets. Returns {'rows':
+    {...}, 'log': {...}}, each with 'bytes' and 'read' in seconds.
+    """
+    rng = random.Random(0)
+    seeded = seed(max(1, marks // (tasks * per_task)), tasks, per_task, inbox_items=0)
+    task_logs = list(Task.objects.exclude(mark_log='').values_list('id', 'mark_log', 'mark_log_time'))
+    sizes = seed_marks(task_logs)
+    task_ids = {}
+    for task_sheet_id, task_id in Task.objects.values_list('task_sheet', 'id'):
+        task_ids.setdefault(task_sheet_id, []).append(task_id)
+    sample = rng.sample(sorted(task_ids.keys()), min(sheets, len(task_ids)))
+    cursor = connection.cursor()
+    results = {}
+    for name, read in (('rows', read_rows), ('log', read_log)):
+        total = 0
+        for task_sheet_id in sample:
+            best = None
+            for i in range(repeat):
+                started = time.time()
+                read(cursor, task_ids[task_sheet_id])
+                elapsed = time.time() - started
+                if best is None or elapsed < best:
+                    best = elapsed
+            total += best
+        results[name] = {'bytes': sizes[name], 'read': total / len(sample)}
+        if log is not None:
+            log(name, seeded['marks'], results[name])
+    return results
@@ -0,0 +1,82 @@
+"""
+run_replica() times pomodoro writes while other threads export every
+mark over and over, reading from the database and then from a
+replica - see the benchmark_replica command.
+"""
+
+import os
+import threading
+import time
+
+from django.db import connection
+
+from pomodoro import export, replica, transitions
+from pomodoro.benchmarks.seeding import USERNAME, seed, make_owner
+
+def time_writes(owner, task, writes, readers):
+    """
+    Starts and completes writes pomodoros while readers threads export
+    every mark until they are done. Returns the write latencies and
+    how many exports finished meanwhile.
+    """
+    done = []
+    counts = {'exports': 0}
+    lock = threading.Lock()
+
+    def read():
+        try:
+            while not done:
+                for row in export.export_rows('marks'):
+                    pass
+                lock.acquire()
+                try:
+                    counts['exports'] += 1
+                finally:
+                    lock.release()
+        finally:
+            replica.close_replicas(None)
+            connection.close()
+
+    threads = [threading.Thread(target=read) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    latencies = []
+    try:
+        for i in range(writes):
+            for func, args in ((transitions.start, (owner.id, task)), (transitions.complete, (owner.id,))):
+                started = time.time()
+                func(*args)
+                latencies.append(time.time() - started)
+    finally:
+        done.append(True)
+        for thread in threads:
+            thread.join()
+    return latencies, counts['exports']
+
+def run_replica(sheets=200, readers=4, writes=100):
+    """
+    Times pomodoro starts and completions while readers threads export
+    every mark, first with the exports reading from the database and
+    then from a fresh replica. Needs a database file, and
+    replica.REPLICA_NAME pointing somewhere disposable. Returns
+    {'database': result, 'replica': result}, each with the median,
+    90th percentile and slowest write and the exports finished.
+    """
+    seed(sheets, 8, 4)
+    owner, task = make_owner('%sreplica' % USERNAME)
+    name = replica.get_replica_name()
+    if os.path.exists(name):
+        os.remove(name)
+    results = {}
+    for reader in ('database', 'replica'):
+        if reader == 'replica':
+            replica.snapshot()
+        latencies, exports = time_writes(owner, task, writes, readers)
+        latencies.sort()
+        results[reader] = {
+            'p50': latencies[len(latencies) // 2],
+            'p90': latencies[len(latencies) * 9 // 10],
+            'max': latencies[-1],
+            'exports': exports,
+            }
+    return results
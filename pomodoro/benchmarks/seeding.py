@@ -0,0 +1,96 @@
+"""
+Synthetic pomodoro history for the benchmarks.
+
+seed() fills the database with a realistic looking history for the
+benchmark user and clear() removes it again - see the seed_pomodoros
+command.
+"""
+
+import datetime
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+
+from pomodoro.importer import Importer
+from pomodoro.models import TaskSheet, Task, InboxItem, Pomodoro, clear_current_state
+
+LOCATIONS = ('home', 'office', 'office', 'office', 'cafe', 'train')
+ESTIMATES = (1, 1, 2, 2, 2, 3, 3, 4, 5)
+# most marks are completed pomodoros, then internal interruptions
+MARK_TYPES = ('pomodoro',) * 7 + ('internal',) * 2 + ('external',)
+TASK_WORDS = ('write', 'review', 'fix', 'plan', 'email', 'report', 'tests',
+        'design', 'call', 'read', 'budget', 'release')
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark'
+
+def get_user():
+    """
+    Returns the user the seeded history belongs to, creating it if need be.
+    """
+    try:
+        return User.objects.get(username=USERNAME)
+    except User.DoesNotExist:
+        return User.objects.create_user(USERNAME, '%s@example.com' % USERNAME, PASSWORD)
+
+@transaction.commit_on_success
+def seed(sheets, tasks, marks, inbox_items=None, seed=0, end=None, owner=None):
+    """
+    Creates sheets closed task sheets, one a day up to end, with about
+    tasks tasks each and about marks marks per task. The mark counts
+    vary around the average the way real days do. A final open sheet
+    with a running pomodoro is added so the shortcut views have
+    something to work on. Everything belongs to owner, the benchmark
+    user by default.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.date.today()
+    owner = owner or get_user()
+    importer = Importer(owner)
+    for day in range(sheets, 0, -1):
+        date = end - datetime.timedelta(days=day)
+        location = rng.choice(LOCATIONS)
+        for i in range(max(1, int(rng.gauss(tasks, tasks / 4.0)))):
+            name = ' '.join(rng.sample(TASK_WORDS, 2))
+            count = max(0, int(rng.expovariate(1.0 / marks))) if marks else 0
+            types = [rng.choice(MARK_TYPES) for j in range(count)]
+            importer.add(date, location, name, rng.choice(ESTIMATES), types, rng.random() < 0.8)
+    importer.flush()
+
+    if inbox_items is None:
+        inbox_items = sheets
+    for i in range(inbox_items):
+        InboxItem.objects.create(owner=owner, name=' '.join(rng.sample(TASK_WORDS, 3)))
+
+    task_sheet = TaskSheet.objects.create(owner=owner, location=rng.choice(LOCATIONS))
+    for i in range(tasks):
+        Task.objects.create(task_sheet=task_sheet, name=' '.join(rng.sample(TASK_WORDS, 2)),
+                estimate=rng.choice(ESTIMATES))
+    Pomodoro.objects.create(task=task_sheet.tasks.all()[0])
+    if 'stats' in settings.INSTALLED_APPS:
+        call_command('rebuild_stats', verbosity=0)
+    return importer.counts
+
+def clear():
+    """
+    Deletes all the pomodoro data.
+    """
+    owner_ids = list(User.objects.values_list('id', flat=True))
+    for model in (Pomodoro, Task, TaskSheet, InboxItem):
+        model.objects.all().delete()
+    if 'stats' in settings.INSTALLED_APPS:
+        from stats.models import DailyStats
+        DailyStats.objects.all().delete()
+    for owner_id in owner_ids:
+        clear_current_state(owner_id)
+
+def make_owner(name):
+    """
+    A fresh user with an open task sheet and one task.
+    """
+    owner = User.objects.create_user(name, '%s@example.com' % name, PASSWORD)
+    task_sheet = TaskSheet.objects.create(owner=owner, location='office')
+    task = Task.objects.create(task_sheet=task_sheet, name='stress', estimate=1)
+    return owner, task
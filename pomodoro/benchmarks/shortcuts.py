@@ -0,0 +1,200 @@
+"""
+run_shortcuts() serves the site from a local server in this process,
+either a fixed pool of worker threads or gevent's greenlets, and has
+clients hammer the shortcut endpoints while others sit in state
+long-polls - see the benchmark_shortcuts command.
+"""
+
+import Queue
+import httplib
+import threading
+import time
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+from pomodoro.benchmarks.seeding import USERNAME, PASSWORD, make_owner
+from pomodoro.models import get_state_version, bump_state_version
+from pomodoro.views import POLL_TIMEOUT
+
+SERVERS = ('threaded', 'gevent')
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class PooledWSGIServer(WSGIServer):
+    """
+    wsgiref's server answering on a fixed pool of worker threads, the
+    way a synchronous server's workers do: a request holds its worker
+    for as long as it takes, and the rest queue behind it.
+    """
+    def __init__(self, address, workers):
+        WSGIServer.__init__(self, address, QuietRequestHandler)
+        self.waiting = Queue.Queue()
+        self.workers = [threading.Thread(target=self.work) for i in range(workers)]
+        for worker in self.workers:
+            worker.setDaemon(True)
+            worker.start()
+
+    def process_request(self, request, client_address):
+        self.waiting.put((request, client_address))
+
+    def work(self):
+        while True:
+            request, client_address = self.waiting.get()
+            if request is None:
+                return
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            self.close_request(request)
+
+    def stop(self):
+        self.shutdown()
+        for worker in self.workers:
+            self.waiting.put((None, None))
+        self.server_close()
+
+def start_server(name, workers):
+    """
+    Starts the named server on a free local port and returns the port
+    and a function that stops it. gevent's server only gives way
+    between requests once serve.py has patched the process.
+    """
+    if name == 'threaded':
+        server = PooledWSGIServer(('127.0.0.1', 0), workers)
+        server.set_app(WSGIHandler())
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        return server.server_port, server.stop
+    from gevent.pywsgi import WSGIServer as GeventWSGIServer
+    server = GeventWSGIServer(('127.0.0.1', 0), WSGIHandler(), log=None)
+    server.start()
+    return server.server_port, server.stop
+
+def log_in(owner):
+    """
+    The session cookie header of a new session for owner.
+    """
+    client = Client()
+    client.login(username=owner.username, password=PASSWORD)
+    return '%s=%s' % (settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+def http_request(port, method, path, cookie):
+    """
+    Makes one request on a new connection and returns its status.
+    """
+    http = httplib.HTTPConnection('127.0.0.1', port, timeout=POLL_TIMEOUT + 10)
+    try:
+        http.request(method, path, '', {'Cookie': cookie, 'Content-Length': '0'})
+        response = http.getresponse()
+        response.read()
+        return response.status
+    finally:
+        http.close()
+
+def get_shortcut_requests(task):
+    """
+    A round of requests through the shortcut endpoints: a pomodoro
+    started, interrupted twice and completed, another started and
+    cancelled, then the way back to the open sheet.
+    """
+    start = reverse('pomodoros_index', kwargs={'task_sheet_id': task.task_sheet_id, 'task_id': task.id})
+    return [
+        ('POST', start),
+        ('POST', reverse('add_internal_interruption')),
+        ('POST', reverse('add_external_interruption')),
+        ('POST', reverse('complete_pomodoro')),
+        ('POST', start),
+        ('POST', reverse('cancel_pomodoro')),
+        ('GET', reverse('active_sheet')),
+        ]
+
+def run_shortcuts(server='threaded', clients=16, rounds=10, workers=8, pollers=4):
+    """
+    Serves the site from the named server - 'threaded' with workers
+    worker threads, or 'gevent' - and has clients clients each make
+    rounds rounds of shortcut requests for their own pomodoros at
+    once, while pollers more clients hold state long-polls open.
+    Every request is on a new connection. Like run_transitions, this
+    needs a database file. Returns the requests made, the errors
+    (anything but a 200 or a redirect), the time taken, the requests
+    answered a second and the median and 90th percentile latencies.
+    """
+    owners = [make_owner('%sshortcuts%d' % (USERNAME, i)) for i in range(clients + pollers)]
+    cookies = [log_in(owner) for owner, task in owners]
+    port, stop = start_server(server, workers)
+    latencies = []
+    counts = {'errors': 0}
+    lock = threading.Lock()
+    done = []
+
+    def poll(owner, cookie):
+        path = reverse('state_poll')
+        while not done:
+            try:
+                http_request(port, 'GET', '%s?version=%d' % (path, get_state_version(owner.id)), cookie)
+            except Exception:
+                pass
+
+    def work(task, cookie):
+        requests = get_shortcut_requests(task)
+        for i in range(rounds):
+            for method, path in requests:
+                started = time.time()
+                try:
+                    status = http_request(port, method, path, cookie)
+                except Exception:
+                    status = None
+                elapsed = time.time() - started
+                lock.acquire()
+                try:
+                    latencies.append(elapsed)
+                    if status not in (200, 302):
+                        counts['errors'] += 1
+                finally:
+                    lock.release()
+
+    old_debug = settings.DEBUG
+    settings.DEBUG = False
+    try:
+        waiting = [threading.Thread(target=poll, args=(owner, cookie))
+                for (owner, task), cookie in zip(owners[clients:], cookies[clients:])]
+        for poller in waiting:
+            poller.start()
+        # let the polls take their workers before the clients start
+        time.sleep(0.5)
+        working = [threading.Thread(target=work, args=(task, cookie))
+                for (owner, task), cookie in zip(owners[:clients], cookies[:clients])]
+        started = time.time()
+        for worker in working:
+            worker.start()
+        for worker in working:
+            worker.join()
+        elapsed = time.time() - started
+        # wake the polls so they answer and stop
+        done.append(True)
+        for owner, task in owners[clients:]:
+            bump_state_version(owner.id)
+        for poller in waiting:
+            poller.join()
+    finally:
+        settings.DEBUG = old_debug
+        stop()
+    latencies.sort()
+    def percentile(p):
+        return latencies and latencies[min(len(latencies) - 1, len(latencies) * p // 100)] or 0.0
+    return {
+        'requests': len(latencies),
+        'errors': counts['errors'],
+        'time': elapsed,
+        'throughput': len(latencies) / max(elapsed, 1e-9),
+        'p50': percentile(50),
+        'p90': percentile(90),
+        }
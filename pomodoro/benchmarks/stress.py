@@ -0,0 +1,136 @@
+"""
+run_transitions() has threads start, interrupt and complete one
+owner's pomodoros at once, through pomodoro.transitions or the
+read-then-save code the views used before, and counts duplicates,
+errors and queries - see the stress_transitions command.
+"""
+
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from pomodoro import transitions
+from pomodoro.benchmarks.seeding import USERNAME, make_owner
+from pomodoro.models import Task, Pomodoro, Mark, decode_mark_log, get_current_state
+
+# The pomodoro views before pomodoro.transitions, for comparison: the
+# state is read and then written back through the ORM, so two
+# requests can both act on the same state.
+def legacy_start(owner_id, task):
+    if get_current_state(owner_id).pomodoro_id is None:
+        Pomodoro.objects.create(task=task)
+
+def legacy_complete(owner_id):
+    state = get_current_state(owner_id)
+    if state.pomodoro_id is not None:
+        for pomodoro in Pomodoro.objects.filter(id=state.pomodoro_id):
+            pomodoro.completed = datetime.datetime.now()
+            pomodoro.save()
+
+def legacy_cancel(owner_id):
+    state = get_current_state(owner_id)
+    if state.pomodoro_id is not None:
+        Pomodoro.objects.filter(id=state.pomodoro_id).delete()
+
+def legacy_interrupt(owner_id, type):
+    state = get_current_state(owner_id)
+    if state.task_id is not None:
+        Mark.objects.add(state.task_id, type)
+
+# name: (start, complete, cancel, interrupt)
+TRANSITIONS = {
+    'legacy': (legacy_start, legacy_complete, legacy_cancel, legacy_interrupt),
+    'transitions': (transitions.start, transitions.complete, transitions.cancel, transitions.interrupt),
+    }
+
+def count_transition_queries(name):
+    """
+    Returns {transition: queries} for one start, interrupt, complete,
+    start and cancel in a row with the named transitions, the
+    current state already cached.
+    """
+    start, complete, cancel, interrupt = TRANSITIONS[name]
+    owner, task = make_owner('%s%s' % (USERNAME, name))
+    get_current_state(owner.id)
+    steps = (
+        ('start', start, (owner.id, task)),
+        ('interrupt', interrupt, (owner.id, 'internal')),
+        ('complete', complete, (owner.id,)),
+        ('start again', start, (owner.id, task)),
+        ('cancel', cancel, (owner.id,)),
+        )
+    old_debug = settings.DEBUG
+    settings.DEBUG = True
+    results = {}
+    try:
+        for step, func, args in steps:
+            connection.queries = []
+            func(*args)
+            results[step] = len(connection.queries)
+    finally:
+        settings.DEBUG = old_debug
+        connection.queries = []
+    return results
+
+def run_transitions(name, threads=8, rounds=50):
+    """
+    Has threads threads each start, interrupt and complete the same
+    owner's pomodoro rounds times with the named transitions. Each
+    thread has its own connection, so this needs a database file
+    rather than an in-memory one. Returns the pomodoros completed,
+    the X marks written - more than the pomodoros completed are
+    duplicates - the errors raised, the mean queries per transition
+    and the time taken.
+    """
+    start, complete, cancel, interrupt = TRANSITIONS[name]
+    owner, task = make_owner('%s%s%d' % (USERNAME, name, threads))
+    counts = {'errors': 0, 'queries': 0, 'transitions': 0}
+    lock = threading.Lock()
+
+    def work():
+        errors = transitions_run = 0
+        try:
+            for i in range(rounds):
+                for func, args in ((start, (owner.id, task)), (interrupt, (owner.id, 'internal')),
+                        (complete, (owner.id,))):
+                    transitions_run += 1
+                    try:
+                        func(*args)
+                    except Exception:
+                        errors += 1
+                        transaction.rollback_unless_managed()
+            lock.acquire()
+            try:
+                counts['errors'] += errors
+                counts['transitions'] += transitions_run
+                counts['queries'] += len(connection.queries)
+            finally:
+                lock.release()
+        finally:
+            connection.close()
+
+    old_debug = settings.DEBUG
+    settings.DEBUG = True
+    try:
+        workers = [threading.Thread(target=work) for i in range(threads)]
+        started = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - started
+    finally:
+        settings.DEBUG = old_debug
+    completed = Pomodoro.objects.filter(owner=owner, completed__isnull=False).count()
+    marks = [type for mark_time, type in decode_mark_log(Task.objects.get(id=task.id).mark_log)]
+    return {
+        'completed': completed,
+        'marks': marks.count('pomodoro'),
+        'duplicates': marks.count('pomodoro') - completed,
+        'errors': counts['errors'],
+        'queries': float(counts['queries']) / max(counts['transitions'], 1),
+        'time': elapsed,
+        }
@@ -0,0 +1,134 @@
+"""
+run() requests every route against the seeded history with the test
+client, recording the wall time, number of queries and memory
+high-water mark of each - see the benchmark_views command.
+"""
+
+import resource
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.client import Client
+
+from pomodoro.benchmarks.seeding import USERNAME, PASSWORD, get_user, seed, clear
+from pomodoro.models import TaskSheet, InboxItem
+
+def get_routes():
+    """
+    Returns (name, method, path, data) for each route, filled in with
+    ids from the seeded data. POSTs that change the running pomodoro
+    come in pairs that undo each other so every repeat sees the same
+    state.
+    """
+    owner = get_user()
+    task_sheet = TaskSheet.objects.get_current(owner)
+    task = task_sheet.tasks.all()[0]
+    closed = TaskSheet.objects.filter(owner=owner, closed__isnull=False).order_by('-date')[0]
+    closed_task = closed.tasks.all()[0]
+    inbox_item = InboxItem.objects.filter(owner=owner)[0]
+    sheet = '/task_sheets/%d/' % task_sheet.id
+    return [
+        ('home', 'get', '/', None),
+        ('stats', 'get', '/stats/', None),
+        ('active_sheet', 'get', '/active_sheet/', None),
+        ('task_sheets_index', 'get', '/task_sheets/', None),
+        ('new_task_sheet', 'get', '/task_sheets/new/', None),
+        ('task_sheet_detail', 'get', sheet, None),
+        ('task_sheet_detail (closed)', 'get', '/task_sheets/%d/' % closed.id, None),
+        ('tasks_index', 'get', '%stasks/' % sheet, None),
+        ('task_detail', 'get', '%stasks/%d/' % (sheet, task.id), None),
+        ('pomodoros_index', 'get', '%stasks/%d/pomodoros/' % (sheet, task.id), None),
+        ('add_internal_interruption', 'post', '/add_internal_interruption/', {}),
+        ('add_external_interruption', 'post', '/add_external_interruption/', {}),
+        ('cancel_pomodoro', 'post', '/cancel_pomodoro/', {}),
+        ('pomodoros_index (start)', 'post', '%stasks/%d/pomodoros/' % (sheet, task.id), {}),
+        ('complete_pomodoro', 'post', '/complete_pomodoro/', {}),
+        ('pomodoros_index (restart)', 'post', '%stasks/%d/pomodoros/' % (sheet, task.id), {}),
+        ('complete_task', 'post', '/task_sheets/%d/tasks/%d/complete/' % (closed.id, closed_task.id), {}),
+        ('inbox_items_index', 'get', '/inbox_items/', None),
+        ('inbox_items_feed', 'get', '/inbox_items/feed/', None),
+        ('inbox_item_detail', 'get', '/inbox_items/%d/' % inbox_item.id, None),
+        ('export_data', 'get', '/export/marks.csv', None),
+        ]
+
+def max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def time_request(client, method, path, data, repeat):
+    """
+    Returns the best wall time in seconds and the query count over
+    repeat requests, or raises whatever the view raised.
+    """
+    old_debug = settings.DEBUG
+    settings.DEBUG = True
+    try:
+        best = None
+        for i in range(repeat):
+            connection.queries = []
+            started = time.time()
+            response = getattr(client, method)(path, data or {})
+            # make sure streamed responses are actually produced
+            response.content
+            elapsed = time.time() - started
+            queries = len(connection.queries)
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, queries, response.status_code
+    finally:
+        settings.DEBUG = old_debug
+        connection.queries = []
+
+def run(sizes, repeat=5, log=None):
+    """
+    Seeds each (sheets, tasks, marks) size in turn and times every
+    route. Returns {size label: {route name: result}} where a result
+    has time, queries, status and max_rss or an error.
+    """
+    results = {}
+    client = Client()
+    for sheets, tasks, marks in sizes:
+        label = '%dx%dx%d' % (sheets, tasks, marks)
+        clear()
+        seed(sheets, tasks, marks)
+        client.login(username=USERNAME, password=PASSWORD)
+        results[label] = {}
+        for name, method, path, data in get_routes():
+            try:
+                elapsed, queries, status = time_request(client, method, path, data, repeat)
+                result = {
+                    'time': elapsed,
+                    'queries': queries,
+                    'status': status,
+                    'max_rss': max_rss(),
+                    }
+            except Exception as e:
+                result = {'error': '%s: %s' % (e.__class__.__name__, e)}
+            results[label][name] = result
+            if log is not None:
+                log(label, name, result)
+    clear()
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of regressions against a baseline: routes that got
+    slower than the baseline by more than threshold (a fraction), run
+    more queries, or started failing.
+    """
+    regressions = []
+    for label, routes in results.items():
+        for name, result in routes.items():
+            base = baseline.get(label, {}).get(name)
+            if base is None or 'error' in base:
+                continue
+            if 'error' in result:
+                regressions.append('%s %s: %s' % (label, name, result['error']))
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append('%s %s: %d queries, was %d' % (
+                    label, name, result['queries'], base['queries']))
+            if result['time'] > base['time'] * (1 + threshold):
+                regressions.append('%s %s: %.1fms, was %.1fms' % (
+                    label, name, result['time'] * 1000, base['time'] * 1000))
+    return regressions
@@ -0,0 +1,136 @@
+"""
+Replays queued pomodoro events from offline clients in bulk.
+
+An event is a dict with a 'type', an ISO 8601 'time' and, for
+starts, a 'task_id':
+
+    {"type": "start", "time": "2010-03-01T09:00:00", "task_id": 4}
+    {"type": "internal", "time": "2010-03-01T09:10:12"}
+    {"type": "complete", "time": "2010-03-01T09:25:00"}
+
+Events are checked against the pomodoro state machine in order -
+a pomodoro has to be running to complete, cancel or interrupt it and
+must not be running to start one. Events that don't fit are reported
+and skipped; the rest are applied in one transaction. Completing and
+cancelling only touch a pomodoro that is still running, so one stopped
+meanwhile by another request or the scheduler is reported as a
+conflict rather than stopped twice.
+"""
+
+import datetime
+
+from django.db import transaction
+
+from pomodoro.models import Task, Pomodoro, Mark, clear_current_state, bump_task_versions
+from pomodoro.transitions import insert_pomodoro, complete_pomodoro, delete_pomodoro
+
+EVENT_TYPES = ('start', 'complete', 'cancel', 'internal', 'external')
+TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+STOPPED_CONFLICT = {'status': 'conflict', 'error': 'The pomodoro has already been completed or cancelled.'}
+
+class EventError(Exception):
+    pass
+
+def parse_time(value):
+    for format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, format)
+        except (TypeError, ValueError):
+            pass
+    raise EventError('Invalid time %r.' % (value,))
+
+def parse_event(event):
+    """
+    Returns the (type, time, task_id) of an event or
+    raises EventError if it is malformed.
+    """
+    if not isinstance(event, dict):
+        raise EventError('Events must be objects.')
+    type = event.get('type')
+    if type not in EVENT_TYPES:
+        raise EventError('Unknown event type %r.' % (type,))
+    time = parse_time(event.get('time'))
+    task_id = None
+    if type == 'start':
+        try:
+            task_id = int(event.get('task_id'))
+        except (TypeError, ValueError):
+            raise EventError('Start events need a task_id.')
+    return type, time, task_id
+
+@transaction.commit_on_success
+def apply_events(owner_id, events):
+    """
+    Applies a list of one owner's events and returns one result dict per event,
+    each with a 'status' of 'ok', 'error' or 'conflict' and an 'error'
+    message or the affected 'pomodoro_id'.
+    """
+    parsed = []
+    for event in events:
+        try:
+            parsed.append(parse_event(event))
+        except EventError as e:
+            parsed.append(e)
+    task_ids = set(Task.objects.filter(
+        id__in=set([event[2] for event in parsed if not isinstance(event, EventError) and event[2]]),
+        owner=owner_id,
+        ).values_list('id', flat=True))
+
+    ongoing = Pomodoro.objects.filter(owner=owner_id, is_ongoing=True).values_list('id', 'task')[:1]
+    if ongoing:
+        pomodoro_id, task_id = ongoing[0]
+    else:
+        pomodoro_id, task_id = None, None
+
+    marks = []
+    # tasks whose pomodoros were started or cancelled; the marks
+    # see to the rest
+    changed = set()
+    results = []
+    for event in parsed:
+        if isinstance(event, EventError):
+            results.append({'status': 'error', 'error': str(event)})
+            continue
+        type, time, event_task_id = event
+        if type == 'start':
+            if pomodoro_id is not None:
+                results.append({'status': 'error', 'error': 'A pomodoro is already running.'})
+                continue
+            if event_task_id not in task_ids:
+                results.append({'status': 'error', 'error': 'No task %d.' % event_task_id})
+                continue
+            pomodoro_id = insert_pomodoro(owner_id, event_task_id, time)
+            if pomodoro_id is None:
+                results.append({'status': 'error', 'error': 'A pomodoro is already running.'})
+                continue
+            task_id = event_task_id
+            changed.add(task_id)
+        elif pomodoro_id is None:
+            results.append({'status': 'error', 'error': 'No pomodoro is running.'})
+            continue
+        elif type == 'complete':
+            # the X mark is inserted with the rest below rather
+            # than by add_pomodoro_mark
+            if not complete_pomodoro(owner_id, pomodoro_id, time):
+                results.append(STOPPED_CONFLICT)
+                pomodoro_id, task_id = None, None
+                continue
+            marks.append((task_id, time, 'pomodoro'))
+        elif type == 'cancel':
+            if not delete_pomodoro(owner_id, pomodoro_id):
+                results.append(STOPPED_CONFLICT)
+                pomodoro_id, task_id = None, None
+                continue
+            changed.add(task_id)
+        else:
+            marks.append((task_id, time, type))
+        results.append({'status': 'ok', 'pomodoro_id': pomodoro_id})
+        if type in ('complete', 'cancel'):
+            pomodoro_id, task_id = None, None
+
+    Mark.objects.bulk_add(marks)
+    if changed:
+        bump_task_versions(changed, state=False)
+    clear_current_state(owner_id)
+    return results
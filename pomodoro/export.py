@@ -0,0 +1,177 @@
+"""
+Streams the pomodoro tables out as CSV or JSON Lines.
+
+Rows are read in fixed size chunks keyed on the primary key and
+written out through generators, so memory use doesn't depend on
+how much history is being exported.
+
+Task sheets, tasks and reflections of archived sheets are exported
+too, unpacked from their ArchivedTaskSheet rows. Archived sheets only
+keep counts of their pomodoros and marks, so those exports cover live
+sheets alone.
+
+Everything is read from the replica when there is a fresh one - see
+pomodoro.replica.
+"""
+
+import csv
+import datetime
+from cStringIO import StringIO
+
+from django.utils import simplejson
+
+from pomodoro.models import TaskSheet, Task, InboxItem, Reflection, Pomodoro, ArchivedTaskSheet
+from pomodoro.models import decode_mark_log
+from pomodoro.replica import get_reader, route
+
+CHUNK_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+
+# name: (model, fields, date field, location field, owner field).
+# Anything that belongs to a task sheet is filtered on the sheet's date
+# and location; inbox items aren't on a sheet so they are filtered on
+# when they were created and ignore the location.
+EXPORTS = {
+        'task_sheets': (TaskSheet, ('id', 'date', 'location', 'closed'),
+            'date', 'location', 'owner'),
+        'tasks': (Task, ('id', 'task_sheet', 'name', 'estimate', 'completed'),
+            'task_sheet__date', 'task_sheet__location', 'owner'),
+        'pomodoros': (Pomodoro, ('id', 'task', 'completed'),
+            'task__task_sheet__date', 'task__task_sheet__location', 'owner'),
+        'marks': (Task, ('task', 'time', 'type'),
+            'task_sheet__date', 'task_sheet__location', 'owner'),
+        'inbox_items': (InboxItem, ('id', 'name', 'created', 'dealt_with'),
+            'created', None, 'owner'),
+        'reflections': (Reflection, ('id', 'task_sheet', 'content'),
+            'task_sheet__date', 'task_sheet__location', 'task_sheet__owner'),
+        }
+
+def expand_marks(row):
+    task_id, mark_log = row
+    return [(task_id, mark_time, type) for mark_time, type in decode_mark_log(mark_log)]
+
+# name: (columns, function from a row of the columns to the rows of
+# the export) for exports that aren't one row per model instance.
+# The first column has to be the id.
+EXPANDED_EXPORTS = {
+        'marks': (('id', 'mark_log'), expand_marks),
+        }
+
+# name: function from an ArchivedTaskSheet to its rows of the export
+ARCHIVED_EXPORTS = {
+        'task_sheets': lambda archived: [(archived.id, archived.date, archived.location, archived.closed)],
+        'tasks': lambda archived: [(task.id, archived.id, task.name, task.estimate, task.completed)
+            for task in archived.unpack()[0]],
+        'reflections': lambda archived: [(reflection.id, archived.id, reflection.content)
+            for reflection in archived.unpack()[1]],
+        }
+
+def get_fields(name):
+    return EXPORTS[name][1]
+
+def archived_rows(name, start=None, end=None, location=None, owner=None, chunk_size=CHUNK_SIZE,
+        reader=None):
+    """
+    Yields the export's rows from archived sheets, by sheet.
+    """
+    if name not in ARCHIVED_EXPORTS:
+        return
+    qs = route(ArchivedTaskSheet.objects.all(), reader)
+    if owner is not None:
+        qs = qs.filter(owner=owner)
+    if start is not None:
+        qs = qs.filter(date__gte=start)
+    if end is not None:
+        qs = qs.filter(date__lt=end + datetime.timedelta(days=1))
+    if location:
+        qs = qs.filter(location=location)
+    qs = qs.order_by('id')
+
+    last_id = 0
+    while True:
+        task_sheets = list(qs.filter(id__gt=last_id)[:chunk_size])
+        for archived in task_sheets:
+            for row in ARCHIVED_EXPORTS[name](archived):
+                yield row
+        if len(task_sheets) < chunk_size:
+            break
+        last_id = task_sheets[-1].id
+
+def export_rows(name, start=None, end=None, location=None, owner=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields tuples of the export's fields for every matching row - those
+    from archived sheets, which are the older ones, first and then the
+    rest ordered by id (by task for marks). start and end are dates; end is inclusive.
+    owner limits the rows to one user's.
+    """
+    # archived and live rows from the same copy, so a sheet archived
+    # meanwhile is neither missed nor exported twice
+    reader = get_reader()
+    for row in archived_rows(name, start, end, location, owner, chunk_size, reader):
+        yield row
+    model, fields, date_field, location_field, owner_field = EXPORTS[name]
+    columns, expand = EXPANDED_EXPORTS.get(name, (fields, None))
+    qs = route(model._default_manager.all(), reader)
+    if owner is not None:
+        qs = qs.filter(**{owner_field: owner})
+    if start is not None:
+        qs = qs.filter(**{'%s__gte' % date_field: start})
+    if end is not None:
+        qs = qs.filter(**{'%s__lt' % date_field: end + datetime.timedelta(days=1)})
+    if location and location_field:
+        qs = qs.filter(**{location_field: location})
+    qs = qs.order_by('id').values_list(*columns)
+
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id)[:chunk_size])
+        for row in rows:
+            if expand is None:
+                yield row
+            else:
+                for expanded in expand(row):
+                    yield expanded
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1][0]
+
+def to_text(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+def format_csv(rows, fields):
+    """
+    Yields the rows as CSV, one chunk of lines at a time.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    for row in rows:
+        writer.writerow([
+            value is not None and unicode(to_text(value)).encode('utf-8') or ''
+            for value in row])
+        count += 1
+        if count % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def format_jsonl(rows, fields):
+    """
+    Yields the rows as JSON objects, one per line.
+    """
+    for row in rows:
+        yield simplejson.dumps(dict(zip(fields, [to_text(value) for value in row]))) + '\n'
+
+def export(name, format, **filters):
+    """
+    Returns a generator of strings with the named export in the
+    given format.
+    """
+    formatter = {'csv': format_csv, 'jsonl': format_jsonl}[format]
+    return formatter(export_rows(name, **filters), get_fields(name))
@@ -1,5 +1,5 @@
 from django import forms
-from pomodoro.models import TaskSheet, Task, InboxItem, Mark
+from pomodoro.models import TaskSheet, Task, InboxItem, MARK_TYPE_CHOICES
 
 class TaskSheetForm(forms.ModelForm):
     class Meta:
@@ -16,7 +16,7 @@ class TaskForm(forms.ModelForm):
         model = Task
         fields = ('name', 'estimate',)
 
-class MarkForm(forms.ModelForm):
-    class Meta:
-        model = Mark
-        fields = ('type',)
+class MarkForm(forms.Form):
+    # marks live in their task's mark log, so there is no model to
+    # build this from
+    type = forms.ChoiceField(choices=MARK_TYPE_CHOICES)
@@ -0,0 +1,175 @@
+"""
+Bulk imports historical pomodoro logs.
+
+Each input row is one task on a task sheet:
+
+    date,location,task,estimate,marks,completed
+    2009-11-02,office,Write report,3,XX'-X,yes
+
+JSON Lines input uses the same keys. marks is the line of glyphs from
+the paper sheet; every X becomes a completed Pomodoro as well as a mark.
+Task sheets are matched on date and location and created (closed) when
+missing.
+
+Rows are written with raw executemany inserts so none of the per-row
+signals fire. The task counters and mark logs are filled in as the
+tasks are inserted; anything else derived from the marks has to be
+rebuilt afterwards.
+"""
+
+import csv
+import datetime
+
+from django.db import connection
+from django.utils import simplejson
+
+from pomodoro.models import TaskSheet, Task, Pomodoro, MARK_GLYPHS, POMODORO_LENGTH, encode_mark_log
+from pomodoro.models import bump_task_sheet_version, bump_task_sheets_version
+from pomodoro import search
+
+FIELDS = ('date', 'location', 'task', 'estimate', 'marks', 'completed')
+GLYPH_TYPES = dict([(glyph, type) for type, glyph in MARK_GLYPHS.items()])
+TRUE_VALUES = ('1', 'y', 'yes', 'true', 'x')
+
+class RowError(Exception):
+    pass
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        yield row
+
+def read_jsonl(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            try:
+                yield simplejson.loads(line)
+            except ValueError:
+                yield None
+
+READERS = {
+        'csv': read_csv,
+        'jsonl': read_jsonl,
+        }
+
+def parse_row(row):
+    """
+    Validates one input row and returns (date, location, name,
+    estimate, mark types, completed) or raises RowError.
+    """
+    if not isinstance(row, dict):
+        raise RowError('Not a row.')
+    try:
+        date = datetime.datetime.strptime(str(row.get('date', '')).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise RowError('Invalid date %r.' % row.get('date'))
+    location = (row.get('location') or '').strip()
+    name = (row.get('task') or '').strip()
+    if not location or not name:
+        raise RowError('Rows need a location and a task.')
+    try:
+        estimate = int(row.get('estimate') or 0)
+    except (TypeError, ValueError):
+        raise RowError('Invalid estimate %r.' % row.get('estimate'))
+    types = []
+    for glyph in (row.get('marks') or '').replace(' ', ''):
+        if glyph not in GLYPH_TYPES:
+            raise RowError('Unknown mark %r.' % glyph)
+        types.append(GLYPH_TYPES[glyph])
+    completed = str(row.get('completed') or '').strip().lower() in TRUE_VALUES
+    return date, location, name[:250], estimate, types, completed
+
+class Importer(object):
+    """
+    Writes parsed rows to the database as owner's. Call add() for each
+    row and flush() to send the queued pomodoros and marks; the caller
+    looks after the transactions.
+    """
+    def __init__(self, owner):
+        self.owner = owner
+        self.task_sheet_ids = {}
+        # sheets written to since the last flush
+        self.touched = set()
+        # (kind, id, owner id, body) for pomodoro.search
+        self.documents = []
+        self.pomodoros = []
+        self.counts = {'task_sheets': 0, 'tasks': 0, 'pomodoros': 0, 'marks': 0}
+        qn = connection.ops.quote_name
+        self.task_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                qn(Task._meta.db_table),
+                ', '.join([qn(column) for column in (
+                    'task_sheet_id', 'owner_id', 'name', 'estimate', 'completed', 'pomodoro_count',
+                    'internal_count', 'external_count', 'mark_string', 'mark_log',
+                    'mark_log_time', 'updated')]),
+                ', '.join(['%s'] * 12))
+        self.pomodoro_sql = 'INSERT INTO %s (%s, %s, %s, %s, %s, %s, %s) VALUES (%%s, %%s, %%s, %%s, %%s, NULL, %%s)' % (
+                qn(Pomodoro._meta.db_table), qn('task_id'), qn('owner_id'), qn('start'), qn('deadline'),
+                qn('completed'), qn('is_ongoing'), qn('updated'))
+
+    def get_task_sheet_id(self, date, location):
+        key = (date, location)
+        if key not in self.task_sheet_ids:
+            start = datetime.datetime.combine(date, datetime.time.min)
+            existing = TaskSheet.objects.filter(
+                    owner=self.owner,
+                    location=location,
+                    date__gte=start,
+                    date__lt=start + datetime.timedelta(days=1),
+                    ).values_list('id', flat=True)[:1]
+            if existing:
+                self.task_sheet_ids[key] = existing[0]
+            else:
+                task_sheet = TaskSheet.objects.create(owner=self.owner, location=location, closed=start)
+                # date is auto_now_add so it has to be set afterwards
+                TaskSheet.objects.filter(id=task_sheet.id).update(date=start)
+                self.task_sheet_ids[key] = task_sheet.id
+                self.counts['task_sheets'] += 1
+        return self.task_sheet_ids[key]
+
+    def add(self, date, location, name, estimate, types, completed):
+        task_sheet_id = self.get_task_sheet_id(date, location)
+        self.touched.add(task_sheet_id)
+        # paper logs have no times, so space the marks a second
+        # apart from midnight to keep them in order
+        start = datetime.datetime.combine(date, datetime.time.min)
+        times = [start + datetime.timedelta(seconds=i) for i in range(len(types))]
+        to_db = connection.ops.value_to_db_datetime
+        now = to_db(datetime.datetime.now())
+        mark_log, mark_log_time = encode_mark_log(zip(times, types))
+        cursor = connection.cursor()
+        cursor.execute(self.task_sql, [
+            task_sheet_id, self.owner.id, name, estimate,
+            completed and to_db(times and times[-1] or start) or None,
+            types.count('pomodoro'), types.count('internal'), types.count('external'),
+            ''.join([MARK_GLYPHS[type] for type in types]),
+            mark_log, mark_log_time,
+            now,
+            ])
+        task_id = connection.ops.last_insert_id(cursor, Task._meta.db_table, 'id')
+        self.counts['tasks'] += 1
+        self.counts['marks'] += len(types)
+        self.documents.append(('task', task_id, self.owner.id, name))
+        for type, time in zip(types, times):
+            if type == 'pomodoro':
+                # the X is the end of the pomodoro
+                self.pomodoros.append((task_id, self.owner.id,
+                    to_db(time - datetime.timedelta(minutes=POMODORO_LENGTH)),
+                    to_db(time), to_db(time), now))
+
+    def flush(self):
+        cursor = connection.cursor()
+        if self.pomodoros:
+            cursor.executemany(self.pomodoro_sql, self.pomodoros)
+            self.counts['pomodoros'] += len(self.pomodoros)
+        self.pomodoros = []
+        # the raw inserts don't send the signals that bump these
+        for task_sheet_id in self.touched:
+            bump_task_sheet_version(task_sheet_id)
+        if self.touched:
+            bump_task_sheets_version(self.owner.id)
+        self.touched = set()
+        search.index_documents(self.documents)
+        self.documents = []
+
+    def rows_written(self):
+        return sum(self.counts.values())
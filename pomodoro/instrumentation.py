@@ -0,0 +1,208 @@
+"""
+Per-view latency and database instrumentation.
+
+InstrumentationMiddleware times each request and counts the queries it
+runs and the time spent in them, keyed by the name of the url pattern
+the request matched, or the pattern itself if it has no name. The
+numbers go into fixed-bucket histograms so memory stays bounded however
+many requests are served, and render_metrics() writes them out in the
+Prometheus text exposition format.
+
+Requests that run more than POMODORO_QUERY_BUDGET queries are logged as
+warnings to the 'pomodoro.instrumentation' logger along with their SQL.
+
+The histograms live in the process, so each worker reports its own.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.urlresolvers import RegexURLResolver, get_resolver
+from django.db import connection
+
+logger = logging.getLogger('pomodoro.instrumentation')
+
+# upper bounds of the histogram buckets; +Inf is implied
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+# urls are only known once resolved; anything that never got that far
+# (404s, redirects from CommonMiddleware) is lumped together
+UNRESOLVED = 'unresolved'
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Yields (upper bound, cumulative count) pairs, ending with +Inf.
+        """
+        total = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            yield bound, total
+
+METRICS = (
+    ('pypomo_request_seconds', 'Time spent handling requests.', SECONDS_BUCKETS),
+    ('pypomo_request_queries', 'Database queries run per request.', QUERIES_BUCKETS),
+    ('pypomo_request_db_seconds', 'Time spent in the database per request.', SECONDS_BUCKETS),
+    )
+
+def get_url_name(path, resolver=None, prefix='^'):
+    """
+    The name of the url pattern path resolves to, or the pattern -
+    the regular expressions it was matched with joined together - if
+    it has no name. None if nothing matches.
+    """
+    if resolver is None:
+        resolver = get_resolver(None)
+    match = resolver.regex.search(path)
+    if match is None:
+        return None
+    path = path[match.end():]
+    for pattern in resolver.url_patterns:
+        regex = pattern.regex.pattern.lstrip('^')
+        if isinstance(pattern, RegexURLResolver):
+            name = get_url_name(path, pattern, prefix + regex)
+            if name is not None:
+                return name
+        elif pattern.regex.search(path):
+            return pattern.name or prefix + regex
+    return None
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+class Registry(object):
+    """
+    Holds one histogram per metric per url.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, seconds, queries, db_seconds):
+        self.lock.acquire()
+        try:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = [Histogram(buckets) for name, help, buckets in METRICS]
+            for histogram, value in zip(histograms, (seconds, queries, db_seconds)):
+                histogram.observe(value)
+        finally:
+            self.lock.release()
+
+    def render(self):
+        lines = []
+        self.lock.acquire()
+        try:
+            for i, (name, help, buckets) in enumerate(METRICS):
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s histogram' % name)
+                for view in sorted(self.views):
+                    histogram = self.views[view][i]
+                    label = escape_label(view)
+                    for bound, count in histogram.cumulative():
+                        lines.append('%s_bucket{view="%s",le="%s"} %d' % (name, label, bound, count))
+                    lines.append('%s_sum{view="%s"} %s' % (name, label, repr(float(histogram.sum))))
+                    lines.append('%s_count{view="%s"} %d' % (name, label, histogram.count))
+        finally:
+            self.lock.release()
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+def render_metrics():
+    return registry.render()
+
+class TimingCursorWrapper(object):
+    """
+    Wraps a database cursor to count and time the queries run on it.
+    """
+    def __init__(self, cursor, recorder):
+        self.cursor = cursor
+        self.recorder = recorder
+
+    def execute(self, sql, params=()):
+        started = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.recorder.record(sql, time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.recorder.record(sql, time.time() - started)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+class RequestRecorder(object):
+    def __init__(self):
+        self.started = time.time()
+        self.view = UNRESOLVED
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.sql = []
+
+    def record(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.sql.append((sql, seconds))
+
+class InstrumentationMiddleware(object):
+    """
+    Records latency, query count and database time per url. Put it
+    first in MIDDLEWARE_CLASSES so it sees the whole request.
+    """
+    def process_request(self, request):
+        recorder = RequestRecorder()
+        request._instrumentation = recorder
+        # the connection is thread local, so this only
+        # affects the thread handling this request
+        cursor = connection.__class__.cursor
+        connection.cursor = lambda: TimingCursorWrapper(cursor(connection), recorder)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        recorder = getattr(request, '_instrumentation', None)
+        if recorder is not None:
+            # a view can serve several urls, and not every decorator
+            # keeps the name of the view it wraps
+            recorder.view = get_url_name(request.path_info) or UNRESOLVED
+
+    def process_response(self, request, response):
+        recorder = getattr(request, '_instrumentation', None)
+        if recorder is None:
+            return response
+        if 'cursor' in connection.__dict__:
+            del connection.cursor
+        seconds = time.time() - recorder.started
+        registry.observe(recorder.view, seconds, recorder.queries, recorder.db_seconds)
+
+        budget = getattr(settings, 'POMODORO_QUERY_BUDGET', None)
+        if budget is not None and recorder.queries > budget:
+            logger.warning('%s %s ran %d queries (budget %d) in %.1fms:\n%s' % (
+                request.method, request.path, recorder.queries, budget, recorder.db_seconds * 1000,
+                '\n'.join(['%.1fms %s' % (seconds * 1000, sql) for sql, seconds in recorder.sql])))
+        return response
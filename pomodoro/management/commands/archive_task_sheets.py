@@ -0,0 +1,31 @@
+import datetime
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pomodoro import archive
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--days', dest='days', type='int', default=90,
+            help='Archive sheets closed more than this many days ago. Defaults to 90.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=archive.BATCH_SIZE,
+            help='Sheets archived per transaction. Defaults to %d.' % archive.BATCH_SIZE),
+    )
+    help = "Folds closed task sheets into compact archive rows and deletes their tasks, marks and pomodoros."
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        days, batch_size = options.get('days'), options.get('batch_size')
+        if days < 0 or batch_size < 1:
+            raise CommandError('--days must be at least 0 and --batch-size at least 1.')
+        before = datetime.datetime.now() - datetime.timedelta(days=days)
+        log = None
+        if verbosity > 1:
+            log = lambda total: sys.stdout.write('Archived %d task sheet(s)...\n' % total)
+        total = archive.archive(before, batch_size=batch_size, log=log)
+        if verbosity > 0:
+            sys.stdout.write('Archived %d task sheet(s) closed before %s.\n' % (
+                total, before.strftime('%Y-%m-%d %H:%M')))
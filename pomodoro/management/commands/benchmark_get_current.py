@@ -0,0 +1,40 @@
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+
+from pomodoro import benchmarks
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--users', dest='users', default='1,10,100,1000,10000',
+            help='Comma separated user counts to time at. Defaults to 1,10,100,1000,10000.'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+            help='Lookups per user; the best time is kept. Defaults to 5.'),
+        make_option('--sample', dest='sample', type='int', default=100,
+            help='Users to time at each count. Defaults to 100.'),
+    )
+    help = "Times the current task sheet and pomodoro lookups as the number of users grows."
+
+    def handle_noargs(self, **options):
+        try:
+            user_counts = [int(count) for count in options['users'].split(',')]
+        except ValueError:
+            raise CommandError('Users look like 1,10,100.')
+        verbosity = int(options.get('verbosity', 1))
+
+        def log(count, name, elapsed):
+            if verbosity > 0:
+                sys.stdout.write('%6d users %-12s %8.3fms\n' % (count, name, elapsed * 1000))
+
+        # run against a throwaway database, never the real one
+        old_name = settings.DATABASE_NAME
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            benchmarks.run_get_current(user_counts, repeat=options['repeat'],
+                    sample=options['sample'], log=log)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
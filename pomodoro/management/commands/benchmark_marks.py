@@ -0,0 +1,42 @@
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.db import connection
+
+from pomodoro import benchmarks
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--marks', dest='marks', type='int', default=1000000,
+            help='Approximate number of marks to seed. Defaults to 1000000.'),
+        make_option('--tasks', dest='tasks', type='int', default=10,
+            help='Average tasks per sheet. Defaults to 10.'),
+        make_option('--per-task', dest='per_task', type='int', default=8,
+            help='Average marks per task. Defaults to 8.'),
+        make_option('--sheets', dest='sheets', type='int', default=200,
+            help='Sheets whose marks are read back. Defaults to 200.'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+            help='Reads per sheet; the best time is kept. Defaults to 5.'),
+    )
+    help = "Compares the size and read time of task mark logs with one row per mark."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        def log(name, marks, result):
+            if verbosity > 0:
+                sys.stdout.write('%-4s %8d marks %10d bytes %5.1f bytes/mark read %6.3fms/sheet\n' % (
+                    name, marks, result['bytes'], float(result['bytes']) / max(marks, 1),
+                    result['read'] * 1000))
+
+        # run against a throwaway database, never the real one
+        old_name = settings.DATABASE_NAME
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            benchmarks.run_marks(options['marks'], tasks=options['tasks'], per_task=options['per_task'],
+                    sheets=options['sheets'], repeat=options['repeat'], log=log)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,53 @@
+import os
+import shutil
+import sys
+import tempfile
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+
+from pomodoro import benchmarks, replica
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--sheets', dest='sheets', type='int', default=200,
+            help='Task sheets of history to seed for the exports. Defaults to 200.'),
+        make_option('--readers', dest='readers', type='int', default=4,
+            help='Threads exporting every mark meanwhile. Defaults to 4.'),
+        make_option('--writes', dest='writes', type='int', default=100,
+            help='Pomodoros started and completed. Defaults to 100.'),
+    )
+    help = ("Times pomodoro writes while exports run against the database and then against "
+            "a replica.")
+
+    def handle_noargs(self, **options):
+        if options['sheets'] < 1 or options['readers'] < 0 or options['writes'] < 1:
+            raise CommandError('--sheets and --writes must be at least 1 and --readers at least 0.')
+        verbosity = int(options.get('verbosity', 1))
+
+        # a throwaway database file and replica, since the readers
+        # open connections of their own
+        old_name = settings.DATABASE_NAME
+        old_test_name = getattr(settings, 'TEST_DATABASE_NAME', None)
+        old_replica_name = replica.REPLICA_NAME
+        directory = tempfile.mkdtemp()
+        settings.TEST_DATABASE_NAME = os.path.join(directory, 'replica.sqlite')
+        replica.REPLICA_NAME = os.path.join(directory, 'replica.replica.sqlite')
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            results = benchmarks.run_replica(options['sheets'], options['readers'], options['writes'])
+            if verbosity > 0:
+                for name in ('database', 'replica'):
+                    result = results[name]
+                    sys.stdout.write('exports on %-8s write p50 %6.1fms p90 %6.1fms max %7.1fms '
+                        '%4d exports\n' % (name, result['p50'] * 1000, result['p90'] * 1000,
+                        result['max'] * 1000, result['exports']))
+        finally:
+            replica.close_replicas(None)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            settings.TEST_DATABASE_NAME = old_test_name
+            replica.REPLICA_NAME = old_replica_name
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,39 @@
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.db import connection
+
+from pomodoro import benchmarks
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--rows', dest='rows', type='int', default=1000000,
+            help='Number of documents to index. Defaults to 1000000.'),
+        make_option('--owners', dest='owners', type='int', default=100,
+            help='Number of owners the documents are spread over. Defaults to 100.'),
+        make_option('--queries', dest='queries', type='int', default=50,
+            help='Queries of each type to time. Defaults to 50.'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+            help='Runs per query; the best time is kept. Defaults to 5.'),
+    )
+    help = "Times full-text searches against a large synthetic search table."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        def log(name, result):
+            if verbosity > 0:
+                sys.stdout.write('%-12s mean %7.2fms worst %7.2fms\n' % (
+                    name, result[0] * 1000, result[1] * 1000))
+
+        # run against a throwaway database, never the real one
+        old_name = settings.DATABASE_NAME
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            benchmarks.run_search(options['rows'], owners=options['owners'],
+                    queries=options['queries'], repeat=options['repeat'], log=log)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import sys
+import tempfile
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+
+from pomodoro import benchmarks
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--server', dest='server', default='threaded',
+            help='threaded or gevent. gevent has to be run through serve.py. Defaults to threaded.'),
+        make_option('--clients', dest='clients', type='int', default=16,
+            help='Clients making shortcut requests at once. Defaults to 16.'),
+        make_option('--rounds', dest='rounds', type='int', default=10,
+            help='Rounds of shortcut requests per client. Defaults to 10.'),
+        make_option('--workers', dest='workers', type='int', default=8,
+            help='Worker threads of the threaded server. Defaults to 8.'),
+        make_option('--pollers', dest='pollers', type='int', default=4,
+            help='Clients holding a state long-poll open meanwhile. Defaults to 4.'),
+    )
+    help = ("Serves the site from a local server in this process and measures the throughput "
+            "and latency of concurrent requests to the shortcut endpoints. Compare "
+            "'manage.py benchmark_shortcuts' with 'serve.py benchmark_shortcuts --server=gevent'.")
+
+    def handle_noargs(self, **options):
+        server = options['server']
+        if server not in benchmarks.SERVERS:
+            raise CommandError('--server must be one of %s.' % ', '.join(benchmarks.SERVERS))
+        if options['clients'] < 1 or options['rounds'] < 1 or options['workers'] < 1 or options['pollers'] < 0:
+            raise CommandError('--clients, --rounds and --workers must be at least 1 and --pollers at least 0.')
+        if server == 'gevent':
+            try:
+                from gevent import monkey
+            except ImportError:
+                raise CommandError('--server=gevent needs gevent installed.')
+            if not monkey.is_module_patched('socket'):
+                raise CommandError('Run --server=gevent through serve.py so the process is patched.')
+        verbosity = int(options.get('verbosity', 1))
+
+        # a throwaway database file, since every worker opens its own
+        # connection
+        old_name = settings.DATABASE_NAME
+        old_test_name = getattr(settings, 'TEST_DATABASE_NAME', None)
+        directory = tempfile.mkdtemp()
+        settings.TEST_DATABASE_NAME = os.path.join(directory, 'shortcuts.sqlite')
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            result = benchmarks.run_shortcuts(server, options['clients'], options['rounds'],
+                    options['workers'], options['pollers'])
+            if verbosity > 0:
+                sys.stdout.write('%-8s %5d requests %4d errors %7.1fms %7.1f requests/s '
+                    'p50 %6.1fms p90 %6.1fms\n' % (
+                    server, result['requests'], result['errors'], result['time'] * 1000,
+                    result['throughput'], result['p50'] * 1000, result['p90'] * 1000))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            settings.TEST_DATABASE_NAME = old_test_name
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,68 @@
+import os
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from django.utils import simplejson
+
+from pomodoro import benchmarks
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(benchmarks.__file__), 'baseline.json')
+
+def parse_sizes(value):
+    try:
+        return [tuple([int(n) for n in size.split('x')]) for size in value.split(',')]
+    except ValueError:
+        raise CommandError('Sizes look like 10x8x4,100x8x4 (sheets x tasks x marks).')
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--sizes', dest='sizes', default='10x8x4,100x8x4,1000x8x4',
+            help='Comma separated sheets x tasks x marks sizes to seed. Defaults to 10x8x4,100x8x4,1000x8x4.'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+            help='Requests per route; the best time is kept. Defaults to 5.'),
+        make_option('--baseline', dest='baseline', default=DEFAULT_BASELINE,
+            help='JSON baseline file to compare against or save to.'),
+        make_option('--threshold', dest='threshold', type='float', default=0.25,
+            help='Allowed slowdown against the baseline as a fraction. Defaults to 0.25.'),
+        make_option('--save', action='store_true', dest='save', default=False,
+            help='Write the results out as the new baseline instead of comparing.'),
+    )
+    help = "Times every pomodoro route at several data sizes and checks for regressions."
+
+    def handle_noargs(self, **options):
+        sizes = parse_sizes(options['sizes'])
+        verbosity = int(options.get('verbosity', 1))
+
+        def log(label, name, result):
+            if verbosity < 1:
+                return
+            if 'error' in result:
+                sys.stdout.write('%-10s %-30s %s\n' % (label, name, result['error']))
+            else:
+                sys.stdout.write('%-10s %-30s %8.2fms %4d queries %6dkB\n' % (
+                    label, name, result['time'] * 1000, result['queries'], result['max_rss']))
+
+        # run against a throwaway database, never the real one
+        old_name = settings.DATABASE_NAME
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            results = benchmarks.run(sizes, repeat=options['repeat'], log=log)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options.get('save'):
+            output = open(options['baseline'], 'w')
+            try:
+                simplejson.dump(results, output, indent=2, sort_keys=True)
+            finally:
+                output.close()
+            return
+        if not os.path.exists(options['baseline']):
+            raise CommandError('No baseline at %s - run with --save first.' % options['baseline'])
+        baseline = simplejson.load(open(options['baseline']))
+        regressions = benchmarks.compare(results, baseline, options['threshold'])
+        if regressions:
+            raise CommandError('Regressions against %s:\n%s' % (options['baseline'], '\n'.join(regressions)))
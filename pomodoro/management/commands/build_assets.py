@@ -0,0 +1,18 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from pomodoro import assets
+
+
+class Command(NoArgsCommand):
+    help = "Writes fingerprinted and gzipped copies of the files under MEDIA_ROOT for serving from memory."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        manifest = assets.build()
+        if verbosity > 1:
+            for name in sorted(manifest):
+                sys.stdout.write('%s -> %s\n' % (name, manifest[name]))
+        if verbosity > 0:
+            sys.stdout.write('Built %d asset(s) in %s.\n' % (len(manifest), assets.ASSETS_ROOT))
@@ -0,0 +1,59 @@
+import datetime
+import sys
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from pomodoro import export
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Dates must look like YYYY-MM-DD, not %r.' % value)
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='csv',
+            help='csv or jsonl. Defaults to csv.'),
+        make_option('--start', dest='start',
+            help='Only export task sheets from this date (YYYY-MM-DD) on.'),
+        make_option('--end', dest='end',
+            help='Only export task sheets up to and including this date (YYYY-MM-DD).'),
+        make_option('--location', dest='location',
+            help='Only export task sheets from this location.'),
+        make_option('--owner', dest='owner',
+            help='Only export this username\'s rows.'),
+        make_option('--output', dest='output',
+            help='File to write to. Defaults to stdout.'),
+    )
+    help = "Streams one of the pomodoro tables out as CSV or JSON Lines."
+    args = '<%s>' % '|'.join(sorted(export.EXPORTS))
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or args[0] not in export.EXPORTS:
+            raise CommandError('Enter one of %s.' % ', '.join(sorted(export.EXPORTS)))
+        format = options.get('format')
+        if format not in export.FORMATS:
+            raise CommandError('Format must be one of %s.' % ', '.join(export.FORMATS))
+        filters = {'location': options.get('location')}
+        if options.get('owner'):
+            try:
+                filters['owner'] = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError('No user %r.' % options['owner'])
+        for name in ('start', 'end'):
+            filters[name] = options.get(name) and parse_date(options[name]) or None
+
+        if options.get('output'):
+            output = open(options['output'], 'wb')
+        else:
+            output = sys.stdout
+        try:
+            for chunk in export.export(args[0], format, **filters):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
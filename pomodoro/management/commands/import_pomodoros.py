@@ -0,0 +1,98 @@
+import sys
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pomodoro import importer
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--owner', dest='owner',
+            help='Username of the user the history belongs to.'),
+        make_option('--format', dest='format',
+            help='csv or jsonl. Guessed from the file name by default.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=5000,
+            help='Number of input rows per transaction. Defaults to 5000.'),
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Do the whole import and then roll it back.'),
+    )
+    help = "Bulk imports historical task sheets, tasks and mark strings from CSV or JSON Lines."
+    args = '<file>'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Enter the file to import.')
+        path = args[0]
+        format = options.get('format') or path.rsplit('.', 1)[-1]
+        if format not in importer.READERS:
+            raise CommandError('Format must be one of %s.' % ', '.join(sorted(importer.READERS)))
+        if not options.get('owner'):
+            raise CommandError('Enter the --owner to import for.')
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError('No user %r.' % options['owner'])
+        verbosity = int(options.get('verbosity', 1))
+        dry_run = options.get('dry_run')
+
+        input = open(path, 'rb')
+        try:
+            started = time.time()
+            rows, errors, counts = self.load(
+                    owner, importer.READERS[format](input), options['batch_size'], dry_run, verbosity)
+            elapsed = max(time.time() - started, 0.001)
+        finally:
+            input.close()
+
+        if not dry_run and 'stats' in settings.INSTALLED_APPS:
+            call_command('rebuild_stats', verbosity=verbosity)
+
+        if verbosity > 0:
+            written = sum(counts.values())
+            sys.stdout.write('%s %d row(s) (%d skipped): %d task sheet(s), %d task(s), %d pomodoro(s), %d mark(s).\n' % (
+                dry_run and 'Checked' or 'Imported', rows, errors, counts['task_sheets'],
+                counts['tasks'], counts['pomodoros'], counts['marks']))
+            sys.stdout.write('%.1fs, %d input rows/s, %d database rows/s.\n' % (
+                elapsed, rows / elapsed, written / elapsed))
+
+    @transaction.commit_manually
+    def load(self, owner, rows, batch_size, dry_run, verbosity):
+        """
+        Imports the rows, committing every batch_size rows - or
+        rolling everything back at the end for a dry run.
+        """
+        writer = importer.Importer(owner)
+        count = 0
+        errors = 0
+        try:
+            for row in rows:
+                count += 1
+                try:
+                    parsed = importer.parse_row(row)
+                except importer.RowError as e:
+                    errors += 1
+                    if verbosity > 0:
+                        sys.stderr.write('Row %d: %s\n' % (count, e))
+                    continue
+                writer.add(*parsed)
+                if count % batch_size == 0:
+                    writer.flush()
+                    if not dry_run:
+                        transaction.commit()
+                    if verbosity > 1:
+                        sys.stdout.write('%d rows...\n' % count)
+            writer.flush()
+        except:
+            transaction.rollback()
+            raise
+        if dry_run:
+            transaction.rollback()
+        else:
+            transaction.commit()
+        return count, errors, writer.counts
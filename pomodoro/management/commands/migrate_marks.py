@@ -0,0 +1,114 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.backends.util import typecast_timestamp
+
+from pomodoro.models import Task, decode_mark_log, encode_mark_log
+
+# where marks were kept before they moved into Task.mark_log
+MARK_TABLE = 'pomodoro_mark'
+BATCH_SIZE = 1000
+
+def add_columns(cursor):
+    """
+    Adds the mark log columns to a task table created before them.
+    Returns the names of the columns added.
+    """
+    qn = connection.ops.quote_name
+    table = Task._meta.db_table
+    existing = [row[0] for row in connection.introspection.get_table_description(cursor, table)]
+    added = []
+    for column, definition in (
+            ('mark_log', "text NOT NULL DEFAULT ''"),
+            ('mark_log_time', 'integer NOT NULL DEFAULT 0'),
+            ):
+        if column not in existing:
+            cursor.execute('ALTER TABLE %s ADD COLUMN %s %s' % (qn(table), qn(column), definition))
+            added.append(column)
+    return added
+
+def to_datetime(value):
+    if isinstance(value, basestring):
+        return typecast_timestamp(value)
+    return value
+
+def write_logs(cursor, marks_by_task):
+    """
+    Prepends each task's old marks to whatever is in its mark log
+    already - marks added since the upgrade - keeping them in time order.
+    """
+    if not marks_by_task:
+        return
+    qn = connection.ops.quote_name
+    logs = dict(Task.objects.filter(id__in=marks_by_task.keys()).values_list('id', 'mark_log'))
+    rows = []
+    for task_id, marks in marks_by_task.items():
+        if task_id not in logs:
+            continue
+        marks = sorted(marks + decode_mark_log(logs[task_id]), key=lambda mark: mark[0])
+        mark_log, mark_log_time = encode_mark_log(marks)
+        rows.append((mark_log, mark_log_time, task_id))
+    cursor.executemany('UPDATE %s SET %s = %%s, %s = %%s WHERE %s = %%s' % (
+        qn(Task._meta.db_table), qn('mark_log'), qn('mark_log_time'), qn('id')), rows)
+
+@transaction.commit_on_success
+def migrate(batch_size=BATCH_SIZE):
+    """
+    Moves every row of the old mark table into its task's mark log
+    and drops the table, all in one transaction so a failed run can
+    simply be run again. Returns the number of marks moved, or None
+    if there was no mark table.
+    """
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    add_columns(cursor)
+    if MARK_TABLE not in connection.introspection.table_names():
+        return None
+    read = connection.cursor()
+    read.execute('SELECT %s, %s, %s FROM %s ORDER BY %s, %s, %s' % (
+        qn('task_id'), qn('time'), qn('type'), qn(MARK_TABLE),
+        qn('task_id'), qn('time'), qn('id')))
+    count = 0
+    # the rows come a task at a time; each task's marks are written
+    # once the next task's start, batch_size tasks at a time
+    pending, task_id, marks = {}, None, []
+    while True:
+        rows = read.fetchmany(batch_size)
+        if not rows:
+            break
+        for row_task_id, mark_time, type in rows:
+            if row_task_id != task_id:
+                if marks:
+                    pending[task_id] = marks
+                task_id, marks = row_task_id, []
+                if len(pending) >= batch_size:
+                    write_logs(cursor, pending)
+                    pending = {}
+            marks.append((to_datetime(mark_time), type))
+        count += len(rows)
+    if marks:
+        pending[task_id] = marks
+    write_logs(cursor, pending)
+    cursor.execute('DROP TABLE %s' % qn(MARK_TABLE))
+    return count
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=BATCH_SIZE,
+            help='Mark rows read and tasks written at a time. Defaults to %d.' % BATCH_SIZE),
+    )
+    help = ("Adds the mark log columns to the task table if need be, moves the marks "
+            "from the old pomodoro_mark table into them and drops the table.")
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        count = migrate(options.get('batch_size'))
+        if verbosity > 0:
+            if count is None:
+                sys.stdout.write('No %s table, nothing to move.\n' % MARK_TABLE)
+            else:
+                sys.stdout.write('Moved %d mark(s) into the task mark logs and dropped %s.\n' % (
+                    count, MARK_TABLE))
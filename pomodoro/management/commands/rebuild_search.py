@@ -0,0 +1,15 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from pomodoro import search
+
+
+class Command(NoArgsCommand):
+    help = "Rebuilds the full-text search table from the Task, InboxItem and Reflection rows."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        count = search.rebuild()
+        if verbosity > 0:
+            sys.stdout.write('Indexed %d row(s).\n' % count)
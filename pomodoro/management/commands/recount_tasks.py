@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from pomodoro.models import Task
+
+
+class Command(NoArgsCommand):
+    help = "Recomputes the denormalized pomodoro and mark counters on every Task."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        fixed = 0
+        for task in Task.objects.all().iterator():
+            before = task.get_counters()
+            task.refresh_counters(save=False)
+            if task.get_counters() != before:
+                task.save_counters()
+                fixed += 1
+                if verbosity > 1:
+                    sys.stdout.write('Repaired %s (task %d)\n' % (task, task.id))
+        if verbosity > 0:
+            sys.stdout.write('Repaired counters on %d task(s).\n' % fixed)
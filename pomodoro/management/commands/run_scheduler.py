@@ -0,0 +1,34 @@
+import datetime
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+
+from pomodoro.scheduler import Scheduler
+
+# caches that live in one process
+LOCAL_CACHES = ('locmem', 'dummy')
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--refresh', dest='refresh', type='int', default=30,
+            help='Most seconds to go without rereading the deadlines. Defaults to 30.'),
+    )
+    help = "Runs until killed, completing pomodoros as their deadlines pass."
+
+    def handle_noargs(self, **options):
+        if settings.CACHE_BACKEND.split(':', 1)[0] in LOCAL_CACHES:
+            raise CommandError('The scheduler needs a cache shared with the web processes, '
+                    'such as memcached:// or file://, to tell them about the pomodoros it '
+                    'completes. CACHE_BACKEND is %s.' % settings.CACHE_BACKEND)
+        verbosity = int(options.get('verbosity', 1))
+        def log(message):
+            if verbosity > 0:
+                sys.stdout.write('[%s] %s\n' % (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), message))
+                sys.stdout.flush()
+        log('Scheduler started.')
+        try:
+            Scheduler(refresh=options['refresh']).run(log=log)
+        except KeyboardInterrupt:
+            log('Scheduler stopped.')
@@ -0,0 +1,30 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from pomodoro import benchmarks
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--sheets', dest='sheets', type='int', default=365,
+            help='Number of daily task sheets. Defaults to 365.'),
+        make_option('--tasks', dest='tasks', type='int', default=8,
+            help='Average number of tasks per sheet. Defaults to 8.'),
+        make_option('--marks', dest='marks', type='int', default=4,
+            help='Average number of marks per task. Defaults to 4.'),
+        make_option('--seed', dest='seed', type='int', default=0,
+            help='Random seed, so runs can be repeated.'),
+        make_option('--clear', action='store_true', dest='clear', default=False,
+            help='Delete all the existing pomodoro data first.'),
+    )
+    help = "Fills the database with a synthetic pomodoro history for benchmarking."
+
+    def handle_noargs(self, **options):
+        if options.get('clear'):
+            benchmarks.clear()
+        counts = benchmarks.seed(options['sheets'], options['tasks'], options['marks'], seed=options['seed'])
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write('Created %(task_sheets)d task sheet(s), %(tasks)d task(s), '
+                    '%(pomodoros)d pomodoro(s) and %(marks)d mark(s).\n' % counts)
@@ -0,0 +1,43 @@
+import datetime
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from pomodoro import replica
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--every', dest='every', type='int', default=0,
+            help='Take a snapshot every this many seconds until killed, rather than once.'),
+    )
+    help = ("Copies the database into the read-only replica that stats, exports and the admin's "
+            "lists read from.")
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        every = options['every']
+        if every < 0:
+            raise CommandError('--every must be at least 0.')
+        if every > replica.REPLICA_MAX_AGE:
+            raise CommandError('--every must not be more than POMODORO_REPLICA_MAX_AGE (%d) or the '
+                    'replica would go unused between snapshots.' % replica.REPLICA_MAX_AGE)
+        def log(message):
+            if verbosity > 0:
+                sys.stdout.write('[%s] %s\n' % (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), message))
+                sys.stdout.flush()
+        try:
+            while True:
+                started = time.time()
+                try:
+                    elapsed = replica.snapshot()
+                except ValueError as e:
+                    raise CommandError(str(e))
+                log('Copied the database to %s in %.2fs.' % (replica.get_replica_name(), elapsed))
+                if not every:
+                    return
+                time.sleep(max(0, every - (time.time() - started)))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,52 @@
+import os
+import shutil
+import sys
+import tempfile
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+
+from pomodoro import benchmarks
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--threads', dest='threads', type='int', default=8,
+            help='Threads working on the same pomodoro at once. Defaults to 8.'),
+        make_option('--rounds', dest='rounds', type='int', default=50,
+            help='Start, interrupt and complete rounds per thread. Defaults to 50.'),
+    )
+    help = ("Races threads through pomodoro starts, interruptions and completions, with "
+            "pomodoro.transitions and with the old read-then-save views, and reports "
+            "duplicates, errors and queries per transition.")
+
+    def handle_noargs(self, **options):
+        if options['threads'] < 1 or options['rounds'] < 1:
+            raise CommandError('--threads and --rounds must be at least 1.')
+        verbosity = int(options.get('verbosity', 1))
+
+        # run against a throwaway database, never the real one - a
+        # file, since every thread opens its own connection and an
+        # in-memory database would be a different one for each
+        old_name = settings.DATABASE_NAME
+        old_test_name = getattr(settings, 'TEST_DATABASE_NAME', None)
+        directory = tempfile.mkdtemp()
+        settings.TEST_DATABASE_NAME = os.path.join(directory, 'stress.sqlite')
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            for name in sorted(benchmarks.TRANSITIONS):
+                queries = benchmarks.count_transition_queries(name)
+                result = benchmarks.run_transitions(name, options['threads'], options['rounds'])
+                if verbosity > 0:
+                    sys.stdout.write('%-12s %4d completed %4d X marks %4d duplicates %4d errors '
+                        '%5.1f queries/transition %7.1fms\n' % (
+                        name, result['completed'], result['marks'], result['duplicates'],
+                        result['errors'], result['queries'], result['time'] * 1000))
+                    sys.stdout.write('%-12s single thread: %s\n' % ('', ', '.join(
+                        ['%s %d' % (step, queries[step]) for step in sorted(queries)])))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            settings.TEST_DATABASE_NAME = old_test_name
+            shutil.rmtree(directory, ignore_errors=True)
@@ -1,40 +1,181 @@
-from django.db import models
-from django.db.models.signals import post_save
+import base64
+import calendar
+import datetime
+import itertools
+import re
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import models, connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal
+from django.utils import simplejson
+
+from pomodoro.replica import route
 
 
 # see http://www.pomodorotechnique.com/ for the inspiration for this app
 
+# the cadence, in minutes: a pomodoro, the short break after it and
+# the long break taken after every POMODORO_LONG_BREAK_EVERY pomodoros
+POMODORO_LENGTH = getattr(settings, 'POMODORO_LENGTH', 25)
+POMODORO_SHORT_BREAK = getattr(settings, 'POMODORO_SHORT_BREAK', 5)
+POMODORO_LONG_BREAK = getattr(settings, 'POMODORO_LONG_BREAK', 15)
+POMODORO_LONG_BREAK_EVERY = getattr(settings, 'POMODORO_LONG_BREAK_EVERY', 4)
+
+def get_break_length(pomodoros_done):
+    """
+    Returns the length in minutes of the break due after
+    pomodoros_done pomodoros.
+    """
+    if pomodoros_done and pomodoros_done % POMODORO_LONG_BREAK_EVERY == 0:
+        return POMODORO_LONG_BREAK
+    return POMODORO_SHORT_BREAK
+
+def filter_task_sheets(queryset, after=None, month=None, location=None):
+    """
+    Narrows a TaskSheet or ArchivedTaskSheet queryset down to a month
+    and location and the sheets after the (date, id) key, newest first.
+    """
+    if location:
+        queryset = queryset.filter(location=location)
+    if month is not None:
+        start = datetime.datetime(month.year, month.month, 1)
+        end = datetime.datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        queryset = queryset.filter(date__gte=start, date__lt=end)
+    if after is not None:
+        date, id = after
+        queryset = queryset.filter(models.Q(date__lt=date) | models.Q(date=date, id__lt=id))
+    return queryset.order_by('-date', '-id')
+
 class TaskSheetManager(models.Manager):
 
-    def get_current(self):
+    def get_current(self, owner):
         """
-        Gets the current open task sheet or
+        Gets the owner's current open task sheet or
         None if no task sheet is open.
         """
-        qs = self.get_query_set()
-        open_task_sheets = qs.filter(closed=None)
-
-        if open_task_sheets.count() == 0:
+        # (owner, is_open) is unique so the database guarantees
+        # there is at most one open task sheet per owner
+        try:
+            return self.get_query_set().get(owner=owner, is_open=True)
+        except self.model.DoesNotExist:
             return None
-        else:
-            # this intentionally raises an Exception when more than
-            # one task sheet is open. This should theoretically never happen
-            return open_task_sheets.get()
+
+    def get_page(self, owner, after=None, count=20, month=None, location=None, reader=None):
+        """
+        Returns up to count of the owner's task sheets, newest first,
+        along with the (date, id) key to pass as after to get the next
+        page - or None on the last page. month (any date in it) and
+        location narrow the list down. reader, if given, is the
+        connection to read from - see pomodoro.replica.
+
+        Each sheet comes with task_count and pomodoros_done. They are
+        worked out by subqueries in the same query, so only the sheets
+        on the page are counted and, like the keyset paging over the
+        index in sql/tasksheet.sql, a page costs the same however many
+        sheets the owner has. Archived sheets are merged in as
+        ArchivedTaskSheets, which store their counts.
+        """
+        qn = connection.ops.quote_name
+        task_table = qn(Task._meta.db_table)
+        where = '%s.%s = %s.%s' % (task_table, qn('task_sheet_id'),
+                qn(self.model._meta.db_table), qn('id'))
+        qs = self.get_query_set().filter(owner=owner).extra(select={
+            'task_count': 'SELECT COUNT(*) FROM %s WHERE %s' % (task_table, where),
+            'pomodoros_done': 'SELECT COALESCE(SUM(%s.%s), 0) FROM %s WHERE %s' % (
+                task_table, qn('pomodoro_count'), task_table, where),
+            })
+        if reader is not None:
+            qs = route(qs, reader)
+        task_sheets = list(filter_task_sheets(qs, after, month, location)[:count + 1])
+        # archived sheets share the id space, so the keys still order
+        # them - one more query per page, without the packed data
+        archived = ArchivedTaskSheet.objects.filter(owner=owner).defer('data')
+        if reader is not None:
+            archived = route(archived, reader)
+        task_sheets.extend(filter_task_sheets(archived, after, month, location)[:count + 1])
+        task_sheets.sort(key=lambda task_sheet: (task_sheet.date, task_sheet.id), reverse=True)
+        if len(task_sheets) > count:
+            task_sheets = task_sheets[:count]
+            last = task_sheets[-1]
+            return task_sheets, (last.date, last.id)
+        return task_sheets, None
+
+    def get_graph(self, **kwargs):
+        """
+        Gets a single task sheet along with all of its tasks, marks,
+        pomodoros and reflections. Always costs the same four queries
+        no matter how big the sheet is - the related rows are fetched
+        per table and stitched together in memory, and the marks come
+        with their tasks.
+
+        The results are available as task_sheet.task_list,
+        task_sheet.reflection_list, task.mark_list and task.pomodoro_list.
+        """
+        return self.load_graph(self.get_query_set().get(**kwargs))
+
+    def load_graph(self, task_sheet):
+        """
+        Does the work of get_graph for a task sheet that has already
+        been fetched, in three queries.
+        """
+        tasks = list(task_sheet.tasks.order_by('id'))
+        tasks_by_id = {}
+        for task in tasks:
+            task._task_sheet_cache = task_sheet
+            task.mark_list = task.get_marks()
+            task.pomodoro_list = []
+            tasks_by_id[task.id] = task
+
+        # filter on the join rather than an IN list of task ids so
+        # large sheets don't hit the database's parameter limits
+        pomodoros = Pomodoro.objects.filter(task__task_sheet=task_sheet).order_by('id')
+        for pomodoro in pomodoros:
+            task = tasks_by_id[pomodoro.task_id]
+            pomodoro._task_cache = task
+            task.pomodoro_list.append(pomodoro)
+
+        reflections = list(task_sheet.reflection_set.order_by('id'))
+        for reflection in reflections:
+            reflection._task_sheet_cache = task_sheet
+
+        task_sheet.task_list = tasks
+        task_sheet.reflection_list = reflections
+        return task_sheet
 
 class TaskSheet(models.Model):
     """
     Represents a pomodoro task sheet. Essentially a date and location
     that holds tasks and Inbox items. Also allows for reflection bits.
     """
+    owner = models.ForeignKey(User, related_name='task_sheets')
     date = models.DateTimeField(auto_now_add=True)
     location = models.CharField(max_length=50)
-    closed = models.DateTimeField(null=True, blank=True)
+    closed = models.DateTimeField(null=True, blank=True, db_index=True)
+    # True while the sheet is open and NULL once closed. NULLs don't
+    # collide in a unique index, so each owner can only have one
+    # sheet open.
+    is_open = models.NullBooleanField(default=True, editable=False)
+    updated = models.DateTimeField(auto_now=True)
 
     objects = TaskSheetManager()
 
+    class Meta:
+        unique_together = (('owner', 'is_open'),)
+
     def __unicode__(self):
         return '%s - %s' % (self.location, self.date.strftime('%Y-%m-%d'))
 
+    def save(self, *args, **kwargs):
+        self.is_open = self.closed is None or None
+        super(TaskSheet, self).save(*args, **kwargs)
+
 class Task(models.Model):
     """
     One pomodoro task. Cannot be spread over multiple task
@@ -42,23 +183,120 @@ class Task(models.Model):
     sitting. May want to review. Has a place for estimate
     of number of pomodoros for completion.
     """
+    # always the task sheet's owner, copied so tasks can be
+    # scoped without a join
+    owner = models.ForeignKey(User, related_name='tasks', editable=False)
+    # (task_sheet, completed) is indexed in sql/task.sql
     task_sheet = models.ForeignKey(TaskSheet, related_name='tasks')
     name = models.CharField(max_length=250)
     estimate = models.SmallIntegerField()
     completed = models.DateTimeField(null=True, blank=True)
 
+    # denormalized from the marks and Pomodoro so the task sheet can
+    # be rendered from one row per task. Kept up to date by
+    # append_marks and rebuilt by the recount_tasks management
+    # command.
+    pomodoro_count = models.PositiveIntegerField(default=0, editable=False)
+    internal_count = models.PositiveIntegerField(default=0, editable=False)
+    external_count = models.PositiveIntegerField(default=0, editable=False)
+    # a glyph per mark, appended to without a bound by append_marks,
+    # so a TextField - a long task would outgrow any max_length
+    mark_string = models.TextField(blank=True, default='', editable=False)
+    # every mark on the task with its time - see encode_mark_log.
+    # Appended to along with the counters by append_marks.
+    mark_log = models.TextField(blank=True, default='', editable=False)
+    # the time of the last mark in mark_log, in seconds
+    mark_log_time = models.IntegerField(default=0, editable=False)
+    # also set by the raw counter updates in append_marks
+    updated = models.DateTimeField(auto_now=True)
+
     def __unicode__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.owner_id is None:
+            self.owner_id = self.task_sheet.owner_id
+        super(Task, self).save(*args, **kwargs)
+
+    def get_marks(self):
+        """
+        The task's marks as Marks, oldest first.
+        """
+        marks = [Mark(self.id, mark_time, type, task=self) for mark_time, type in decode_mark_log(self.mark_log)]
+        # sorted is stable, so marks with the same time stay in the
+        # order they were added
+        return sorted(marks, key=lambda mark: mark.time)
+
+    def refresh_counters(self, save=True):
+        """
+        Recomputes the denormalized counters from the mark log and
+        the Pomodoro table.
+        """
+        marks = [mark.type for mark in self.get_marks()]
+        self.pomodoro_count = self.pomodoros.filter(completed__isnull=False).count()
+        self.internal_count = 0
+        self.external_count = 0
+        glyphs = []
+        for type in marks:
+            if type == 'internal':
+                self.internal_count += 1
+            elif type == 'external':
+                self.external_count += 1
+            glyphs.append(MARK_GLYPHS.get(type, ''))
+        self.mark_string = ''.join(glyphs)
+        if save:
+            self.save_counters()
+
+    def save_counters(self):
+        self.updated = datetime.datetime.now()
+        Task.objects.filter(id=self.id).update(
+                updated=self.updated,
+                pomodoro_count=self.pomodoro_count,
+                internal_count=self.internal_count,
+                external_count=self.external_count,
+                mark_string=self.mark_string,
+                )
+
+    def get_counters(self):
+        return (self.pomodoro_count, self.internal_count,
+                self.external_count, self.mark_string)
+
+
+class InboxItemManager(models.Manager):
+
+    def get_active_page(self, owner, after=None, count=20):
+        """
+        Returns up to count of the owner's inbox items that haven't been dealt with,
+        oldest first, along with the (created, id) key to pass as after
+        to get the next page - or None on the last page.
+
+        Paging on the key rather than an offset keeps each page to
+        one short index range scan however long the inbox gets.
+        """
+        qs = self.get_query_set().filter(owner=owner, dealt_with__isnull=True)
+        if after is not None:
+            created, id = after
+            qs = qs.filter(models.Q(created__gt=created) | models.Q(created=created, id__gt=id))
+        items = list(qs.order_by('created', 'id')[:count + 1])
+        if len(items) > count:
+            items = items[:count]
+            last = items[-1]
+            return items, (last.created, last.id)
+        return items, None
 
 class InboxItem(models.Model):
     """
     Represents an item to be added to the Inbox
     and dealt with later.
     """
+    # (owner, dealt_with, created) is indexed in sql/inboxitem.sql
+    owner = models.ForeignKey(User, related_name='inbox_items')
     name = models.CharField(max_length=250)
     created = models.DateTimeField(auto_now_add=True)
     dealt_with = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = InboxItemManager()
 
     def __unicode__(self):
         return self.name
@@ -68,30 +306,192 @@ MARK_TYPE_CHOICES = (
         ('internal', "'"),
         ('external', '-'),
         )
+MARK_GLYPHS = dict(MARK_TYPE_CHOICES)
+
+# Marks are stored in their task's mark_log as a letter for the type
+# followed by the seconds since the mark before, so a mark takes a few
+# bytes instead of a row of its own plus index entries. The first mark
+# follows mark_log_time's default of 0, the epoch.
+MARK_CODES = {
+        'pomodoro': 'p',
+        'internal': 'i',
+        'external': 'e',
+        }
+MARK_CODE_TYPES = dict([(code, type) for type, code in MARK_CODES.items()])
+MARK_LOG_RE = re.compile(r'([a-z])(-?\d+)')
+
+def to_seconds(time):
+    return calendar.timegm(time.timetuple())
+
+def from_seconds(seconds):
+    return datetime.datetime.utcfromtimestamp(seconds)
+
+def encode_mark_log(marks, last=0):
+    """
+    Encodes (time, type) marks to follow a mark at last seconds and
+    returns the encoded marks and the seconds of the last one. Times
+    are kept to the second.
+    """
+    encoded = []
+    for mark_time, type in marks:
+        seconds = to_seconds(mark_time)
+        encoded.append('%s%d' % (MARK_CODES[type], seconds - last))
+        last = seconds
+    return ''.join(encoded), last
+
+def decode_mark_log(mark_log):
+    """
+    Returns the (time, type) of each mark in a mark log, in the order
+    they were added.
+    """
+    marks = []
+    seconds = 0
+    for code, delta in MARK_LOG_RE.findall(mark_log):
+        seconds += int(delta)
+        marks.append((from_seconds(seconds), MARK_CODE_TYPES[code]))
+    return marks
+
+class MarkManager(object):
+
+    def count(self):
+        """
+        The number of marks on all tasks, summed from the counters
+        append_marks keeps rather than by decoding every mark log.
+        """
+        totals = Task.objects.aggregate(models.Sum('pomodoro_count'),
+                models.Sum('internal_count'), models.Sum('external_count'))
+        return sum([total or 0 for total in totals.values()])
+
+    def add(self, task_id, type, time=None, pomodoro_id=None):
+        """
+        Adds a mark to the task with the given id. The mark and the
+        task's counters are written by the same UPDATE. With
+        pomodoro_id the mark is only added while that pomodoro is
+        running, and None is returned if it isn't.
+        """
+        time = time or datetime.datetime.now()
+        if not append_marks(task_id, [(time, type)], pomodoro_id):
+            return None
+        marks_added.send(sender=Mark, marks=[(task_id, time, type)])
+        return Mark(task_id, time.replace(microsecond=0), type)
+
+    def bulk_add(self, marks):
+        """
+        Adds many marks at once from a list of (task_id, time, type)
+        tuples, with one UPDATE per task, and sends marks_added for
+        everything that keeps derived data.
+        """
+        if not marks:
+            return
+        marks_by_task = {}
+        for task_id, mark_time, type in sorted(marks, key=lambda mark: mark[1]):
+            marks_by_task.setdefault(task_id, []).append((mark_time, type))
+        for task_id, task_marks in marks_by_task.items():
+            append_marks(task_id, task_marks)
+        marks_added.send(sender=Mark, marks=marks)
 
-class Mark(models.Model):
+    @transaction.commit_on_success
+    def remove(self, task_id, time, type):
+        """
+        Removes the last of the task's marks of the given type and time.
+        The whole log is rewritten, which only removing needs.
+        """
+        try:
+            task = Task.objects.get(id=task_id)
+        except Task.DoesNotExist:
+            return
+        marks = decode_mark_log(task.mark_log)
+        for i in range(len(marks) - 1, -1, -1):
+            if marks[i] == (time, type):
+                del marks[i]
+                break
+        else:
+            return
+        task.mark_log, task.mark_log_time = encode_mark_log(marks)
+        Task.objects.filter(id=task_id).update(mark_log=task.mark_log, mark_log_time=task.mark_log_time)
+        task.refresh_counters()
+        marks_removed.send(sender=Mark, marks=[(task_id, time, type)])
+
+class Mark(object):
     """
+    One glyph on a task's line of the task sheet - an X for a
+    completed pomodoro or a ' or - for an interruption.
+
+    Marks aren't rows of their own any more but entries in their
+    task's mark_log. Mark keeps the parts of the old model the views,
+    templates and forms use.
     """
-    task = models.ForeignKey(Task, related_name='marks')
-    time = models.DateTimeField(auto_now_add=True)
-    type = models.CharField(max_length=50, choices=MARK_TYPE_CHOICES)
+    objects = MarkManager()
+
+    def __init__(self, task_id, time, type, task=None):
+        self.task_id = task_id
+        self.time = time
+        self.type = type
+        if task is not None:
+            self._task_cache = task
+
+    def _get_task(self):
+        if not hasattr(self, '_task_cache'):
+            self._task_cache = Task.objects.get(id=self.task_id)
+        return self._task_cache
+    task = property(_get_task)
+
+    def get_type_display(self):
+        return MARK_GLYPHS.get(self.type, self.type)
 
     def __unicode__(self):
         return self.get_type_display()
 
+    def delete(self):
+        Mark.objects.remove(self.task_id, self.time, self.type)
 
 
 class PomodoroManager(models.Manager):
     
-    def get_current(self):
+    def get_current(self, owner):
         """
-        Returns the currently active pomodoro.
+        Returns the owner's currently active pomodoro.
         """
-        qs = self.get_query_set()
-        ongoing_pomodoros = qs.filter(completed__isnull=True)
-        # this intentionally raises an Exception when more than
-        # one pomodoro is ongoing. This should theoretically never happen.
-        return ongoing_pomodoros.count() and ongoing_pomodoros.get() or None
+        # (owner, is_ongoing) is unique so the database guarantees
+        # there is at most one ongoing pomodoro per owner
+        try:
+            return self.get_query_set().select_related('task').get(owner=owner, is_ongoing=True)
+        except self.model.DoesNotExist:
+            return None
+
+    def get_next_deadlines(self):
+        """
+        Returns (deadline, id) for every running pomodoro.
+        """
+        return [(deadline, id) for id, deadline in
+                self.get_query_set().filter(is_ongoing=True).values_list('id', 'deadline')]
+
+    @transaction.commit_on_success
+    def expire(self, now=None):
+        """
+        Completes every running pomodoro whose deadline has passed,
+        as of its deadline. The pomodoros are closed with one UPDATE
+        that only touches rows still running, and their X marks are
+        inserted in bulk. Returns the number completed.
+        """
+        now = now or datetime.datetime.now()
+        expired = list(self.get_query_set().filter(
+            is_ongoing=True, deadline__lte=now).values_list('id', 'task', 'deadline', 'owner'))
+        if not expired:
+            return 0
+        updated = self.get_query_set().filter(
+                id__in=[row[0] for row in expired],
+                is_ongoing=True,
+                ).update(completed=F('deadline'), is_ongoing=None, updated=now)
+        if updated != len(expired):
+            # some were completed by hand in the meantime - only
+            # the ones completed at their deadline are ours
+            expired = [(id, task_id, deadline, owner_id) for id, task_id, deadline, owner_id in expired
+                    if self.get_query_set().filter(id=id, completed=deadline).count()]
+        Mark.objects.bulk_add([(task_id, deadline, 'pomodoro') for id, task_id, deadline, owner_id in expired])
+        for owner_id in set([row[3] for row in expired]):
+            clear_current_state(owner_id)
+        return len(expired)
 
 
 class Pomodoro(models.Model):
@@ -100,11 +500,32 @@ class Pomodoro(models.Model):
     time with a flag for whether the pomodoro was cancelled
     mid way through.
     """
+    # always the task's owner - see Task.owner
+    owner = models.ForeignKey(User, related_name='pomodoros', editable=False)
     task = models.ForeignKey(Task, related_name='pomodoros')
-    completed = models.DateTimeField(null=True, blank=True)
+    start = models.DateTimeField(default=datetime.datetime.now)
+    # when the pomodoro runs out - see the run_scheduler command
+    deadline = models.DateTimeField(null=True, blank=True, db_index=True)
+    completed = models.DateTimeField(null=True, blank=True, db_index=True)
+    # True while the pomodoro is running and NULL afterwards - see
+    # TaskSheet.is_open. (is_ongoing, deadline) is indexed in
+    # sql/pomodoro.sql
+    is_ongoing = models.NullBooleanField(default=True, editable=False)
+    updated = models.DateTimeField(auto_now=True)
 
     objects = PomodoroManager()
 
+    class Meta:
+        unique_together = (('owner', 'is_ongoing'),)
+
+    def save(self, *args, **kwargs):
+        if self.owner_id is None:
+            self.owner_id = self.task.owner_id
+        self.is_ongoing = self.completed is None or None
+        if self.deadline is None:
+            self.deadline = self.start + datetime.timedelta(minutes=POMODORO_LENGTH)
+        super(Pomodoro, self).save(*args, **kwargs)
+
     def __unicode__(self):
         base = 'X for %s' % self.task
         if self.completed:
@@ -127,10 +548,416 @@ class Reflection(models.Model):
         return 'Reflection for %s' % self.task_sheet
 
 
+MARK_RUN_RE = re.compile(r'(\d+)(\D)')
+
+def encode_marks(mark_string):
+    """
+    Run-length encodes a mark string, so "XXX''-" becomes "3X2'1-".
+    """
+    return ''.join(['%d%s' % (len(list(run)), glyph) for glyph, run in itertools.groupby(mark_string)])
+
+def decode_marks(encoded):
+    return ''.join([glyph * int(count) for count, glyph in MARK_RUN_RE.findall(encoded)])
+
+ARCHIVE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# the columns of each task in ArchivedTaskSheet.data
+ARCHIVED_TASK_FIELDS = ('id', 'name', 'estimate', 'completed', 'pomodoro_count',
+        'internal_count', 'external_count', 'mark_string')
+
+def format_archive_time(value):
+    return value is not None and value.strftime(ARCHIVE_TIME_FORMAT) or None
+
+def parse_archive_time(value):
+    return value is not None and datetime.datetime.strptime(value, ARCHIVE_TIME_FORMAT) or None
+
+class ArchivedTaskSheet(models.Model):
+    """
+    A closed task sheet folded into one row by the archive_task_sheets
+    command - see pomodoro.archive. The tasks, with their counters and
+    marks, and the reflections are kept in data; the times of the
+    individual marks and pomodoros are not.
+    """
+    # the id the task sheet had, so its URLs keep working
+    id = models.IntegerField(primary_key=True)
+    # (owner, date, id) is indexed in sql/archivedtasksheet.sql
+    owner = models.ForeignKey(User, related_name='archived_task_sheets')
+    date = models.DateTimeField()
+    location = models.CharField(max_length=50)
+    closed = models.DateTimeField()
+    archived = models.DateTimeField(auto_now_add=True)
+    task_count = models.PositiveIntegerField(default=0)
+    pomodoros_done = models.PositiveIntegerField(default=0)
+    # zlib compressed JSON, base64 encoded - see pack
+    data = models.TextField()
+
+    def __unicode__(self):
+        return '%s - %s' % (self.location, self.date.strftime('%Y-%m-%d'))
+
+    def pack(self, tasks, reflections):
+        """
+        Stores a sheet's tasks and reflections in data.
+        """
+        self.task_count = len(tasks)
+        self.pomodoros_done = sum([task.pomodoro_count for task in tasks])
+        data = {
+            'tasks': [[task.id, task.name, task.estimate, format_archive_time(task.completed),
+                task.pomodoro_count, task.internal_count, task.external_count,
+                encode_marks(task.mark_string)] for task in tasks],
+            'reflections': [[reflection.id, reflection.content] for reflection in reflections],
+            }
+        self.data = base64.b64encode(zlib.compress(simplejson.dumps(data, separators=(',', ':'))))
+
+    def unpack(self):
+        """
+        The tasks and reflections stored by pack, as unsaved Task and
+        Reflection instances.
+        """
+        data = simplejson.loads(zlib.decompress(base64.b64decode(self.data)))
+        tasks = []
+        for values in data['tasks']:
+            fields = dict(zip(ARCHIVED_TASK_FIELDS, values))
+            fields['completed'] = parse_archive_time(fields['completed'])
+            fields['mark_string'] = decode_marks(fields['mark_string'])
+            tasks.append(Task(task_sheet_id=self.id, owner_id=self.owner_id, **fields))
+        reflections = [Reflection(id=id, task_sheet_id=self.id, content=content)
+                for id, content in data['reflections']]
+        return tasks, reflections
+
+    def to_graph(self):
+        """
+        An unsaved TaskSheet laid out like TaskSheetManager.get_graph
+        leaves one, so archived sheets render like any other. The
+        mark and pomodoro lists are empty.
+        """
+        task_sheet = TaskSheet(id=self.id, owner_id=self.owner_id, date=self.date,
+                location=self.location, closed=self.closed, is_open=None)
+        task_sheet.archived = self.archived
+        task_sheet.task_list, task_sheet.reflection_list = self.unpack()
+        for task in task_sheet.task_list:
+            task._task_sheet_cache = task_sheet
+            task.mark_list = []
+            task.pomodoro_list = []
+        for reflection in task_sheet.reflection_list:
+            reflection._task_sheet_cache = task_sheet
+        return task_sheet
+
+
+# Version counters live in the cache so they are shared between
+# processes. A counter that is missing starts from the clock, so a
+# version that fell out of the cache is never handed out again.
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, VERSION_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(key)
+
+# Bumped whenever one of a sheet's tasks, marks or pomodoros changes.
+# The task table fragment in task_sheet_detail.html is cached under
+# it, so old fragments are simply never asked for again.
+TASK_SHEET_VERSION_CACHE_KEY = 'pomodoro:task_sheet_version:%d'
+
+def get_task_sheet_version(task_sheet_id):
+    return get_version(TASK_SHEET_VERSION_CACHE_KEY % task_sheet_id)
+
+def bump_task_sheet_version(task_sheet_id):
+    bump_version(TASK_SHEET_VERSION_CACHE_KEY % task_sheet_id)
+
+# Bumped whenever any of an owner's task sheets or their tasks change,
+# for the sheet list and the task counts shown on it.
+TASK_SHEETS_VERSION_CACHE_KEY = 'pomodoro:task_sheets_version:%d'
+
+def get_task_sheets_version(owner_id):
+    return get_version(TASK_SHEETS_VERSION_CACHE_KEY % owner_id)
+
+def bump_task_sheets_version(owner_id):
+    bump_version(TASK_SHEETS_VERSION_CACHE_KEY % owner_id)
+    cache.set(TASK_SHEETS_CHANGED_CACHE_KEY % owner_id, time.time(), VERSION_TIMEOUT)
+
+# When the owner's task sheets last changed, so the sheet list can be
+# read from a replica taken since. Missing counts as now, like a
+# missing version.
+TASK_SHEETS_CHANGED_CACHE_KEY = 'pomodoro:task_sheets_changed:%d'
+
+def get_task_sheets_changed(owner_id):
+    key = TASK_SHEETS_CHANGED_CACHE_KEY % owner_id
+    changed = cache.get(key)
+    if changed is None:
+        changed = time.time()
+        if not cache.add(key, changed, VERSION_TIMEOUT):
+            changed = cache.get(key, changed)
+    return changed
+
+
+CURRENT_STATE_CACHE_KEY = 'pomodoro:current_state:%d'
+
+class CurrentState(object):
+    """
+    The ids of the open task sheet and the running pomodoro (and
+    its task and the task's name), when the pomodoro started and runs out, and how many
+    pomodoros are done on the sheet. Kept in the cache so the shortcut
+    views can find them without touching the database. Any of the
+    values may be None.
+    """
+    # the sheet of the running pomodoro's task, usually the open one
+    pomodoro_task_sheet_id = None
+
+    def __init__(self, task_sheet_id=None, pomodoro_id=None, task_id=None,
+            start=None, deadline=None, pomodoros_done=None, task_name=None,
+            pomodoro_task_sheet_id=None):
+        self.task_sheet_id = task_sheet_id
+        self.pomodoro_id = pomodoro_id
+        self.task_id = task_id
+        self.task_name = task_name
+        self.start = start
+        self.deadline = deadline
+        self.pomodoros_done = pomodoros_done
+        self.pomodoro_task_sheet_id = pomodoro_task_sheet_id
+
+    @classmethod
+    def load(cls, owner_id):
+        state = cls()
+        task_sheet_ids = TaskSheet.objects.filter(owner=owner_id, is_open=True).values_list('id', flat=True)
+        if task_sheet_ids:
+            state.task_sheet_id = task_sheet_ids[0]
+            state.pomodoros_done = Pomodoro.objects.filter(
+                    task__task_sheet=state.task_sheet_id, completed__isnull=False).count()
+        pomodoros = Pomodoro.objects.filter(owner=owner_id, is_ongoing=True).values_list(
+                'id', 'task', 'task__name', 'start', 'deadline', 'task__task_sheet')
+        if pomodoros:
+            (state.pomodoro_id, state.task_id, state.task_name,
+                    state.start, state.deadline, state.pomodoro_task_sheet_id) = pomodoros[0]
+        return state
+
+    def get_break_length(self):
+        """
+        The break due now, in minutes, or None while a pomodoro
+        is running or before the first one of the sheet.
+        """
+        if self.pomodoro_id is not None or not self.pomodoros_done:
+            return None
+        return get_break_length(self.pomodoros_done)
+
+def get_current_state(owner_id):
+    """
+    Returns the owner's CurrentState, reading it from the database
+    only when the cached copy has been invalidated or its pomodoro
+    has run out, which the scheduler may have seen to.
+    """
+    state = cache.get(CURRENT_STATE_CACHE_KEY % owner_id)
+    if state is None or (state.deadline is not None and state.deadline <= datetime.datetime.now()):
+        state = CurrentState.load(owner_id)
+        cache.set(CURRENT_STATE_CACHE_KEY % owner_id, state)
+    return state
+
+def clear_current_state(owner_id):
+    cache.delete(CURRENT_STATE_CACHE_KEY % owner_id)
+    bump_state_version(owner_id)
+
+def set_current_state(owner_id, state):
+    """
+    Caches a CurrentState worked out without reading it back - see
+    pomodoro.transitions.
+    """
+    cache.set(CURRENT_STATE_CACHE_KEY % owner_id, state)
+    bump_state_version(owner_id)
+
+
+# The state version changes whenever an owner's current state or the
+# marks on one of their tasks do, so clients can wait for a change
+# instead of polling. The condition wakes waiters in this process
+# straight away. An owner_id of None is the version for everybody,
+# which changes along with each owner's - that is what the scheduler
+# waits on.
+STATE_VERSION_CACHE_KEY = 'pomodoro:state_version:%d'
+ALL_STATE_VERSION_CACHE_KEY = 'pomodoro:state_version'
+state_version_changed = threading.Condition()
+
+def get_state_version_key(owner_id):
+    if owner_id is None:
+        return ALL_STATE_VERSION_CACHE_KEY
+    return STATE_VERSION_CACHE_KEY % owner_id
+
+def get_state_version(owner_id):
+    return get_version(get_state_version_key(owner_id))
+
+def bump_state_version(owner_id):
+    bump_version(get_state_version_key(owner_id))
+    bump_version(get_state_version_key(None))
+    state_version_changed.acquire()
+    try:
+        state_version_changed.notifyAll()
+    finally:
+        state_version_changed.release()
+
+def wait_for_state_change(owner_id, version, timeout):
+    """
+    Blocks until the owner's state version differs from version or timeout
+    seconds have passed and returns the current version. Waiting
+    costs no queries - changes made in this process wake the waiter
+    at once and the cache is checked every second for the rest.
+    """
+    deadline = time.time() + timeout
+    while True:
+        current = get_state_version(owner_id)
+        remaining = deadline - time.time()
+        if current != version or remaining <= 0:
+            return current
+        state_version_changed.acquire()
+        try:
+            state_version_changed.wait(min(remaining, 1.0))
+        finally:
+            state_version_changed.release()
+
+
 #### SIGNALS ####
 
+# sent by MarkManager with the (task_id, time, type) tuples it added
+# or removed, since marks have no rows to send post_save or
+# post_delete for
+marks_added = Signal(providing_args=['marks'])
+marks_removed = Signal(providing_args=['marks'])
+
 def add_pomodoro_mark(sender, instance, created, **kwargs):
     if instance.completed:
-        Mark.objects.create(task=instance.task, type='pomodoro')
+        Mark.objects.add(instance.task_id, 'pomodoro')
 
 post_save.connect(add_pomodoro_mark, sender=Pomodoro, dispatch_uid='add_pomodoro_mark')
+
+def append_marks(task_id, marks, pomodoro_id=None):
+    """
+    Appends (time, type) marks, in order, to a task's mark log and
+    adds them to its denormalized counters with a single UPDATE, so
+    concurrent marks don't overwrite each other. The first mark is
+    stored as the difference from mark_log_time by the database, as
+    only it knows the time of the mark before. With pomodoro_id the
+    marks are only appended while that pomodoro is running. Returns
+    the number of tasks updated.
+    """
+    (first_time, first_type), rest = marks[0], marks[1:]
+    first = to_seconds(first_time)
+    encoded, last = encode_mark_log(rest, first)
+    types = [type for mark_time, type in marks]
+    qn = connection.ops.quote_name
+    sql = ('UPDATE %s SET %s = %%s, %s = %s + %%s, %s = %s + %%s, %s = %s + %%s, %s = %s || %%s, '
+            '%s = %s || %%s || CAST(%%s - %s AS TEXT) || %%s, %s = %%s WHERE %s = %%s%s') % (
+            qn(Task._meta.db_table),
+            qn('updated'),
+            qn('pomodoro_count'), qn('pomodoro_count'),
+            qn('internal_count'), qn('internal_count'),
+            qn('external_count'), qn('external_count'),
+            qn('mark_string'), qn('mark_string'),
+            qn('mark_log'), qn('mark_log'), qn('mark_log_time'),
+            qn('mark_log_time'),
+            qn('id'),
+            pomodoro_id and ' AND EXISTS (SELECT 1 FROM %s WHERE %s = %%s AND %s = %%s)' % (
+                qn(Pomodoro._meta.db_table), qn('id'), qn('is_ongoing')) or '',
+            )
+    params = [
+        connection.ops.value_to_db_datetime(datetime.datetime.now()),
+        types.count('pomodoro'),
+        types.count('internal'),
+        types.count('external'),
+        ''.join([MARK_GLYPHS.get(type, '') for type in types]),
+        MARK_CODES[first_type], first, encoded,
+        last,
+        task_id,
+        ]
+    if pomodoro_id:
+        params.extend([pomodoro_id, True])
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    transaction.commit_unless_managed()
+    return cursor.rowcount
+
+def recount_task_counters(sender, instance, **kwargs):
+    try:
+        task = Task.objects.get(id=instance.task_id)
+    except Task.DoesNotExist:
+        # the task itself is being deleted
+        return
+    task.refresh_counters()
+
+post_delete.connect(recount_task_counters, sender=Pomodoro, dispatch_uid='recount_task_counters_pomodoro')
+
+def invalidate_current_state(sender, instance, **kwargs):
+    clear_current_state(instance.owner_id)
+
+post_save.connect(invalidate_current_state, sender=TaskSheet, dispatch_uid='invalidate_current_state_task_sheet_save')
+post_delete.connect(invalidate_current_state, sender=TaskSheet, dispatch_uid='invalidate_current_state_task_sheet_delete')
+post_save.connect(invalidate_current_state, sender=Pomodoro, dispatch_uid='invalidate_current_state_pomodoro_save')
+post_delete.connect(invalidate_current_state, sender=Pomodoro, dispatch_uid='invalidate_current_state_pomodoro_delete')
+
+def task_sheet_created(sender, instance, created, **kwargs):
+    # ids can be reused once the newest sheet is deleted, so a new
+    # sheet must never see fragments cached for an old one
+    if created:
+        bump_task_sheet_version(instance.id)
+
+post_save.connect(task_sheet_created, sender=TaskSheet, dispatch_uid='task_sheet_version_task_sheet_save')
+
+def task_sheet_changed(sender, instance, **kwargs):
+    bump_task_sheets_version(instance.owner_id)
+
+post_save.connect(task_sheet_changed, sender=TaskSheet, dispatch_uid='task_sheets_version_task_sheet_save')
+post_delete.connect(task_sheet_changed, sender=TaskSheet, dispatch_uid='task_sheets_version_task_sheet_delete')
+
+def task_changed(sender, instance, **kwargs):
+    # the running pomodoro's task name is part of the current state
+    clear_current_state(instance.owner_id)
+    bump_task_sheet_version(instance.task_sheet_id)
+    bump_task_sheets_version(instance.owner_id)
+
+post_save.connect(task_changed, sender=Task, dispatch_uid='task_changed_save')
+post_delete.connect(task_changed, sender=Task, dispatch_uid='task_changed_delete')
+
+def bump_task_versions(task_ids, state=True):
+    """
+    Bumps the task sheet version of the given tasks' sheets, their
+    owners' task sheets version and, if state is set, their owners'
+    state version.
+    """
+    rows = list(Task.objects.filter(id__in=task_ids).values_list('owner', 'task_sheet').distinct())
+    for owner_id, task_sheet_id in rows:
+        bump_task_sheet_version(task_sheet_id)
+    for owner_id in set([owner_id for owner_id, task_sheet_id in rows]):
+        bump_task_sheets_version(owner_id)
+        if state:
+            bump_state_version(owner_id)
+
+def pomodoro_changed(sender, instance, **kwargs):
+    # invalidate_current_state has already seen to the state version
+    bump_task_versions([instance.task_id], state=False)
+
+post_save.connect(pomodoro_changed, sender=Pomodoro, dispatch_uid='task_sheet_version_pomodoro_save')
+post_delete.connect(pomodoro_changed, sender=Pomodoro, dispatch_uid='task_sheet_version_pomodoro_delete')
+
+def marks_changed(sender, marks, **kwargs):
+    bump_task_versions(set([task_id for task_id, mark_time, type in marks]))
+
+marks_added.connect(marks_changed, sender=Mark, dispatch_uid='state_version_marks_added')
+marks_removed.connect(marks_changed, sender=Mark, dispatch_uid='state_version_marks_removed')
+
+def index_for_search(sender, instance, **kwargs):
+    from pomodoro import search
+    search.index(instance)
+
+def unindex_for_search(sender, instance, **kwargs):
+    from pomodoro import search
+    search.unindex(instance)
+
+post_save.connect(index_for_search, sender=Task, dispatch_uid='index_for_search_task')
+post_save.connect(index_for_search, sender=InboxItem, dispatch_uid='index_for_search_inbox_item')
+post_save.connect(index_for_search, sender=Reflection, dispatch_uid='index_for_search_reflection')
+post_delete.connect(unindex_for_search, sender=Task, dispatch_uid='unindex_for_search_task')
+post_delete.connect(unindex_for_search, sender=InboxItem, dispatch_uid='unindex_for_search_inbox_item')
+post_delete.connect(unindex_for_search, sender=Reflection, dispatch_uid='unindex_for_search_reflection')
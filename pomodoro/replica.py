@@ -0,0 +1,205 @@
+"""
+A read-only snapshot of the database for the heavy reads.
+
+snapshot() copies the SQLite database into a new file and renames it
+over the replica, so readers never see a half written copy. The copy
+is made a batch of pages at a time with SQLite's online backup API
+where the sqlite3 module has it, or otherwise by copying the file the
+same way - see copy_pages. Either way the database is only locked for
+a step at a time. Run it on a schedule with the snapshot_database
+command.
+
+route() points a queryset at the replica, as long as the replica is
+no older than REPLICA_MAX_AGE seconds, or leaves it on the database
+when it isn't. Stats, exports and the admin's change lists read
+through it, so long reports take no locks on the database the
+pomodoro views write to. The task sheet list only reads from a replica
+taken since the owner last changed their sheets, as its ETag promises
+the latest list. Saves and deletes always go to the database,
+since model instances don't remember where they were read from.
+"""
+
+import os
+import stat
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import backend, connection
+
+# None puts the replica next to the database file
+REPLICA_NAME = getattr(settings, 'POMODORO_REPLICA_NAME', None)
+REPLICA_MAX_AGE = getattr(settings, 'POMODORO_REPLICA_MAX_AGE', 5 * 60)
+
+# backup API pages per step and seconds between steps
+BACKUP_PAGES = 1024
+BACKUP_SLEEP = 0.01
+# where the file change counter is in the database header
+CHANGE_COUNTER = (24, 4)
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+# how long after a change is noted it can take to be committed
+COMMIT_GRACE = 1
+
+replicas = {}
+
+def get_replica_name():
+    """
+    The replica's file, or None when there can't be one.
+    """
+    if settings.DATABASE_ENGINE != 'sqlite3':
+        return None
+    if REPLICA_NAME:
+        return REPLICA_NAME
+    name = connection.settings_dict['DATABASE_NAME']
+    if name == ':memory:':
+        return None
+    base, ext = os.path.splitext(name)
+    return '%s.replica%s' % (base, ext)
+
+def get_replica():
+    """
+    A connection to the replica, or None if there is no replica or it
+    is older than REPLICA_MAX_AGE. Connections are per thread, like
+    Django's, and reopened when a newer snapshot has been moved in.
+    """
+    name = get_replica_name()
+    if name is None:
+        return None
+    try:
+        taken = os.stat(name).st_mtime
+    except OSError:
+        return None
+    if time.time() - taken > REPLICA_MAX_AGE:
+        return None
+    replica = replicas.get(name)
+    if replica is None:
+        settings_dict = dict(connection.settings_dict)
+        settings_dict['DATABASE_NAME'] = name
+        replica = replicas[name] = backend.DatabaseWrapper(settings_dict)
+    if getattr(replica, 'taken', None) != taken:
+        # still open on the file the snapshot replaced
+        replica.close()
+        replica.taken = taken
+    return replica
+
+def get_reader(since=None):
+    """
+    The replica if there is a fresh one, otherwise the database. With
+    since, a time.time(), the replica also has to have been taken
+    COMMIT_GRACE seconds after it, so it has what was written then.
+    """
+    replica = get_replica()
+    if replica is None:
+        return connection
+    if since is not None and replica.taken < since + COMMIT_GRACE:
+        return connection
+    return replica
+
+def route(queryset, reader=None):
+    """
+    queryset reading from reader, by default get_reader(). Pass the
+    same reader to querysets that have to agree with each other. Only
+    for reads.
+    """
+    if reader is None:
+        reader = get_reader()
+    if reader is queryset.query.connection:
+        return queryset
+    queryset = queryset._clone()
+    queryset.query.connection = reader
+    return queryset
+
+def copy_pages(source, source_name, target_name):
+    """
+    The backup API's stepped copy, for sqlite3 modules without it.
+    BACKUP_PAGES pages of the file are copied per step under a read
+    lock, and the lock is let go between steps so writers can commit.
+    Every commit bumps the file change counter in the database header,
+    so when it has moved since the last step the copy starts over, as
+    the backup API does.
+    """
+    page_size = source.execute('PRAGMA page_size').fetchone()[0]
+    step = page_size * BACKUP_PAGES
+    offset, length = CHANGE_COUNTER
+    counter = None
+    copied = 0
+    source_file = open(source_name, 'rb')
+    try:
+        target = open(target_name, 'wb')
+        try:
+            while True:
+                source.execute('BEGIN')
+                try:
+                    # takes the read lock
+                    source.execute('SELECT COUNT(*) FROM sqlite_master').fetchall()
+                    source_file.seek(offset)
+                    changed = source_file.read(length)
+                    if changed != counter:
+                        counter, copied = changed, 0
+                        target.seek(0)
+                        target.truncate()
+                    source_file.seek(copied)
+                    pages = source_file.read(step)
+                finally:
+                    source.execute('ROLLBACK')
+                target.write(pages)
+                copied += len(pages)
+                if len(pages) < step:
+                    return
+                time.sleep(BACKUP_SLEEP)
+        finally:
+            target.close()
+    finally:
+        source_file.close()
+
+def copy_database(target_name):
+    from django.db.backends.sqlite3.base import Database
+    source_name = connection.settings_dict['DATABASE_NAME']
+    if source_name == ':memory:':
+        # only this connection can see an in-memory database. VACUUM
+        # commits whatever the connection has open first.
+        connection.cursor().execute('VACUUM INTO %s', [target_name])
+        return
+    source = Database.connect(source_name, isolation_level=None, timeout=30)
+    try:
+        if hasattr(source, 'backup'):
+            target = Database.connect(target_name)
+            try:
+                source.backup(target, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP)
+            finally:
+                target.close()
+        else:
+            copy_pages(source, source_name, target_name)
+    finally:
+        source.close()
+
+def snapshot():
+    """
+    Copies the database over the replica and returns how many seconds
+    it took. The replica's modification time is set to when the copy
+    began, which is how old its data can be.
+    """
+    name = get_replica_name()
+    if name is None:
+        raise ValueError('Only a SQLite database file, or one with POMODORO_REPLICA_NAME set, '
+                'can have a replica.')
+    started = time.time()
+    temporary = '%s.%d.tmp' % (name, os.getpid())
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    try:
+        copy_database(temporary)
+        os.chmod(temporary, READ_ONLY)
+        os.utime(temporary, (started, started))
+        os.rename(temporary, name)
+    finally:
+        # only left behind if the copy failed
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return time.time() - started
+
+def close_replicas(sender, **kwargs):
+    for replica in replicas.values():
+        replica.close()
+
+request_finished.connect(close_replicas, dispatch_uid='close_replicas')
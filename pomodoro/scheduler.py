@@ -0,0 +1,69 @@
+"""
+Completes pomodoros when their time is up so no client has to.
+
+The scheduler keeps the deadlines of the running pomodoros in a
+min-heap and sleeps until the earliest one - or until the pomodoro
+state changes, which may mean a new pomodoro with its own deadline.
+Expired pomodoros are completed by PomodoroManager.expire.
+
+The scheduler runs in a process of its own, so it only wakes the web
+processes' waiters and replaces their cached state through a shared
+cache - see run_scheduler.
+"""
+
+import datetime
+import heapq
+import time
+
+from pomodoro.models import Pomodoro, get_state_version, wait_for_state_change
+
+
+class Scheduler(object):
+    def __init__(self, refresh=30):
+        # the longest to go without rereading the deadlines, in case
+        # a change made in another process was missed
+        self.refresh = refresh
+        self.heap = []
+        self.version = None
+
+    def load(self):
+        # any owner's change may be a new deadline
+        self.version = get_state_version(None)
+        self.heap = [deadline_id for deadline_id in Pomodoro.objects.get_next_deadlines()
+                if deadline_id[0] is not None]
+        heapq.heapify(self.heap)
+
+    def seconds_to_next(self, now):
+        if not self.heap:
+            return self.refresh
+        delta = self.heap[0][0] - now
+        seconds = delta.days * 24 * 60 * 60 + delta.seconds + delta.microseconds / 1e6
+        return max(0, min(seconds, self.refresh))
+
+    def run_once(self, now=None):
+        """
+        Completes whatever is due and returns how many were completed.
+        """
+        now = now or datetime.datetime.now()
+        if not self.heap or self.heap[0][0] > now:
+            return 0
+        while self.heap and self.heap[0][0] <= now:
+            heapq.heappop(self.heap)
+        return Pomodoro.objects.expire(now)
+
+    def run(self, log=None):
+        loaded = None
+        while True:
+            # deadlines only come and go with the state version, so the
+            # heap is only reread when that changes - or every refresh
+            # seconds
+            if (loaded is None or get_state_version(None) != self.version
+                    or time.time() - loaded >= self.refresh):
+                self.load()
+                loaded = time.time()
+            expired = self.run_once()
+            if expired and log is not None:
+                log('Completed %d pomodoro(s).' % expired)
+            wait = self.seconds_to_next(datetime.datetime.now())
+            if wait > 0:
+                wait_for_state_change(None, self.version, wait)
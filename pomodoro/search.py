@@ -0,0 +1,197 @@
+"""
+Full-text search over task names, inbox items and reflections.
+
+Everything searchable lives in one SQLite FTS5 table, created by
+sql/task.sqlite3.sql, with a body column for the text and an owner
+column holding an 'o<owner id>' token so a query only ever matches
+one owner's rows. The rowid encodes what a row is - see get_rowid -
+so rows can be replaced and deleted by rowid without a scan.
+
+The table is kept up to date by signals in pomodoro.models and can
+be rebuilt from scratch with the rebuild_search management command.
+On other databases, or SQLite builds without FTS5, search is off and
+the signals do nothing.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from pomodoro.models import TaskSheet, Task, InboxItem, Reflection
+
+TABLE = 'pomodoro_search'
+CREATE_TABLE = ("CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+        "body, owner, tokenize='unicode61 remove_diacritics 2', prefix='2 3')" % TABLE)
+
+# the position of each model in KINDS is added to id * len(KINDS)
+# to make the rowid
+KINDS = ('task', 'inbox_item', 'reflection')
+MODEL_KINDS = {Task: 'task', InboxItem: 'inbox_item', Reflection: 'reflection'}
+
+# snippet() wraps matches in these and they are swapped for <mark>
+# tags once the rest of the snippet has been escaped
+MATCH_START = u'\x02'
+MATCH_END = u'\x03'
+SNIPPET_TOKENS = 12
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_available = None
+
+def is_available():
+    """
+    True if the search table exists. Only checked once per process.
+    """
+    global _available
+    if _available is None:
+        _available = False
+        if settings.DATABASE_ENGINE == 'sqlite3':
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+            _available = cursor.fetchone() is not None
+    return _available
+
+def get_rowid(kind, id):
+    return id * len(KINDS) + KINDS.index(kind)
+
+def split_rowid(rowid):
+    return KINDS[rowid % len(KINDS)], rowid // len(KINDS)
+
+def owner_token(owner_id):
+    return 'o%d' % owner_id
+
+def get_document(instance):
+    """
+    Returns the (kind, id, owner id, body) to index for a Task,
+    InboxItem or Reflection.
+    """
+    kind = MODEL_KINDS[instance.__class__]
+    if kind == 'reflection':
+        return kind, instance.id, instance.task_sheet.owner_id, instance.content
+    return kind, instance.id, instance.owner_id, instance.name
+
+def index_documents(documents):
+    """
+    Adds or replaces (kind, id, owner id, body) documents.
+    """
+    if not documents or not is_available():
+        return
+    cursor = connection.cursor()
+    rowids = [(get_rowid(kind, id),) for kind, id, owner_id, body in documents]
+    cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % TABLE, rowids)
+    cursor.executemany('INSERT INTO %s (rowid, body, owner) VALUES (%%s, %%s, %%s)' % TABLE,
+            [(get_rowid(kind, id), body, owner_token(owner_id))
+                for kind, id, owner_id, body in documents])
+    transaction.commit_unless_managed()
+
+def index(instance):
+    index_documents([get_document(instance)])
+
+def unindex_documents(documents):
+    """
+    Removes (kind, id) documents.
+    """
+    if not documents or not is_available():
+        return
+    cursor = connection.cursor()
+    cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % TABLE,
+            [(get_rowid(kind, id),) for kind, id in documents])
+    transaction.commit_unless_managed()
+
+def unindex(instance):
+    unindex_documents([(MODEL_KINDS[instance.__class__], instance.id)])
+
+def rebuild():
+    """
+    Recreates the search table from the Task, InboxItem and Reflection
+    tables and returns the number of rows indexed.
+    """
+    global _available
+    if settings.DATABASE_ENGINE != 'sqlite3':
+        return 0
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute('DROP TABLE IF EXISTS %s' % TABLE)
+    cursor.execute(CREATE_TABLE)
+    _available = True
+    insert = 'INSERT INTO %s (rowid, body, owner) ' % TABLE
+    for model, column in ((Task, 'name'), (InboxItem, 'name')):
+        table = qn(model._meta.db_table)
+        cursor.execute(insert + "SELECT %s * %d + %d, %s, 'o' || %s FROM %s" % (
+            qn('id'), len(KINDS), KINDS.index(MODEL_KINDS[model]), qn(column), qn('owner_id'), table))
+    # reflections get their owner from the task sheet
+    reflection, task_sheet = qn(Reflection._meta.db_table), qn(TaskSheet._meta.db_table)
+    cursor.execute(insert + "SELECT %s.%s * %d + %d, %s.%s, 'o' || %s.%s FROM %s INNER JOIN %s ON %s.%s = %s.%s" % (
+        reflection, qn('id'), len(KINDS), KINDS.index('reflection'), reflection, qn('content'),
+        task_sheet, qn('owner_id'), reflection, task_sheet,
+        task_sheet, qn('id'), reflection, qn('task_sheet_id')))
+    cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (TABLE, TABLE))
+    transaction.commit_unless_managed()
+    cursor.execute('SELECT COUNT(*) FROM %s' % TABLE)
+    return cursor.fetchone()[0]
+
+def parse_query(query, as_you_type=False):
+    """
+    Turns free text into an FTS5 query that matches rows containing
+    every word and returns it with whether it ends in a prefix. With
+    as_you_type the last word is a prefix unless the text ends in a
+    space, so results show up while typing. Anything that isn't a word
+    is dropped, so user input can't produce an FTS5 syntax error.
+    Returns (None, False) if no words are left.
+    """
+    query = query or ''
+    words = WORD_RE.findall(query)
+    if not words:
+        return None, False
+    terms = [u'"%s"' % word for word in words]
+    prefix = as_you_type and not query[-1].isspace()
+    if prefix:
+        terms[-1] += u'*'
+    return u' '.join(terms), prefix
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+def search(owner_id, query, count=20, as_you_type=False):
+    """
+    Returns up to count of the owner's matches for query, best first,
+    as dicts with the kind, id, the id of the task sheet (for tasks and
+    reflections) and a highlighted snippet. as_you_type is for queries
+    sent on each keystroke - see parse_query - and gives the newest
+    matches first while the last word is a prefix.
+    """
+    match, prefix = parse_query(query, as_you_type)
+    if match is None or not is_available():
+        return []
+    if prefix:
+        # ranking a prefix means scoring every row with any word that
+        # starts with it - tens of milliseconds for a short, common
+        # prefix at a million rows - while the newest matches come
+        # straight off the index
+        order_by = 'rowid DESC'
+    else:
+        # the owner column is weighted out of the ranking
+        order_by = 'bm25(%s, 1.0, 0.0)' % TABLE
+    cursor = connection.cursor()
+    cursor.execute(
+            'SELECT rowid, snippet(%s, 0, %%s, %%s, %%s, %d) FROM %s '
+            'WHERE %s MATCH %%s ORDER BY %s LIMIT %d' % (
+                TABLE, SNIPPET_TOKENS, TABLE, TABLE, order_by, count),
+            [MATCH_START, MATCH_END, u'\u2026', u'owner : %s AND body : (%s)' % (owner_token(owner_id), match)])
+    results = []
+    for rowid, snippet in cursor.fetchall():
+        kind, id = split_rowid(rowid)
+        results.append({'kind': kind, 'id': id, 'task_sheet_id': None, 'snippet': highlight(snippet)})
+
+    # tasks and reflections are shown on their task sheet
+    for model, kind in ((Task, 'task'), (Reflection, 'reflection')):
+        ids = [result['id'] for result in results if result['kind'] == kind]
+        if ids:
+            task_sheet_ids = dict(model.objects.filter(id__in=ids).values_list('id', 'task_sheet'))
+            for result in results:
+                if result['kind'] == kind:
+                    result['task_sheet_id'] = task_sheet_ids.get(result['id'])
+    return results
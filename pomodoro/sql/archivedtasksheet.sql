@@ -0,0 +1,3 @@
+-- an owner's archived task sheets newest first, merged into the task sheet list
+CREATE INDEX pomodoro_archivedtasksheet_owner_id_date_id ON pomodoro_archivedtasksheet (owner_id, date, id);
+CREATE INDEX pomodoro_archivedtasksheet_owner_id_location_date_id ON pomodoro_archivedtasksheet (owner_id, location, date, id);
@@ -0,0 +1,2 @@
+-- an owner's open inbox in created order
+CREATE INDEX pomodoro_inboxitem_owner_id_dealt_with_created_id ON pomodoro_inboxitem (owner_id, dealt_with, created, id);
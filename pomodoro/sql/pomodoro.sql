@@ -0,0 +1,2 @@
+-- the running pomodoros by deadline, for the scheduler
+CREATE INDEX pomodoro_pomodoro_is_ongoing_deadline ON pomodoro_pomodoro (is_ongoing, deadline);
@@ -0,0 +1,2 @@
+-- open/completed tasks on a sheet
+CREATE INDEX pomodoro_task_task_sheet_id_completed ON pomodoro_task (task_sheet_id, completed);
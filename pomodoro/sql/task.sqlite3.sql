@@ -0,0 +1,2 @@
+-- full-text search over tasks, inbox items and reflections - see pomodoro/search.py
+CREATE VIRTUAL TABLE IF NOT EXISTS pomodoro_search USING fts5(body, owner, tokenize='unicode61 remove_diacritics 2', prefix='2 3');
@@ -0,0 +1,3 @@
+-- an owner's task sheets newest first, all of them or at one location
+CREATE INDEX pomodoro_tasksheet_owner_id_date_id ON pomodoro_tasksheet (owner_id, date, id);
+CREATE INDEX pomodoro_tasksheet_owner_id_location_date_id ON pomodoro_tasksheet (owner_id, location, date, id);
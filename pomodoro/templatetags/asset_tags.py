@@ -0,0 +1,15 @@
+from django import template
+
+from pomodoro.assets import asset_url
+
+register = template.Library()
+
+def asset(name):
+    """
+    The fingerprinted URL of a file under MEDIA_ROOT:
+
+        {% asset "pypomo.css" %}
+    """
+    return asset_url(name)
+
+register.simple_tag(asset)
@@ -0,0 +1,47 @@
+"""
+This file demonstrates two different styles of tests (one doctest and one
+unittest). These will both pass when you run "manage.py test".
+
+Replace these with more appropriate tests for your application.
+"""
+
+from django.test import TestCase
+
+class SimpleTest(TestCase):
+    def test_basic_addition(self):
+        """
+        Tests that 1 + 1 always equals 2.
+        """
+        self.failUnlessEqual(1 + 1, 2)
+
+__test__ = {"doctest": """
+Another way to test that 1 + 1 is equal to 2.
+
+>>> 1 + 1 == 2
+True
+"""}
+
+# still importable from pomodoro.tests
+from pomodoro.tests.base import CommittingTestCase, CountQueriesMixin
+
+from pomodoro.tests.counters import *
+from pomodoro.tests.graph import *
+from pomodoro.tests.owner import *
+from pomodoro.tests.query_plans import *
+from pomodoro.tests.inbox import *
+from pomodoro.tests.events import *
+from pomodoro.tests.export import *
+from pomodoro.tests.importer import *
+from pomodoro.tests.benchmarks import *
+from pomodoro.tests.instrumentation import *
+from pomodoro.tests.state import *
+from pomodoro.tests.scheduler import *
+from pomodoro.tests.fragments import *
+from pomodoro.tests.conditional import *
+from pomodoro.tests.task_sheets import *
+from pomodoro.tests.search import *
+from pomodoro.tests.assets import *
+from pomodoro.tests.archive import *
+from pomodoro.tests.marks import *
+from pomodoro.tests.transitions import *
+from pomodoro.tests.replica import *
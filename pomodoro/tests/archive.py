@@ -0,0 +1,105 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro import archive, export
+from pomodoro.models import TaskSheet, Task, Reflection, Pomodoro, Mark, ArchivedTaskSheet
+from pomodoro.models import encode_marks, decode_marks
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.closed = datetime.datetime(2010, 1, 4, 17, 0)
+        self.old = TaskSheet.objects.create(owner=self.user, location='office', closed=self.closed)
+        self.task = Task.objects.create(task_sheet=self.old, name='write', estimate=2,
+                completed=datetime.datetime(2010, 1, 4, 11, 0, 0, 250))
+        Pomodoro.objects.create(task=self.task, completed=datetime.datetime.now())
+        Mark.objects.add(self.task.id, 'internal')
+        Mark.objects.add(self.task.id, 'internal')
+        Task.objects.create(task_sheet=self.old, name='read', estimate=1)
+        self.reflection = Reflection.objects.create(task_sheet=self.old, content='went well')
+        # the newest sheet, task and reflection are never archived
+        self.recent = TaskSheet.objects.create(owner=self.user, location='home', closed=self.closed)
+        Task.objects.create(task_sheet=self.recent, name='plan', estimate=1)
+        Reflection.objects.create(task_sheet=self.recent, content='short day')
+
+    def archive(self):
+        return archive.archive(datetime.datetime(2010, 2, 1))
+
+    def test_marks_run_length(self):
+        self.failUnlessEqual(encode_marks("XXX''-X"), "3X2'1-1X")
+        self.failUnlessEqual(decode_marks("3X2'1-1X"), "XXX''-X")
+        self.failUnlessEqual(encode_marks(''), '')
+
+    def test_archive(self):
+        self.failUnlessEqual(self.archive(), 1)
+        self.failIf(TaskSheet.objects.filter(id=self.old.id).count())
+        self.failIf(Task.objects.filter(task_sheet=self.old.id).count())
+        self.failIf(Pomodoro.objects.filter(task=self.task.id).count())
+        self.failIf(Reflection.objects.filter(task_sheet=self.old.id).count())
+        archived = ArchivedTaskSheet.objects.get(id=self.old.id)
+        self.failUnlessEqual((archived.task_count, archived.pomodoros_done), (2, 1))
+        tasks, reflections = archived.unpack()
+        self.failUnlessEqual([(task.id, task.name, task.estimate, task.completed, task.pomodoro_count,
+            task.internal_count, task.mark_string) for task in tasks[:1]],
+            [(self.task.id, 'write', 2, self.task.completed, 1, 2, "X''")])
+        self.failUnlessEqual([(reflection.id, reflection.content) for reflection in reflections],
+                [(self.reflection.id, 'went well')])
+        # nothing left to do the second time round
+        self.failUnlessEqual(self.archive(), 0)
+
+    def test_chunks(self):
+        older = TaskSheet.objects.create(owner=self.user, location='home', closed=self.closed)
+        Task.objects.create(task_sheet=older, name='file', estimate=1)
+        # an open sheet to take over as the newest
+        Task.objects.create(task_sheet=TaskSheet.objects.create(owner=self.user, location='home'),
+                name='today', estimate=1)
+        old_chunk_size = archive.CHUNK_SIZE
+        archive.CHUNK_SIZE = 1
+        try:
+            self.failUnlessEqual(self.archive(), 2)
+        finally:
+            archive.CHUNK_SIZE = old_chunk_size
+        self.failIf(TaskSheet.objects.filter(id__in=[self.old.id, older.id]).count())
+        self.failIf(Task.objects.filter(task_sheet__in=[self.old.id, older.id]).count())
+        self.failUnlessEqual(ArchivedTaskSheet.objects.count(), 2)
+
+    def test_open_and_recent_sheets_stay(self):
+        TaskSheet.objects.create(owner=self.user, location='home')
+        self.failUnlessEqual(archive.archive(datetime.datetime(2009, 1, 1)), 0)
+        self.archive()
+        self.failUnlessEqual(TaskSheet.objects.filter(owner=self.user).count(), 2)
+
+    def test_detail(self):
+        self.archive()
+        response = self.client.get('/task_sheets/%d/' % self.old.id)
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnless(response.context['archived'])
+        self.assertContains(response, 'write')
+        self.failUnlessEqual(self.client.post('/task_sheets/%d/' % self.old.id).status_code, 405)
+        response = self.client.get('/task_sheets/%d/' % self.old.id, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.failUnlessEqual(response.status_code, 304)
+
+    def test_other_owner(self):
+        self.archive()
+        User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.client.login(username='ann', password='secret')
+        self.failUnlessEqual(self.client.get('/task_sheets/%d/' % self.old.id).status_code, 404)
+
+    def test_list(self):
+        self.archive()
+        task_sheets, after = TaskSheet.objects.get_page(self.user)
+        self.failUnlessEqual([task_sheet.id for task_sheet in task_sheets], [self.recent.id, self.old.id])
+        self.failUnlessEqual((task_sheets[1].task_count, task_sheets[1].pomodoros_done), (2, 1))
+        task_sheets, after = TaskSheet.objects.get_page(self.user, count=1)
+        task_sheets, after = TaskSheet.objects.get_page(self.user, count=1, after=after)
+        self.failUnlessEqual(([task_sheet.id for task_sheet in task_sheets], after), ([self.old.id], None))
+
+    def test_export(self):
+        before = dict([(name, list(export.export_rows(name))) for name in export.ARCHIVED_EXPORTS])
+        self.archive()
+        for name in export.ARCHIVED_EXPORTS:
+            self.failUnlessEqual(sorted(export.export_rows(name, owner=self.user)), sorted(before[name]))
+        self.failUnlessEqual(len(list(export.export_rows('tasks', location='home'))), 1)
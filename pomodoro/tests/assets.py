@@ -0,0 +1,66 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from pomodoro import assets
+
+CSS = 'body { margin: 0; }\n' * 50
+
+class AssetTest(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.target = tempfile.mkdtemp()
+        assets.write(os.path.join(self.source, 'pypomo.css'), CSS)
+        assets.write(os.path.join(self.source, 'img', 'dot.gif'), 'GIF89a')
+        self.manifest = assets.build(self.source, self.target)
+        self.store = assets._store
+        assets._store = assets.AssetStore(self.target)
+
+    def tearDown(self):
+        assets._store = self.store
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.target)
+
+    def test_build(self):
+        self.failUnlessEqual(sorted(self.manifest), ['img/dot.gif', 'pypomo.css'])
+        self.failUnless(self.manifest['pypomo.css'].startswith('pypomo.'))
+        self.failUnlessEqual(assets.read(os.path.join(self.target, self.manifest['pypomo.css'])), CSS)
+        zipped = gzip.open(os.path.join(self.target, self.manifest['pypomo.css'] + '.gz'))
+        self.failUnlessEqual(zipped.read(), CSS)
+        # not worth compressing
+        self.failIf(os.path.exists(os.path.join(self.target, self.manifest['img/dot.gif'] + '.gz')))
+
+    def test_fingerprint_follows_content(self):
+        assets.write(os.path.join(self.source, 'pypomo.css'), CSS + 'p { color: red; }\n')
+        manifest = assets.build(self.source, self.target)
+        self.failIfEqual(manifest['pypomo.css'], self.manifest['pypomo.css'])
+        self.failUnlessEqual(manifest['img/dot.gif'], self.manifest['img/dot.gif'])
+
+    def test_url(self):
+        self.failUnlessEqual(assets.asset_url('pypomo.css'), assets.ASSETS_URL + self.manifest['pypomo.css'])
+        self.failUnlessEqual(assets.asset_url('missing.css'), '/site_media/missing.css')
+
+    def test_accepts_gzip(self):
+        self.failUnless(assets.accepts_gzip('gzip, deflate'))
+        self.failUnless(assets.accepts_gzip('deflate, gzip;q=0.5'))
+        self.failUnless(assets.accepts_gzip('*'))
+        self.failIf(assets.accepts_gzip('gzip;q=0'))
+        self.failIf(assets.accepts_gzip('identity'))
+        self.failIf(assets.accepts_gzip(''))
+
+    def test_serve(self):
+        path = '/assets/%s' % self.manifest['pypomo.css']
+        response = self.client.get(path)
+        self.failUnlessEqual(response.content, CSS)
+        self.failUnlessEqual(response['Content-Type'], 'text/css')
+        self.failUnlessEqual(response['Cache-Control'], 'public, max-age=%d' % assets.MAX_AGE)
+        self.failUnlessEqual(response['Vary'], 'Accept-Encoding')
+        response = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip')
+        self.failUnlessEqual(response['Content-Encoding'], 'gzip')
+        self.failUnlessEqual(response.content, assets.compress(CSS))
+        response = self.client.get('/assets/%s' % self.manifest['img/dot.gif'], HTTP_ACCEPT_ENCODING='gzip')
+        self.failIf(response.has_header('Content-Encoding'))
+        self.failUnlessEqual(self.client.get('/assets/pypomo.css').status_code, 404)
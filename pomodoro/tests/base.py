@@ -0,0 +1,40 @@
+"""
+Test case classes shared by the test modules.
+"""
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+
+from pomodoro import search
+
+class CommittingTestCase(TransactionTestCase):
+    """
+    For code that commits - SQLite also commits before any CREATE, DROP
+    or ALTER - and so can't be tested inside TestCase's transaction.
+    The database is emptied after each test as well as before, since
+    the test runner doesn't keep these until after the TestCases.
+    """
+    def _fixture_teardown(self):
+        call_command('flush', verbosity=0, interactive=False)
+        # flush leaves the search table alone
+        if search.is_available():
+            connection.cursor().execute('DELETE FROM %s' % search.TABLE)
+            transaction.commit_unless_managed()
+
+class CountQueriesMixin(object):
+    """
+    Counts the queries run by a callable. connection.queries is only
+    populated when DEBUG is on, so it is switched on for the call.
+    """
+    def count_queries(self, func, *args, **kwargs):
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            func(*args, **kwargs)
+            return len(connection.queries)
+        finally:
+            settings.DEBUG = old_debug
+            connection.queries = []
@@ -0,0 +1,32 @@
+from pomodoro import benchmarks
+from pomodoro.models import TaskSheet, Task, Pomodoro
+from pomodoro.tests.base import CommittingTestCase
+
+class BenchmarkTest(CommittingTestCase):
+    def test_seed(self):
+        benchmarks.seed(5, 4, 3)
+        self.failUnlessEqual(TaskSheet.objects.count(), 6)
+        self.failUnless(TaskSheet.objects.get_current(benchmarks.get_user()))
+        self.failUnless(Task.objects.exclude(mark_log='').count() > 0)
+
+    def test_get_current(self):
+        results = benchmarks.run_get_current([1, 20], repeat=1, sample=5)
+        self.failUnlessEqual(sorted(results), [1, 20])
+        self.failUnlessEqual(TaskSheet.objects.filter(is_open=True).count(), 20)
+        self.failUnlessEqual(Pomodoro.objects.filter(is_ongoing=True).count(), 20)
+
+    def test_compare(self):
+        baseline = {'1x1x1': {'home': {'time': 0.010, 'queries': 2}}}
+        self.failUnlessEqual(benchmarks.compare(
+            {'1x1x1': {'home': {'time': 0.011, 'queries': 2}}}, baseline, 0.25), [])
+        self.failUnlessEqual(len(benchmarks.compare(
+            {'1x1x1': {'home': {'time': 0.020, 'queries': 3}}}, baseline, 0.25)), 2)
+
+    def test_search(self):
+        results = benchmarks.run_search(200, owners=3, queries=2, repeat=1)
+        self.failUnlessEqual(sorted(results), ['common word', 'prefix', 'two words', 'word', 'word and prefix'])
+
+    def test_marks(self):
+        results = benchmarks.run_marks(400, tasks=5, per_task=8, sheets=3, repeat=1)
+        self.failUnlessEqual(sorted(results), ['log', 'rows'])
+        self.failUnless(results['log']['bytes'] < results['rows']['bytes'])
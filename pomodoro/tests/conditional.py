@@ -0,0 +1,40 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro.models import TaskSheet, Task, Mark
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=2)
+
+    def revalidate(self, path, response):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code
+
+    def test_task_sheet_detail(self):
+        path = '/task_sheets/%d/' % self.task_sheet.id
+        response = self.client.get(path)
+        self.failUnlessEqual(self.revalidate(path, response), 304)
+        Mark.objects.add(self.task.id, 'internal')
+        self.failUnlessEqual(self.revalidate(path, response), 200)
+
+    def test_task_sheets_index(self):
+        path = '/task_sheets/'
+        response = self.client.get(path)
+        self.failUnlessEqual(self.revalidate(path, response), 304)
+        # the list shows task counts
+        Task.objects.create(task_sheet=self.task_sheet, name='plan', estimate=1)
+        self.failUnlessEqual(self.revalidate(path, response), 200)
+        TaskSheet.objects.create(owner=self.user, location='office', closed=datetime.datetime.now())
+        response = self.client.get(path)
+        self.task_sheet.delete()
+        self.failUnlessEqual(self.revalidate(path, response), 200)
+
+    def test_other_owners_sheet(self):
+        User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.client.login(username='ann', password='secret')
+        self.failUnlessEqual(self.client.get('/task_sheets/%d/' % self.task_sheet.id).status_code, 404)
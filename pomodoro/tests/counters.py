@@ -0,0 +1,43 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro.models import TaskSheet, Task, Pomodoro, Mark
+
+class TaskCounterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='write tests', estimate=2)
+
+    def reload(self):
+        return Task.objects.get(id=self.task.id)
+
+    def test_marks_update_counters(self):
+        pomodoro = Pomodoro.objects.create(task=self.task)
+        Mark.objects.add(self.task.id, 'internal')
+        Mark.objects.add(self.task.id, 'external')
+        pomodoro.completed = datetime.datetime.now()
+        pomodoro.save()
+        task = self.reload()
+        self.failUnlessEqual(task.pomodoro_count, 1)
+        self.failUnlessEqual(task.internal_count, 1)
+        self.failUnlessEqual(task.external_count, 1)
+        self.failUnlessEqual(task.mark_string, "'-X")
+
+    def test_refresh_counters_repairs_drift(self):
+        Mark.objects.add(self.task.id, 'internal')
+        Task.objects.filter(id=self.task.id).update(internal_count=7, mark_string='XXX')
+        task = self.reload()
+        task.refresh_counters()
+        task = self.reload()
+        self.failUnlessEqual(task.internal_count, 1)
+        self.failUnlessEqual(task.mark_string, "'")
+
+    def test_deleting_mark_recounts(self):
+        mark = Mark.objects.add(self.task.id, 'external')
+        mark.delete()
+        task = self.reload()
+        self.failUnlessEqual(task.external_count, 0)
+        self.failUnlessEqual(task.mark_string, '')
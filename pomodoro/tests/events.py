@@ -0,0 +1,78 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import simplejson
+
+from pomodoro import events, transitions
+from pomodoro.models import TaskSheet, Task, Pomodoro, get_current_state
+
+class EventsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='train')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='offline work', estimate=2)
+
+    def post(self, events):
+        response = self.client.post('/events/', simplejson.dumps(events), content_type='application/json')
+        self.failUnlessEqual(response.status_code, 200)
+        return [result['status'] for result in simplejson.loads(response.content)['results']]
+
+    def test_replay(self):
+        statuses = self.post([
+            {'type': 'start', 'time': '2010-03-01T09:00:00', 'task_id': self.task.id},
+            {'type': 'internal', 'time': '2010-03-01T09:05:00'},
+            {'type': 'start', 'time': '2010-03-01T09:06:00', 'task_id': self.task.id},
+            {'type': 'external', 'time': '2010-03-01T09:10:00'},
+            {'type': 'complete', 'time': '2010-03-01T09:25:00'},
+            {'type': 'internal', 'time': '2010-03-01T09:26:00'},
+            {'type': 'start', 'time': '2010-03-01T09:30:00', 'task_id': self.task.id},
+            {'type': 'cancel', 'time': '2010-03-01T09:31:00'},
+            {'type': 'bogus', 'time': '2010-03-01T09:32:00'},
+            ])
+        self.failUnlessEqual(statuses, ['ok', 'ok', 'error', 'ok', 'ok', 'error', 'ok', 'ok', 'error'])
+        task = Task.objects.get(id=self.task.id)
+        self.failUnlessEqual(task.mark_string, "'-X")
+        self.failUnlessEqual(task.pomodoro_count, 1)
+        self.failUnlessEqual(len(task.get_marks()), 3)
+        self.failUnlessEqual(Pomodoro.objects.get().completed, datetime.datetime(2010, 3, 1, 9, 25))
+        self.failUnlessEqual(get_current_state(self.user.id).pomodoro_id, None)
+
+    def test_replay_against_running_pomodoro(self):
+        Pomodoro.objects.create(task=self.task)
+        statuses = self.post([
+            {'type': 'start', 'time': '2010-03-01T09:00:00', 'task_id': self.task.id},
+            {'type': 'complete', 'time': '2010-03-01T09:25:00'},
+            ])
+        self.failUnlessEqual(statuses, ['error', 'ok'])
+
+    def test_other_owners_tasks_are_refused(self):
+        User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.client.login(username='ann', password='secret')
+        statuses = self.post([
+            {'type': 'start', 'time': '2010-03-01T09:00:00', 'task_id': self.task.id},
+            ])
+        self.failUnlessEqual(statuses, ['error'])
+        self.failUnlessEqual(Pomodoro.objects.count(), 0)
+
+    def test_stopped_meanwhile(self):
+        # another request completes the pomodoro just before each
+        # event gets to it
+        for name in ('complete_pomodoro', 'delete_pomodoro'):
+            Pomodoro.objects.create(task=self.task)
+            stop = getattr(events, name)
+            def stop_meanwhile(owner_id, pomodoro_id, *args):
+                transitions.complete(owner_id)
+                return stop(owner_id, pomodoro_id, *args)
+            setattr(events, name, stop_meanwhile)
+            try:
+                statuses = self.post([
+                    {'type': name == 'complete_pomodoro' and 'complete' or 'cancel', 'time': '2010-03-01T09:25:00'},
+                    {'type': 'internal', 'time': '2010-03-01T09:26:00'},
+                    ])
+            finally:
+                setattr(events, name, stop)
+            self.failUnlessEqual(statuses, ['conflict', 'error'])
+        task = Task.objects.get(id=self.task.id)
+        self.failUnlessEqual((task.mark_string, task.pomodoro_count), ('XX', 2))
@@ -0,0 +1,47 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import simplejson
+
+from pomodoro import export
+from pomodoro.models import TaskSheet, Task, Mark
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        for location in ('home', 'office'):
+            task_sheet = TaskSheet.objects.create(owner=self.user, location=location, closed=datetime.datetime.now())
+            task = Task.objects.create(task_sheet=task_sheet, name=u'caf\xe9 %s' % location, estimate=1)
+            for i in range(5):
+                Mark.objects.add(task.id, 'internal')
+
+    def test_rows_are_chunked_in_order(self):
+        rows = list(export.export_rows('marks', chunk_size=3))
+        self.failUnlessEqual(len(rows), 10)
+        self.failUnlessEqual([row[0] for row in rows], sorted([row[0] for row in rows]))
+
+    def test_location_filter(self):
+        rows = list(export.export_rows('tasks', location='office'))
+        self.failUnlessEqual([row[2] for row in rows], [u'caf\xe9 office'])
+
+    def test_owner_filter(self):
+        other = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.failUnlessEqual(len(list(export.export_rows('marks', owner=other))), 0)
+        self.failUnlessEqual(len(list(export.export_rows('marks', owner=self.user))), 10)
+
+    def test_csv_view(self):
+        response = self.client.get('/export/tasks.csv')
+        lines = response.content.splitlines()
+        self.failUnlessEqual(lines[0], 'id,task_sheet,name,estimate,completed')
+        self.failUnlessEqual(len(lines), 3)
+
+    def test_jsonl_view(self):
+        response = self.client.get('/export/marks.jsonl', {'location': 'home'})
+        rows = [simplejson.loads(line) for line in response.content.splitlines()]
+        self.failUnlessEqual(len(rows), 5)
+        self.failUnlessEqual(rows[0]['type'], 'internal')
+
+    def test_unknown_export(self):
+        self.failUnlessEqual(self.client.get('/export/users.csv').status_code, 404)
@@ -0,0 +1,61 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from pomodoro.models import TaskSheet, Task, Pomodoro, Mark, get_task_sheet_version
+
+class TaskListCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=2)
+        self.path = '/task_sheets/%d/' % self.task_sheet.id
+
+    def get_tables(self):
+        """
+        Renders the sheet and returns the response along with the
+        pomodoro tables that were queried for it.
+        """
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            response = self.client.get(self.path)
+            sql = ' '.join([query['sql'] for query in connection.queries])
+        finally:
+            settings.DEBUG = old_debug
+            connection.queries = []
+        return response, [model._meta.db_table for model in (Task, Pomodoro)
+                if '"%s"' % model._meta.db_table in sql]
+
+    def test_unchanged_sheet_skips_task_tables(self):
+        self.get_tables()
+        response, tables = self.get_tables()
+        self.failUnlessEqual(tables, [])
+        self.failUnless('focus' in response.content)
+
+    def test_changes_bump_version(self):
+        version = get_task_sheet_version(self.task_sheet.id)
+        pomodoro = Pomodoro.objects.create(task=self.task)
+        self.failIfEqual(get_task_sheet_version(self.task_sheet.id), version)
+        version = get_task_sheet_version(self.task_sheet.id)
+        Mark.objects.add(self.task.id, 'internal')
+        self.failIfEqual(get_task_sheet_version(self.task_sheet.id), version)
+        version = get_task_sheet_version(self.task_sheet.id)
+        pomodoro.delete()
+        self.failIfEqual(get_task_sheet_version(self.task_sheet.id), version)
+
+    def test_marks_show_up(self):
+        self.get_tables()
+        Mark.objects.add(self.task.id, 'internal')
+        response, tables = self.get_tables()
+        self.failUnless(Task._meta.db_table in tables)
+        self.failUnless('&#39;' in response.content)
+        self.task.completed = datetime.datetime.now()
+        self.task.save()
+        response, tables = self.get_tables()
+        self.failUnless('<del>focus</del>' in response.content)
@@ -0,0 +1,46 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro.models import TaskSheet, Task, Pomodoro, Mark, get_current_state
+from pomodoro.tests.base import CountQueriesMixin
+
+class TaskSheetGraphTest(CountQueriesMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+
+    def make_sheet(self, num_tasks):
+        task_sheet = TaskSheet.objects.create(owner=self.user, location='office', closed=datetime.datetime.now())
+        for i in range(num_tasks):
+            task = Task.objects.create(task_sheet=task_sheet, name='task %d' % i, estimate=1)
+            Mark.objects.add(task.id, 'internal')
+            Pomodoro.objects.create(task=task, completed=datetime.datetime.now())
+        return task_sheet
+
+    def test_graph_is_stitched(self):
+        task_sheet = self.make_sheet(2)
+        graph = TaskSheet.objects.get_graph(id=task_sheet.id)
+        self.failUnlessEqual(len(graph.task_list), 2)
+        for task in graph.task_list:
+            self.failUnlessEqual([m.type for m in task.mark_list], ['internal', 'pomodoro'])
+            self.failUnlessEqual(len(task.pomodoro_list), 1)
+
+    def test_query_count_is_constant(self):
+        small = self.make_sheet(1)
+        large = self.make_sheet(500)
+        self.failUnlessEqual(
+                self.count_queries(TaskSheet.objects.get_graph, id=small.id),
+                self.count_queries(TaskSheet.objects.get_graph, id=large.id),
+                )
+
+    def test_detail_view_query_count_is_constant(self):
+        small = self.make_sheet(1)
+        large = self.make_sheet(500)
+        # the first request would load and cache the current state
+        get_current_state(self.user.id)
+        self.failUnlessEqual(
+                self.count_queries(self.client.get, '/task_sheets/%d/' % small.id),
+                self.count_queries(self.client.get, '/task_sheets/%d/' % large.id),
+                )
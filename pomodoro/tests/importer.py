@@ -0,0 +1,63 @@
+import datetime
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from pomodoro import importer
+from pomodoro.models import TaskSheet, Task, Pomodoro, Mark
+from pomodoro.tests.base import CommittingTestCase
+
+CSV = """date,location,task,estimate,marks,completed
+2009-11-02,office,Write report,3,XX'-X,yes
+2009-11-02,office,Email,1,',no
+2009-11-03,home,Read,2,X,
+2009-11-04,home,Bad marks,2,XQ,
+"""
+
+class ImportTest(CommittingTestCase):
+    # the import commits and rolls back its own transactions
+
+    def setUp(self):
+        User.objects.create_user('ben', 'ben@example.com', 'secret')
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        os.write(fd, CSV)
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_parse_row(self):
+        self.failUnlessEqual(
+                importer.parse_row({'date': '2009-11-02', 'location': 'office', 'task': 'x',
+                    'estimate': '2', 'marks': "X'", 'completed': 'yes'}),
+                (datetime.date(2009, 11, 2), 'office', 'x', 2, ['pomodoro', 'internal'], True))
+        self.assertRaises(importer.RowError, importer.parse_row, {'date': 'yesterday'})
+
+    def test_import(self):
+        call_command('import_pomodoros', self.path, owner='ben', verbosity=0)
+        self.failUnlessEqual(TaskSheet.objects.count(), 2)
+        self.failUnlessEqual(Task.objects.count(), 3)
+        self.failUnlessEqual(Pomodoro.objects.filter(completed__isnull=False).count(), 4)
+        self.failUnlessEqual(Mark.objects.count(), 7)
+        task = Task.objects.get(name='Write report')
+        self.failUnlessEqual(task.mark_string, "XX'-X")
+        self.failUnlessEqual(task.pomodoro_count, 3)
+        self.failUnless(task.completed)
+        self.failUnlessEqual(task.task_sheet.date.date(), datetime.date(2009, 11, 2))
+        # the stored counters agree with a recount from the raw rows
+        counters = task.get_counters()
+        task.refresh_counters(save=False)
+        self.failUnlessEqual(task.get_counters(), counters)
+
+    def test_reuses_task_sheets(self):
+        call_command('import_pomodoros', self.path, owner='ben', verbosity=0)
+        call_command('import_pomodoros', self.path, owner='ben', verbosity=0)
+        self.failUnlessEqual(TaskSheet.objects.count(), 2)
+        self.failUnlessEqual(Task.objects.count(), 6)
+
+    def test_dry_run(self):
+        call_command('import_pomodoros', self.path, owner='ben', verbosity=0, dry_run=True)
+        self.failUnlessEqual(Task.objects.count(), 0)
+        self.failUnlessEqual(TaskSheet.objects.count(), 0)
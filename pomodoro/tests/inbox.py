@@ -0,0 +1,52 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import simplejson
+
+from pomodoro.models import InboxItem
+from pomodoro.tests.base import CountQueriesMixin
+
+class InboxPagingTest(CountQueriesMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        created = datetime.datetime(2010, 1, 1)
+        for i in range(45):
+            item = InboxItem.objects.create(owner=self.user, name='item %d' % i)
+            # several items share a timestamp so the id breaks ties
+            InboxItem.objects.filter(id=item.id).update(created=created + datetime.timedelta(minutes=i // 3))
+        InboxItem.objects.filter(name='item 0').update(dealt_with=datetime.datetime.now())
+
+    def test_pages_cover_inbox_once(self):
+        names = []
+        after = None
+        while True:
+            items, after = InboxItem.objects.get_active_page(self.user, after=after, count=20)
+            names.extend([item.name for item in items])
+            if after is None:
+                break
+        self.failUnlessEqual(names, ['item %d' % i for i in range(1, 45)])
+
+    def test_feed_follows_cursor(self):
+        response = self.client.get('/')
+        self.failUnlessEqual(len(response.context['active_inbox_items']), 20)
+        data = simplejson.loads(self.client.get('/inbox_items/feed/', {'after': response.context['next_cursor']}).content)
+        self.failUnlessEqual(data['items'][0]['name'], 'item 21')
+        data = simplejson.loads(self.client.get('/inbox_items/feed/', {'after': data['next']}).content)
+        self.failUnlessEqual(len(data['items']), 4)
+        self.failUnlessEqual(data['next'], None)
+
+    def test_dashboard_cost_is_flat(self):
+        small = self.count_queries(self.client.get, '/')
+        for i in range(200):
+            InboxItem.objects.create(owner=self.user, name='more %d' % i)
+        self.failUnlessEqual(self.count_queries(self.client.get, '/'), small)
+
+    def test_other_owners_items_are_hidden(self):
+        other = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        InboxItem.objects.create(owner=other, name='not yours')
+        items, after = InboxItem.objects.get_active_page(other)
+        self.failUnlessEqual([item.name for item in items], ['not yours'])
+        items, after = InboxItem.objects.get_active_page(self.user, count=100)
+        self.failUnlessEqual(len(items), 44)
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro.instrumentation import Histogram, Registry, registry, get_url_name, escape_label
+
+class HistogramTest(TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0, 1, 3, 7, 50):
+            histogram.observe(value)
+        self.failUnlessEqual(list(histogram.cumulative()), [(1, 2), (5, 3), (10, 4), ('+Inf', 5)])
+        self.failUnlessEqual(histogram.sum, 61)
+        self.failUnlessEqual(histogram.count, 5)
+
+    def test_render(self):
+        metrics = Registry()
+        metrics.observe('home', 0.02, 3, 0.004)
+        text = metrics.render()
+        self.failUnless('# TYPE pypomo_request_seconds histogram' in text)
+        self.failUnless('pypomo_request_queries_bucket{view="home",le="5"} 1' in text)
+        self.failUnless('pypomo_request_db_seconds_count{view="home"} 1' in text)
+
+class MiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+
+    def test_url_names(self):
+        self.failUnlessEqual(get_url_name('/'), 'home')
+        self.failUnlessEqual(get_url_name('/task_sheets/12/tasks/3/'), 'task_detail')
+        self.failUnlessEqual(get_url_name('/nowhere/'), None)
+        self.failUnlessEqual(escape_label('a"b\\d'), 'a\\"b\\\\d')
+
+    def test_requests_are_recorded_by_url(self):
+        self.client.get('/')
+        self.client.get('/task_sheets/')
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.client.get('/metrics/')
+        self.failUnless('pypomo_request_seconds_count{view="home"}' in response.content)
+        self.failUnless('pypomo_request_seconds_count{view="task_sheets_index"}' in response.content)
+        histograms = registry.views['home']
+        self.failUnless(histograms[1].sum > 0)
+
+    def test_metrics_are_for_staff(self):
+        response = self.client.get('/metrics/')
+        self.failIf('pypomo_request_seconds' in response.content)
+        old_public = getattr(settings, 'POMODORO_PUBLIC_METRICS', False)
+        settings.POMODORO_PUBLIC_METRICS = True
+        try:
+            self.client.logout()
+            self.assertContains(self.client.get('/metrics/'), 'pypomo_request_seconds')
+        finally:
+            settings.POMODORO_PUBLIC_METRICS = old_public
@@ -0,0 +1,97 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from pomodoro.management.commands import migrate_marks
+from pomodoro.models import TaskSheet, Task, Mark, encode_mark_log, decode_mark_log
+from pomodoro.tests.base import CommittingTestCase
+
+class MarkLogTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='write', estimate=2)
+        self.start = datetime.datetime(2010, 3, 1, 9, 0)
+
+    def reload(self):
+        return Task.objects.get(id=self.task.id)
+
+    def at(self, minutes):
+        return self.start + datetime.timedelta(minutes=minutes)
+
+    def test_roundtrip(self):
+        marks = [(self.at(0), 'internal'), (self.at(25), 'pomodoro'), (self.at(20), 'external')]
+        mark_log, last = encode_mark_log(marks)
+        self.failUnless(mark_log.startswith('i'))
+        # out of order marks give a negative delta
+        self.failUnless(mark_log.endswith('e-300'))
+        self.failUnlessEqual(decode_mark_log(mark_log), marks)
+        self.failUnlessEqual(decode_mark_log(mark_log)[-1][0], self.at(20))
+        self.failUnlessEqual(decode_mark_log(''), [])
+
+    def test_add_appends(self):
+        Mark.objects.add(self.task.id, 'internal', self.at(0))
+        Mark.objects.add(self.task.id, 'pomodoro', self.at(25))
+        task = self.reload()
+        self.failUnlessEqual(task.mark_log, encode_mark_log([(self.at(0), 'internal'), (self.at(25), 'pomodoro')])[0])
+        self.failUnlessEqual((task.internal_count, task.pomodoro_count, task.mark_string), (1, 1, "'X"))
+        self.failUnlessEqual([(mark.time, mark.type) for mark in task.get_marks()],
+                [(self.at(0), 'internal'), (self.at(25), 'pomodoro')])
+
+    def test_bulk_add_orders_by_time(self):
+        Mark.objects.bulk_add([(self.task.id, self.at(10), 'external'), (self.task.id, self.at(5), 'internal')])
+        task = self.reload()
+        self.failUnlessEqual(task.mark_string, "'-")
+        self.failUnlessEqual([mark.type for mark in task.get_marks()], ['internal', 'external'])
+
+    def test_delete_rewrites_log(self):
+        Mark.objects.add(self.task.id, 'internal', self.at(0))
+        mark = Mark.objects.add(self.task.id, 'external', self.at(5))
+        Mark.objects.add(self.task.id, 'internal', self.at(10))
+        mark.delete()
+        task = self.reload()
+        self.failUnlessEqual([(mark.time, mark.type) for mark in task.get_marks()],
+                [(self.at(0), 'internal'), (self.at(10), 'internal')])
+        self.failUnlessEqual((task.internal_count, task.external_count, task.mark_string), (2, 0, "''"))
+        # appending still follows on from the rewritten log
+        Mark.objects.add(self.task.id, 'pomodoro', self.at(25))
+        self.failUnlessEqual(self.reload().get_marks()[-1].time, self.at(25))
+
+    def test_count(self):
+        self.failUnlessEqual(Mark.objects.count(), 0)
+        Mark.objects.bulk_add([(self.task.id, self.at(0), 'internal'), (self.task.id, self.at(25), 'pomodoro')])
+        self.failUnlessEqual(Mark.objects.count(), 2)
+
+    def test_admin_lists_marks(self):
+        Mark.objects.add(self.task.id, 'internal', self.at(0))
+        Mark.objects.add(self.task.id, 'pomodoro', self.at(25))
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.login(username='admin', password='secret')
+        response = self.client.get('/admin/pomodoro/task/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.assertContains(response, "&#39; 2010-03-01 09:00:00, X 2010-03-01 09:25:00")
+
+class MigrateMarksTest(CommittingTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='write', estimate=2)
+        self.cursor = connection.cursor()
+        self.cursor.execute('CREATE TABLE pomodoro_mark (id integer NOT NULL PRIMARY KEY, '
+                'task_id integer NOT NULL, time datetime NOT NULL, type varchar(50) NOT NULL)')
+
+    def test_migrate(self):
+        start = datetime.datetime(2010, 3, 1, 9, 0)
+        self.cursor.executemany('INSERT INTO pomodoro_mark (task_id, time, type) VALUES (%s, %s, %s)', [
+            (self.task.id, connection.ops.value_to_db_datetime(start + datetime.timedelta(minutes=25)), 'pomodoro'),
+            (self.task.id, connection.ops.value_to_db_datetime(start), 'internal'),
+            ])
+        # a mark added after the upgrade but before the migration
+        Mark.objects.add(self.task.id, 'external', start + datetime.timedelta(hours=1))
+        self.failUnlessEqual(migrate_marks.migrate(batch_size=1), 2)
+        self.failIf('pomodoro_mark' in connection.introspection.table_names())
+        self.failUnlessEqual([mark.type for mark in Task.objects.get(id=self.task.id).get_marks()],
+                ['internal', 'pomodoro', 'external'])
+        self.failUnlessEqual(migrate_marks.migrate(), None)
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro.models import TaskSheet, Task, Pomodoro, get_current_state
+
+class OwnerTest(TestCase):
+    def setUp(self):
+        self.ben = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.ann = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.ben, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=1)
+
+    def test_owners_have_their_own_current(self):
+        other_sheet = TaskSheet.objects.create(owner=self.ann, location='office')
+        other_task = Task.objects.create(task_sheet=other_sheet, name='plan', estimate=1)
+        pomodoro = Pomodoro.objects.create(task=self.task)
+        other_pomodoro = Pomodoro.objects.create(task=other_task)
+        self.failUnlessEqual(other_task.owner_id, self.ann.id)
+        self.failUnlessEqual(other_pomodoro.owner_id, self.ann.id)
+        self.failUnlessEqual(TaskSheet.objects.get_current(self.ben), self.task_sheet)
+        self.failUnlessEqual(TaskSheet.objects.get_current(self.ann), other_sheet)
+        self.failUnlessEqual(Pomodoro.objects.get_current(self.ben), pomodoro)
+        self.failUnlessEqual(Pomodoro.objects.get_current(self.ann), other_pomodoro)
+        self.failUnlessEqual(get_current_state(self.ann.id).pomodoro_id, other_pomodoro.id)
+
+    def test_views_are_scoped_to_the_owner(self):
+        sheet = '/task_sheets/%d/' % self.task_sheet.id
+        self.failUnlessEqual(self.client.get(sheet).status_code, 302)
+        self.client.login(username='ann', password='secret')
+        self.failUnlessEqual(self.client.get(sheet).status_code, 404)
+        self.client.post('%stasks/%d/pomodoros/' % (sheet, self.task.id))
+        self.failUnlessEqual(Pomodoro.objects.count(), 0)
+        self.client.login(username='ben', password='secret')
+        self.failUnlessEqual(self.client.get(sheet).status_code, 200)
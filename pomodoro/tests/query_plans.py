@@ -0,0 +1,136 @@
+"""
+Runs EXPLAIN QUERY PLAN for the queries the managers, transitions and
+views actually send and fails if SQLite would have to scan a whole
+table to answer one.
+"""
+
+import datetime
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+from pomodoro import transitions
+from pomodoro.archive import archive
+from pomodoro.models import TaskSheet, Task, InboxItem, Pomodoro, CurrentState
+from pomodoro.tests.base import CommittingTestCase
+
+# 'SCAN TABLE foo' on older SQLite, 'SCAN foo' on newer. A scan
+# that walks an index ('SCAN foo USING INDEX bar') is allowed.
+TABLE_SCAN_RE = re.compile(r'^SCAN (TABLE )?\w+$')
+
+# statements that have a query plan worth looking at
+PLANNED_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE)\b', re.I)
+
+class RecordingCursorWrapper(object):
+    """
+    Records the sql and params of every statement run through it.
+
+    connection.queries only keeps the sql with the params pasted in
+    unquoted, which can't be run again, so the statements are taken
+    before the backend sees them.
+    """
+    def __init__(self, cursor, queries):
+        self.cursor = cursor
+        self.queries = queries
+
+    def execute(self, sql, params=()):
+        self.queries.append((sql, tuple(params)))
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        param_list = list(param_list)
+        if param_list:
+            self.queries.append((sql, tuple(param_list[0])))
+        return self.cursor.executemany(sql, param_list)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+class QueryPlanTest(CommittingTestCase):
+    # pysqlite commits before an EXPLAIN, as it does before DDL
+
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        old = TaskSheet.objects.create(owner=self.user, location='office',
+                date=datetime.date.today() - datetime.timedelta(days=400))
+        Task.objects.create(task_sheet=old, name='old', estimate=1)
+        TaskSheet.objects.filter(id=old.id).update(is_open=None)
+        archive(datetime.date.today() - datetime.timedelta(days=365))
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=2)
+        self.inbox_item = InboxItem.objects.create(owner=self.user, name='later')
+
+    def capture(self):
+        """
+        Calls the managers, transitions and views that make up the hot
+        paths and returns the (sql, params) of every statement they ran.
+        """
+        queries = []
+        # patched on the class so the instrumentation middleware, which
+        # wraps connection.__class__.cursor per request, records too
+        cursor = connection.__class__.cursor
+        def recording_cursor(self):
+            return RecordingCursorWrapper(cursor(self), queries)
+        connection.__class__.cursor = recording_cursor
+        try:
+            self.run_hot_paths()
+        finally:
+            connection.__class__.cursor = cursor
+        return queries
+
+    def run_hot_paths(self):
+        owner_id = self.user.id
+        today = datetime.date.today()
+        TaskSheet.objects.get_current(self.user)
+        task_sheets, after = TaskSheet.objects.get_page(self.user, count=1)
+        TaskSheet.objects.get_page(self.user, after=after)
+        TaskSheet.objects.get_page(self.user, month=today, location='home')
+        TaskSheet.objects.get_graph(id=self.task_sheet.id)
+        items, after = InboxItem.objects.get_active_page(self.user)
+        InboxItem.objects.get_active_page(self.user, after=(self.inbox_item.created, self.inbox_item.id))
+        CurrentState.load(owner_id)
+        transitions.start(owner_id, self.task)
+        Pomodoro.objects.get_current(self.user)
+        Pomodoro.objects.get_next_deadlines()
+        transitions.interrupt(owner_id, 'internal')
+        transitions.complete(owner_id)
+        transitions.start(owner_id, self.task)
+        transitions.cancel(owner_id)
+        transitions.start(owner_id, self.task)
+        Pomodoro.objects.expire(datetime.datetime.now() + datetime.timedelta(hours=1))
+        self.task.refresh_counters()
+        for url in [reverse('task_sheets_index'),
+                    reverse('task_sheet_detail', args=[self.task_sheet.id]),
+                    reverse('active_sheet'),
+                    reverse('inbox_items_feed'),
+                    reverse('state')]:
+            self.client.get(url)
+
+    def explain(self, sql, params):
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        # the human readable detail is always the last column
+        return [row[-1] for row in cursor.fetchall()]
+
+    def test_no_table_scans(self):
+        if settings.DATABASE_ENGINE != 'sqlite3':
+            return
+        queries = self.capture()
+        self.failUnless(queries)
+        scans = []
+        seen = set()
+        for sql, params in queries:
+            if not PLANNED_RE.match(sql) or sql in seen:
+                continue
+            seen.add(sql)
+            for detail in self.explain(sql, params):
+                if TABLE_SCAN_RE.match(detail):
+                    scans.append('%s\n    %s' % (sql, detail))
+        self.failIf(scans, 'Queries falling back to table scans:\n%s' % '\n'.join(scans))
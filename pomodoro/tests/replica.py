@@ -0,0 +1,103 @@
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from pomodoro import export, replica
+from pomodoro.models import TaskSheet, get_task_sheets_changed
+from pomodoro.tests.base import CommittingTestCase
+
+class ReplicaTest(CommittingTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        TaskSheet.objects.create(owner=self.user, location='home', closed=datetime.datetime.now())
+        # the test database is in memory, so there is no file for the
+        # replica to go next to
+        self.directory = tempfile.mkdtemp()
+        self.old_name = replica.REPLICA_NAME
+        replica.REPLICA_NAME = os.path.join(self.directory, 'replica.sqlite')
+
+    def tearDown(self):
+        replica.close_replicas(None)
+        replica.REPLICA_NAME = self.old_name
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_no_replica(self):
+        qs = TaskSheet.objects.all()
+        self.failUnless(replica.route(qs) is qs)
+        self.failUnless(replica.get_reader() is connection)
+
+    def test_snapshot(self):
+        replica.snapshot()
+        TaskSheet.objects.create(owner=self.user, location='office')
+        # the replica doesn't have what was written since
+        self.failUnlessEqual(replica.route(TaskSheet.objects.all()).count(), 1)
+        self.failUnlessEqual(len(list(export.export_rows('task_sheets', owner=self.user))), 1)
+        self.failUnlessEqual(TaskSheet.objects.count(), 2)
+        replica.snapshot()
+        self.failUnlessEqual(replica.route(TaskSheet.objects.all()).count(), 2)
+        self.failIf(os.path.exists('%s.%d.tmp' % (replica.REPLICA_NAME, os.getpid())))
+
+    def test_stale(self):
+        replica.snapshot()
+        self.failIf(replica.get_replica() is None)
+        old = time.time() - replica.REPLICA_MAX_AGE - 1
+        os.utime(replica.REPLICA_NAME, (old, old))
+        self.failUnless(replica.get_replica() is None)
+        TaskSheet.objects.create(owner=self.user, location='office')
+        self.failUnlessEqual(replica.route(TaskSheet.objects.all()).count(), 2)
+
+    def test_task_sheets_index(self):
+        self.client.login(username='ben', password='secret')
+        # a replica taken before the owner's sheets last changed isn't
+        # read from
+        replica.snapshot()
+        os.utime(replica.REPLICA_NAME, (get_task_sheets_changed(self.user.id) - 10,) * 2)
+        self.failUnless(replica.get_reader(since=get_task_sheets_changed(self.user.id)) is connection)
+        self.failUnlessEqual(len(self.client.get('/task_sheets/').context['task_sheets']), 1)
+        # one taken since is, and doesn't have what was written
+        # behind the signals' back after it
+        replica.snapshot()
+        now = time.time() + replica.COMMIT_GRACE + 1
+        os.utime(replica.REPLICA_NAME, (now, now))
+        TaskSheet.objects.filter(owner=self.user).update(location='office')
+        self.failUnlessEqual([task_sheet.location
+            for task_sheet in self.client.get('/task_sheets/').context['task_sheets']], ['home'])
+
+    def test_copy_pages(self):
+        from django.db.backends.sqlite3.base import Database
+        source_name = os.path.join(self.directory, 'source.sqlite')
+        target_name = os.path.join(self.directory, 'copy.sqlite')
+        writer = Database.connect(source_name)
+        writer.execute('CREATE TABLE notes (body text)')
+        writer.executemany('INSERT INTO notes VALUES (?)', [('x' * 1000,)] * 100)
+        writer.commit()
+        written = []
+        class Clock(object):
+            # a commit between the first two steps, to pages
+            # already copied
+            def sleep(self, seconds):
+                if not written:
+                    writer.execute('DELETE FROM notes WHERE rowid <= 50')
+                    writer.commit()
+                    written.append(True)
+        old_pages, old_time = replica.BACKUP_PAGES, replica.time
+        replica.BACKUP_PAGES, replica.time = 4, Clock()
+        source = Database.connect(source_name, isolation_level=None)
+        try:
+            replica.copy_pages(source, source_name, target_name)
+        finally:
+            source.close()
+            writer.close()
+            replica.BACKUP_PAGES, replica.time = old_pages, old_time
+        self.failUnless(written)
+        copy = Database.connect(target_name)
+        try:
+            self.failUnlessEqual(copy.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            self.failUnlessEqual(copy.execute('SELECT COUNT(*) FROM notes').fetchone()[0], 50)
+        finally:
+            copy.close()
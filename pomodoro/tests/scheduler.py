@@ -0,0 +1,54 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from pomodoro.models import TaskSheet, Task, Pomodoro, get_break_length, get_current_state
+from pomodoro.management.commands import run_scheduler
+from pomodoro.scheduler import Scheduler
+
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=1)
+        self.start = datetime.datetime(2010, 3, 1, 9, 0)
+
+    def test_deadline_defaults_to_pomodoro_length(self):
+        pomodoro = Pomodoro.objects.create(task=self.task, start=self.start)
+        self.failUnlessEqual(pomodoro.deadline, datetime.datetime(2010, 3, 1, 9, 25))
+
+    def test_break_cadence(self):
+        self.failUnlessEqual([get_break_length(n) for n in range(1, 6)], [5, 5, 5, 15, 5])
+
+    def test_expire(self):
+        pomodoro = Pomodoro.objects.create(task=self.task, start=self.start)
+        self.failUnlessEqual(Pomodoro.objects.expire(datetime.datetime(2010, 3, 1, 9, 24)), 0)
+        self.failUnlessEqual(Pomodoro.objects.expire(datetime.datetime(2010, 3, 1, 9, 30)), 1)
+        pomodoro = Pomodoro.objects.get(id=pomodoro.id)
+        self.failUnlessEqual(pomodoro.completed, pomodoro.deadline)
+        self.failUnlessEqual(Task.objects.get(id=self.task.id).mark_string, 'X')
+        self.failUnlessEqual(get_current_state(self.user.id).pomodoro_id, None)
+        self.failUnlessEqual(get_current_state(self.user.id).get_break_length(), 5)
+        # nothing left to do
+        self.failUnlessEqual(Pomodoro.objects.expire(datetime.datetime(2010, 3, 1, 9, 40)), 0)
+
+    def test_scheduler_waits_for_deadline(self):
+        Pomodoro.objects.create(task=self.task, start=self.start)
+        scheduler = Scheduler()
+        scheduler.load()
+        self.failUnlessEqual(scheduler.seconds_to_next(datetime.datetime(2010, 3, 1, 9, 24, 50)), 10)
+        self.failUnlessEqual(scheduler.run_once(datetime.datetime(2010, 3, 1, 9, 20)), 0)
+        self.failUnlessEqual(scheduler.run_once(datetime.datetime(2010, 3, 1, 9, 26)), 1)
+        self.failUnlessEqual(scheduler.heap, [])
+
+    def test_run_out_state_is_reloaded(self):
+        pomodoro = Pomodoro.objects.create(task=self.task, start=self.start)
+        self.failUnlessEqual(get_current_state(self.user.id).pomodoro_id, pomodoro.id)
+        # expired by a scheduler whose cache this process doesn't share
+        Pomodoro.objects.filter(id=pomodoro.id).update(completed=pomodoro.deadline, is_ongoing=None)
+        self.failUnlessEqual(get_current_state(self.user.id).pomodoro_id, None)
+
+    def test_needs_shared_cache(self):
+        self.assertRaises(CommandError, run_scheduler.Command().handle_noargs, verbosity=0, refresh=30)
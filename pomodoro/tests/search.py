@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import simplejson
+
+from pomodoro.models import TaskSheet, Task, InboxItem, Reflection
+from pomodoro import search
+from pomodoro.tests.base import CommittingTestCase
+
+class SearchTest(CommittingTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='write the quarterly report', estimate=2)
+        self.inbox_item = InboxItem.objects.create(owner=self.user, name='call the printer about <toner>')
+        self.reflection = Reflection.objects.create(task_sheet=self.task_sheet, content='the report took longer than planned')
+
+    def require_search(self):
+        # sql/task.sqlite3.sql creates the search table on SQLite
+        if settings.DATABASE_ENGINE != 'sqlite3':
+            self.skipTest('Search needs SQLite.')
+        self.failUnless(search.is_available(), 'This SQLite has no FTS5, so search is off.')
+
+    def found(self, query, owner=None, as_you_type=False):
+        return [(result['kind'], result['id'])
+                for result in search.search((owner or self.user).id, query, as_you_type=as_you_type)]
+
+    def test_parse_query(self):
+        self.failUnlessEqual(search.parse_query('report'), (u'"report"', False))
+        self.failUnlessEqual(search.parse_query('report', as_you_type=True), (u'"report"*', True))
+        self.failUnlessEqual(search.parse_query('quarterly report ', as_you_type=True),
+                (u'"quarterly" "report"', False))
+        self.failUnlessEqual(search.parse_query('"re-port" OR (x', as_you_type=True),
+                (u'"re" "port" "OR" "x"*', True))
+        self.failUnlessEqual(search.parse_query(' *: '), (None, False))
+
+    def test_rowid(self):
+        for kind in search.KINDS:
+            self.failUnlessEqual(search.split_rowid(search.get_rowid(kind, 17)), (kind, 17))
+
+    def test_indexed_on_save(self):
+        self.require_search()
+        self.failUnlessEqual(sorted(self.found('report ')),
+                sorted([('task', self.task.id), ('reflection', self.reflection.id)]))
+        self.failUnlessEqual(self.found('print', as_you_type=True), [('inbox_item', self.inbox_item.id)])
+        # only a prefix while typing
+        self.failUnlessEqual(self.found('print'), [])
+        self.task.name = 'write the annual summary'
+        self.task.save()
+        self.failUnlessEqual(self.found('quarterly '), [])
+        self.failUnlessEqual(self.found('annual '), [('task', self.task.id)])
+
+    def test_unindexed_on_delete(self):
+        self.require_search()
+        self.inbox_item.delete()
+        self.failUnlessEqual(self.found('printer '), [])
+
+    def test_other_owner(self):
+        self.require_search()
+        ann = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.failUnlessEqual(self.found('report ', ann), [])
+
+    def test_rebuild(self):
+        self.require_search()
+        self.failUnlessEqual(search.rebuild(), 3)
+        self.failUnlessEqual(self.found('planned '), [('reflection', self.reflection.id)])
+
+    def test_view(self):
+        self.require_search()
+        response = self.client.get('/search/', {'q': 'toner'})
+        self.failUnlessEqual(response.status_code, 200)
+        # the match is highlighted and the rest escaped
+        self.assertContains(response, '&lt;<mark>toner</mark>&gt;')
+
+    def test_ranked(self):
+        self.require_search()
+        best = Task.objects.create(task_sheet=self.task_sheet, name='report report', estimate=1)
+        # the best match comes first, not the newest
+        Task.objects.create(task_sheet=self.task_sheet, name='a report on the printer, the toner and the paper',
+                estimate=1)
+        self.failUnlessEqual(self.found('report')[0], ('task', best.id))
+
+    def test_json(self):
+        self.require_search()
+        response = self.client.get('/search/', {'q': 'repo', 'format': 'json'})
+        self.failUnlessEqual(response['Content-Type'], 'application/json')
+        results = simplejson.loads(response.content)['results']
+        self.failUnlessEqual(sorted([(result['kind'], result['task_sheet_id']) for result in results]),
+                    [('reflection', self.task_sheet.id), ('task', self.task_sheet.id)])
@@ -0,0 +1,100 @@
+import datetime
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import simplejson
+
+from pomodoro import views
+from pomodoro.models import TaskSheet, Task, Pomodoro, Mark
+from pomodoro.models import get_current_state, get_state_version, bump_state_version, wait_for_state_change
+from pomodoro.tests.base import CountQueriesMixin
+
+class StateTest(CountQueriesMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=1)
+
+    def get_state(self, path='/state/', data=None):
+        return simplejson.loads(self.client.get(path, data or {}).content)
+
+    def test_state(self):
+        pomodoro = Pomodoro.objects.create(task=self.task)
+        data = self.get_state()
+        self.failUnlessEqual(data['pomodoro_id'], pomodoro.id)
+        self.failUnlessEqual(data['task_sheet_id'], self.task_sheet.id)
+        # only the session and the user, for login_required
+        self.failUnlessEqual(self.count_queries(self.client.get, '/state/'), 2)
+
+    def test_signals_change_version(self):
+        version = get_state_version(self.user.id)
+        Pomodoro.objects.create(task=self.task)
+        self.failIfEqual(get_state_version(self.user.id), version)
+        version = get_state_version(self.user.id)
+        Mark.objects.add(self.task.id, 'internal')
+        self.failIfEqual(get_state_version(self.user.id), version)
+
+    def test_poll_answers_at_once_when_stale(self):
+        version = get_state_version(self.user.id)
+        Pomodoro.objects.create(task=self.task)
+        started = time.time()
+        data = self.get_state('/state/poll/', {'version': version})
+        self.failUnless(time.time() - started < 1)
+        self.failIfEqual(data['version'], version)
+
+    def test_waiters_are_woken(self):
+        version = get_state_version(self.user.id)
+        timer = threading.Timer(0.1, bump_state_version, [self.user.id])
+        timer.start()
+        started = time.time()
+        self.failIfEqual(wait_for_state_change(self.user.id, version, 5), version)
+        self.failUnless(time.time() - started < 1)
+
+    def test_stream_lets_go_of_connections(self):
+        released = []
+        release_connections = views.release_connections
+        views.release_connections = lambda: released.append(True)
+        try:
+            response = self.client.get('/state/stream/')
+            events = iter(response._container)
+            self.failUnless(events.next().startswith('id: '))
+            # as the server does when the client goes away
+            response.close()
+        finally:
+            views.release_connections = release_connections
+        self.failUnlessEqual(released, [True])
+
+class CurrentStateTest(CountQueriesMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=1)
+
+    def test_state_follows_saves_and_deletes(self):
+        state = get_current_state(self.user.id)
+        self.failUnlessEqual(state.task_sheet_id, self.task_sheet.id)
+        self.failUnlessEqual(state.pomodoro_id, None)
+        pomodoro = Pomodoro.objects.create(task=self.task)
+        state = get_current_state(self.user.id)
+        self.failUnlessEqual(state.pomodoro_id, pomodoro.id)
+        self.failUnlessEqual(state.task_id, self.task.id)
+        pomodoro.delete()
+        self.failUnlessEqual(get_current_state(self.user.id).pomodoro_id, None)
+        self.task_sheet.closed = datetime.datetime.now()
+        self.task_sheet.save()
+        self.failUnlessEqual(get_current_state(self.user.id).task_sheet_id, None)
+
+    def test_cached_state_costs_no_queries(self):
+        get_current_state(self.user.id)
+        self.failUnlessEqual(self.count_queries(get_current_state, self.user.id), 0)
+
+    def test_only_one_open_task_sheet(self):
+        self.assertRaises(IntegrityError, TaskSheet.objects.create, owner=self.user, location='office')
+
+    def test_only_one_ongoing_pomodoro(self):
+        Pomodoro.objects.create(task=self.task)
+        self.assertRaises(IntegrityError, Pomodoro.objects.create, task=self.task)
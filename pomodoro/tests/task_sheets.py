@@ -0,0 +1,63 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro.models import TaskSheet, Task, Mark
+from pomodoro.tests.base import CountQueriesMixin
+
+class TaskSheetPagingTest(CountQueriesMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        start = datetime.datetime(2010, 1, 20, 9, 0)
+        for i in range(30):
+            task_sheet = TaskSheet.objects.create(owner=self.user, closed=start,
+                    location=i % 3 and 'office' or 'home')
+            # sheets share a date in pairs so the id breaks ties
+            TaskSheet.objects.filter(id=task_sheet.id).update(date=start + datetime.timedelta(days=i // 2))
+        self.first = TaskSheet.objects.filter(owner=self.user).order_by('-date', '-id')[0]
+        task = Task.objects.create(task_sheet=self.first, name='write', estimate=2)
+        Task.objects.create(task_sheet=self.first, name='read', estimate=1)
+        Mark.objects.add(task.id, 'pomodoro')
+        Mark.objects.add(task.id, 'pomodoro')
+
+    def get_all(self, **kwargs):
+        task_sheets = []
+        after = None
+        while True:
+            page, after = TaskSheet.objects.get_page(self.user, after=after, count=7, **kwargs)
+            task_sheets.extend(page)
+            if after is None:
+                return task_sheets
+
+    def test_pages_cover_sheets_once(self):
+        task_sheets = self.get_all()
+        self.failUnlessEqual([task_sheet.id for task_sheet in task_sheets],
+                list(TaskSheet.objects.filter(owner=self.user).order_by('-date', '-id').values_list('id', flat=True)))
+
+    def test_summaries(self):
+        task_sheets = self.get_all()
+        self.failUnlessEqual((task_sheets[0].task_count, task_sheets[0].pomodoros_done), (2, 2))
+        self.failUnlessEqual((task_sheets[1].task_count, task_sheets[1].pomodoros_done), (0, 0))
+
+    def test_filters(self):
+        self.failUnlessEqual(len(self.get_all(month=datetime.date(2010, 2, 1))), 6)
+        self.failUnlessEqual(len(self.get_all(location='home')), 10)
+        self.failUnlessEqual(len(self.get_all(month=datetime.date(2010, 1, 1), location='home')), 8)
+
+    def test_view(self):
+        response = self.client.get('/task_sheets/', {'month': '2010-02', 'location': 'office'})
+        self.failUnlessEqual(len(response.context['task_sheets']), 4)
+        self.failUnlessEqual(response.context['next_cursor'], None)
+        # more than a page of sheets
+        for i in range(2):
+            TaskSheet.objects.create(owner=self.user, location='cafe', closed=datetime.datetime.now())
+        response = self.client.get('/task_sheets/')
+        self.failUnless(response.context['next_cursor'])
+
+    def test_page_cost_is_flat(self):
+        small = self.count_queries(self.client.get, '/task_sheets/')
+        for i in range(50):
+            TaskSheet.objects.create(owner=self.user, location='cafe', closed=datetime.datetime.now())
+        self.failUnlessEqual(self.count_queries(self.client.get, '/task_sheets/'), small)
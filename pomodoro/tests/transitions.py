@@ -0,0 +1,162 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase
+
+from pomodoro import benchmarks, transitions
+from pomodoro.models import TaskSheet, Task, Pomodoro, CurrentState, get_current_state, clear_current_state
+from pomodoro.models import decode_mark_log
+from pomodoro.tests.base import CommittingTestCase
+
+class TransitionsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=1)
+
+    def reload(self):
+        return Task.objects.get(id=self.task.id)
+
+    def failUnlessLoaded(self, state):
+        # the state worked out by a transition is the one the
+        # database would give
+        self.failUnlessEqual(vars(state), vars(CurrentState.load(self.user.id)))
+        self.failUnlessEqual(vars(get_current_state(self.user.id)), vars(state))
+
+    def test_start(self):
+        state = transitions.start(self.user.id, self.task)
+        self.failUnlessEqual((state.task_id, state.task_name), (self.task.id, 'focus'))
+        self.failUnlessLoaded(state)
+        self.failUnlessEqual(transitions.start(self.user.id, self.task).pomodoro_id, state.pomodoro_id)
+        self.failUnlessEqual(Pomodoro.objects.count(), 1)
+
+    def test_start_other_owners_task(self):
+        other = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.failUnlessEqual(transitions.start(other.id, self.task).pomodoro_id, None)
+        self.failUnlessEqual(Pomodoro.objects.count(), 0)
+
+    def test_complete(self):
+        transitions.start(self.user.id, self.task)
+        state = transitions.complete(self.user.id)
+        self.failUnlessEqual((state.pomodoro_id, state.pomodoros_done), (None, 1))
+        self.failUnlessLoaded(state)
+        transitions.complete(self.user.id)
+        self.failUnlessEqual((self.reload().pomodoro_count, self.reload().mark_string), (1, 'X'))
+
+    def test_complete_with_stale_state(self):
+        state = transitions.start(self.user.id, self.task)
+        # completed behind the cached state's back, as by a
+        # request that hasn't cached its state yet
+        Pomodoro.objects.filter(id=state.pomodoro_id).update(
+                completed=datetime.datetime.now(), is_ongoing=None)
+        self.failUnlessEqual(get_current_state(self.user.id).pomodoro_id, state.pomodoro_id)
+        transitions.complete(self.user.id)
+        transitions.interrupt(self.user.id, 'internal')
+        self.failUnlessEqual(self.reload().mark_log, '')
+
+    def test_cancel(self):
+        transitions.start(self.user.id, self.task)
+        state = transitions.cancel(self.user.id)
+        self.failUnlessEqual(state.pomodoro_id, None)
+        self.failUnlessLoaded(state)
+        self.failUnlessEqual(Pomodoro.objects.count(), 0)
+
+    def test_interrupt(self):
+        transitions.interrupt(self.user.id, 'internal')
+        self.failUnlessEqual(self.reload().mark_string, '')
+        transitions.start(self.user.id, self.task)
+        transitions.interrupt(self.user.id, 'external')
+        self.failUnlessEqual(self.reload().mark_string, '-')
+        self.assertRaises(ValueError, transitions.interrupt, self.user.id, 'pomodoro')
+
+    def test_views(self):
+        self.client.post('/task_sheets/%d/tasks/%d/pomodoros/' % (self.task_sheet.id, self.task.id))
+        self.client.post('/task_sheets/%d/tasks/%d/pomodoros/' % (self.task_sheet.id, self.task.id))
+        self.failUnlessEqual(Pomodoro.objects.count(), 1)
+        self.failUnlessEqual(self.client.get('/add_internal_interruption/').status_code, 405)
+        self.client.post('/add_internal_interruption/')
+        self.client.post('/complete_pomodoro/')
+        self.client.post('/complete_pomodoro/')
+        self.failUnlessEqual(self.reload().mark_string, "'X")
+
+    def test_fewer_queries(self):
+        legacy = benchmarks.count_transition_queries('legacy')
+        new = benchmarks.count_transition_queries('transitions')
+        for step in ('start', 'complete', 'cancel'):
+            self.failUnless(new[step] < legacy[step], step)
+        self.failUnless(sum(new.values()) < sum(legacy.values()))
+
+class ConcurrentTransitionsTest(CommittingTestCase):
+    """
+    Runs the transitions for one owner from several threads at once.
+    Each thread has its own connection, and the test database is in
+    memory, so the test moves to a copy of it in a file.
+    """
+    threads = 6
+    rounds = 15
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        name = os.path.join(self.directory, 'test.sqlite')
+        connection.cursor().execute('VACUUM INTO %s', [name])
+        self.memory = connection.connection
+        connection.connection = None
+        self.old_name = connection.settings_dict['DATABASE_NAME']
+        connection.settings_dict['DATABASE_NAME'] = name
+
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='home')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='focus', estimate=1)
+        # left over from tests that had the same owner id
+        clear_current_state(self.user.id)
+
+    def tearDown(self):
+        connection.close()
+        connection.settings_dict['DATABASE_NAME'] = self.old_name
+        connection.connection = self.memory
+        clear_current_state(self.user.id)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_transitions(self):
+        errors, ongoing = [], []
+        def work():
+            try:
+                for i in range(self.rounds):
+                    for func, args in ((transitions.start, (self.user.id, self.task)),
+                            (transitions.interrupt, (self.user.id, 'internal')),
+                            (transitions.complete, (self.user.id,))):
+                        try:
+                            func(*args)
+                        except Exception as e:
+                            transaction.rollback_unless_managed()
+                            errors.append(e)
+                        ongoing.append(Pomodoro.objects.filter(owner=self.user, is_ongoing=True).count())
+            finally:
+                connection.close()
+        workers = [threading.Thread(target=work) for i in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.failUnlessEqual(errors, [])
+        self.failUnlessEqual(max(ongoing), 1)
+        transitions.complete(self.user.id)
+        self.failUnlessEqual(Pomodoro.objects.filter(is_ongoing=True).count(), 0)
+        completed = Pomodoro.objects.filter(owner=self.user, completed__isnull=False).count()
+        self.failUnless(completed > 0)
+        task = Task.objects.get(id=self.task.id)
+        marks = [type for time, type in decode_mark_log(task.mark_log)]
+        # one X per completed pomodoro, and the counters agree with the log
+        self.failUnlessEqual(marks.count('pomodoro'), completed)
+        counters = (task.pomodoro_count, task.internal_count, task.mark_string)
+        task.refresh_counters(save=False)
+        self.failUnlessEqual(counters, (task.pomodoro_count, task.internal_count, task.mark_string))
+        self.failUnlessEqual(task.pomodoro_count, completed)
+        self.failUnlessEqual(task.internal_count, marks.count('internal'))
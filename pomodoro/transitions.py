@@ -0,0 +1,191 @@
+"""
+Starts, completes, cancels and interrupts an owner's pomodoro.
+
+Each transition is a single conditional statement in its own
+transaction, guarded so it only does anything in the state it is
+meant for: a pomodoro is only inserted if the owner has none running,
+and only a running pomodoro is completed, cancelled or interrupted.
+Two quick clicks can't complete a pomodoro twice or start two - the
+second finds nothing to update and changes nothing.
+
+The new CurrentState is worked out from the old one rather than read
+back, and cached before the transaction commits, while the write
+still holds the database's lock, so states are cached in the order
+they were committed. A transition that finds nothing to do returns
+the current state, reloaded if a guard showed the cached one was out
+of date.
+"""
+
+import datetime
+
+from django.db import connection, transaction, IntegrityError
+from django.utils.functional import wraps
+
+from pomodoro.models import Task, Pomodoro, Mark, CurrentState, POMODORO_LENGTH
+from pomodoro.models import get_current_state, set_current_state, clear_current_state
+from pomodoro.models import bump_task_sheet_version, bump_task_sheets_version, bump_task_versions
+
+INTERRUPTION_TYPES = ('internal', 'external')
+
+def transition(func):
+    """
+    Runs a transition in its own transaction, throwing away the cached
+    state if the transaction fails after it was set.
+    """
+    func = transaction.commit_on_success(func)
+    def run(owner_id, *args, **kwargs):
+        try:
+            return func(owner_id, *args, **kwargs)
+        except Exception:
+            clear_current_state(owner_id)
+            raise
+    return wraps(func)(run)
+
+def insert_pomodoro(owner_id, task_id, start):
+    """
+    Starts a pomodoro on the owner's task with one INSERT that only
+    adds a row if the owner has no pomodoro running. Returns the new
+    pomodoro's id, or None.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Pomodoro._meta.db_table)
+    to_db = connection.ops.value_to_db_datetime
+    deadline = start + datetime.timedelta(minutes=POMODORO_LENGTH)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(('INSERT INTO %s (%s, %s, %s, %s, %s, %s, %s) '
+                'SELECT %s, %s, %%s, %%s, NULL, %%s, %%s FROM %s WHERE %s = %%s AND %s = %%s '
+                'AND NOT EXISTS (SELECT 1 FROM %s WHERE %s = %%s AND %s = %%s)') % (
+            table, qn('owner_id'), qn('task_id'), qn('start'), qn('deadline'), qn('completed'),
+            qn('is_ongoing'), qn('updated'),
+            qn('owner_id'), qn('id'), qn(Task._meta.db_table), qn('id'), qn('owner_id'),
+            table, qn('owner_id'), qn('is_ongoing'),
+            ), [to_db(start), to_db(deadline), True, to_db(start), task_id, owner_id, owner_id, True])
+    except IntegrityError:
+        # the (owner, is_ongoing) index caught a pomodoro started
+        # at the same moment; SQLite only undoes the statement
+        return None
+    if not cursor.rowcount:
+        return None
+    return connection.ops.last_insert_id(cursor, Pomodoro._meta.db_table, 'id')
+
+def complete_pomodoro(owner_id, pomodoro_id, completed, now=None):
+    """
+    Completes the pomodoro as of completed if it is the owner's and
+    still running. Returns whether it was. The X mark is left to the
+    caller.
+    """
+    return Pomodoro.objects.filter(id=pomodoro_id, owner=owner_id, is_ongoing=True).update(
+            completed=completed, is_ongoing=None, updated=now or datetime.datetime.now()) == 1
+
+def delete_pomodoro(owner_id, pomodoro_id):
+    """
+    Deletes the pomodoro if it is the owner's and still running.
+    Returns whether it was. A running pomodoro has no mark and isn't
+    counted on its task, so unlike the ORM's delete nothing is recounted.
+    """
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM %s WHERE %s = %%s AND %s = %%s AND %s = %%s' % (
+        qn(Pomodoro._meta.db_table), qn('id'), qn('owner_id'), qn('is_ongoing')),
+        [pomodoro_id, owner_id, True])
+    return cursor.rowcount == 1
+
+def pomodoro_changed(owner_id, task_id, task_sheet_id):
+    """
+    Bumps the versions the Pomodoro signals would, without looking
+    the task's sheet up when it is known.
+    """
+    if task_sheet_id is None:
+        bump_task_versions([task_id], state=False)
+    else:
+        bump_task_sheet_version(task_sheet_id)
+        bump_task_sheets_version(owner_id)
+
+def reload_state(owner_id):
+    """
+    The state from the database, for when a guard found the cached
+    state was out of date.
+    """
+    clear_current_state(owner_id)
+    return get_current_state(owner_id)
+
+def stopped(state, done=0):
+    """
+    state with its pomodoro stopped and done more pomodoros done
+    on the open sheet.
+    """
+    pomodoros_done = state.pomodoros_done
+    if done and state.task_sheet_id is not None and state.pomodoro_task_sheet_id == state.task_sheet_id:
+        pomodoros_done = (pomodoros_done or 0) + done
+    return CurrentState(task_sheet_id=state.task_sheet_id, pomodoros_done=pomodoros_done)
+
+@transition
+def start(owner_id, task, now=None):
+    """
+    Starts a pomodoro on the owner's task unless one is running
+    and returns the new state.
+    """
+    state = get_current_state(owner_id)
+    if state.pomodoro_id is not None:
+        return state
+    now = now or datetime.datetime.now()
+    pomodoro_id = insert_pomodoro(owner_id, task.id, now)
+    if pomodoro_id is None:
+        return reload_state(owner_id)
+    pomodoro_changed(owner_id, task.id, task.task_sheet_id)
+    state = CurrentState(task_sheet_id=state.task_sheet_id, pomodoro_id=pomodoro_id, task_id=task.id,
+            start=now, deadline=now + datetime.timedelta(minutes=POMODORO_LENGTH),
+            pomodoros_done=state.pomodoros_done, task_name=task.name,
+            pomodoro_task_sheet_id=task.task_sheet_id)
+    set_current_state(owner_id, state)
+    return state
+
+@transition
+def complete(owner_id, now=None):
+    """
+    Completes the owner's running pomodoro, if there is one, along
+    with its X mark and returns the new state.
+    """
+    state = get_current_state(owner_id)
+    if state.pomodoro_id is None:
+        return state
+    now = now or datetime.datetime.now()
+    if not complete_pomodoro(owner_id, state.pomodoro_id, now, now):
+        return reload_state(owner_id)
+    # the mark's signal bumps the sheet and state versions
+    Mark.objects.add(state.task_id, 'pomodoro', now)
+    state = stopped(state, 1)
+    set_current_state(owner_id, state)
+    return state
+
+@transition
+def cancel(owner_id):
+    """
+    Cancels the owner's running pomodoro, if there is one, and
+    returns the new state.
+    """
+    state = get_current_state(owner_id)
+    if state.pomodoro_id is None:
+        return state
+    if not delete_pomodoro(owner_id, state.pomodoro_id):
+        return reload_state(owner_id)
+    pomodoro_changed(owner_id, state.task_id, state.pomodoro_task_sheet_id)
+    state = stopped(state)
+    set_current_state(owner_id, state)
+    return state
+
+@transition
+def interrupt(owner_id, type, now=None):
+    """
+    Marks an internal or external interruption on the task of the
+    owner's running pomodoro, if there is one, and returns the state,
+    which interruptions don't change.
+    """
+    if type not in INTERRUPTION_TYPES:
+        raise ValueError('Unknown interruption %r.' % (type,))
+    state = get_current_state(owner_id)
+    if state.pomodoro_id is not None and not Mark.objects.add(
+            state.task_id, type, now, pomodoro_id=state.pomodoro_id):
+        return reload_state(owner_id)
+    return state
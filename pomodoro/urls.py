@@ -9,9 +9,13 @@ urlpatterns = patterns('pomodoro.views',
     url(r'^add_internal_interruption/$', 'add_internal_interruption', name='add_internal_interruption'),
     url(r'^add_external_interruption/$', 'add_external_interruption', name='add_external_interruption'),
     url(r'^active_sheet/$', 'active_sheet', name='active_sheet'),
+    url(r'^events/$', 'events_index', name='events_index'),
+    url(r'^state/$', 'state', name='state'),
+    url(r'^state/poll/$', 'state_poll', name='state_poll'),
+    url(r'^state/stream/$', 'state_stream', name='state_stream'),
 
     # task sheets
-    url(r'^task_sheets/$', 'task_sheets_index',),
+    url(r'^task_sheets/$', 'task_sheets_index', name='task_sheets_index'),
     url(r'^task_sheets/new/$', 'new_task_sheet', name='new_task_sheet',),
     url(r'^task_sheets/(?P<task_sheet_id>\d+)/$', 'task_sheet_detail', name='task_sheet_detail'),
     url(r'^task_sheets/(?P<task_sheet_id>\d+)/close/$', 'close_task_sheet', name='close_task_sheet'),
@@ -27,6 +31,16 @@ urlpatterns = patterns('pomodoro.views',
 
     # inbox items
     url(r'^inbox_items/$', 'inbox_items_index', name='inbox_items_index'),
+    url(r'^inbox_items/feed/$', 'inbox_items_feed', name='inbox_items_feed'),
     url(r'^inbox_items/(?P<inbox_item_id>\d+)/$', 'inbox_item_detail', name='inbox_item_detail'),
     url(r'^inbox_items/(?P<inbox_item_id>\d+)/done/$', 'inbox_item_done', name='inbox_item_done'),
+
+    # search
+    url(r'^search/$', 'search_results', name='search'),
+
+    # monitoring
+    url(r'^metrics/$', 'metrics', name='metrics'),
+
+    # exports
+    url(r'^export/(?P<name>\w+)\.(?P<format>\w+)$', 'export_data', name='export_data'),
 )
@@ -1,43 +1,205 @@
 import datetime
+import time
 
 from django.shortcuts import render_to_response, get_object_or_404
 from django.template import RequestContext
-from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.template.loader import render_to_string
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseBadRequest, HttpResponseNotAllowed, Http404
 from django.core.urlresolvers import reverse
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.db import connection
+from django.db.models import Count, Max
+from django.views.decorators.http import condition, require_POST
+from django.utils import simplejson
 
-from pomodoro.models import TaskSheet, Task, InboxItem, Reflection, Pomodoro, Mark
+from pomodoro.models import TaskSheet, Task, InboxItem, Reflection, Pomodoro, Mark, ArchivedTaskSheet
+from pomodoro.models import get_current_state, get_state_version, wait_for_state_change
+from pomodoro.models import get_task_sheet_version, get_task_sheets_version, get_task_sheets_changed
 from pomodoro.forms import TaskSheetForm, InboxItemForm, TaskForm, MarkForm
+from pomodoro.events import apply_events
+from pomodoro import export
+from pomodoro import search
+from pomodoro import assets
+from pomodoro import transitions
+from pomodoro import replica
+from pomodoro.instrumentation import render_metrics
+
+def get_task_sheet_graph_or_404(task_sheet_id, owner):
+    """
+    Loads one of owner's task sheets with all of its tasks, marks,
+    pomodoros and reflections or raises a 404.
+    """
+    try:
+        return TaskSheet.objects.get_graph(id=task_sheet_id, owner=owner)
+    except TaskSheet.DoesNotExist:
+        raise Http404('No TaskSheet matches the given query.')
+
+def get_graph_task_or_404(task_sheet, task_id):
+    """
+    Picks a task out of a task sheet loaded with get_graph.
+    """
+    for task in task_sheet.task_list:
+        if task.id == int(task_id):
+            return task
+    raise Http404('No Task matches the given query.')
+
+INBOX_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE = 20
+TASK_SHEETS_PAGE_SIZE = 31
+MONTH_FORMAT = '%Y-%m'
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+def encode_cursor(key):
+    if key is None:
+        return None
+    created, id = key
+    return '%s_%d' % (created.strftime(CURSOR_TIME_FORMAT), id)
+
+def decode_cursor(cursor):
+    """
+    Turns an encoded (created, id) key back into a tuple. Bad
+    cursors are treated as the start of the list.
+    """
+    if not cursor:
+        return None
+    try:
+        created, id = cursor.rsplit('_', 1)
+        return datetime.datetime.strptime(created, CURSOR_TIME_FORMAT), int(id)
+    except ValueError:
+        return None
+
+def parse_month(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, MONTH_FORMAT).date()
+    except ValueError:
+        return None
+
+def redirect_to_sheet(task_sheet_id, fallback='home'):
+    if task_sheet_id is not None:
+        return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet_id}))
+    return HttpResponseRedirect(reverse(fallback))
+
+# Validators for conditional GETs. They only read version counters
+# from the cache, the sheet's own row or one aggregate, so a 304 is
+# answered before the views do any real work. The inbox ETag includes
+# the row count because deleting a row doesn't move the latest
+# updated time.
+
+def format_etag(*parts):
+    return '-'.join([
+        isinstance(part, datetime.datetime) and part.strftime(CURSOR_TIME_FORMAT) or str(part)
+        for part in parts])
+
+def task_sheet_etag(request, task_sheet_id, *args, **kwargs):
+    """
+    The sheet's own updated time and the version bumped whenever its
+    tasks, marks or pomodoros change. None if the sheet isn't the
+    user's, which leaves the view to 404.
+    """
+    updated = list(TaskSheet.objects.filter(id=task_sheet_id, owner=request.user).values_list(
+        'updated', flat=True)[:1])
+    if not updated:
+        return None
+    return format_etag(request.user.id, updated[0], get_task_sheet_version(int(task_sheet_id)))
+
+def task_sheet_detail_etag(request, task_sheet_id, *args, **kwargs):
+    etag = task_sheet_etag(request, task_sheet_id)
+    if etag is None:
+        # archived sheets never change
+        archived = list(ArchivedTaskSheet.objects.filter(id=task_sheet_id, owner=request.user).values_list(
+            'archived', flat=True)[:1])
+        return archived and format_etag(request.user.id, 'archived', archived[0]) or None
+    # the detail page shows the running pomodoro too
+    return format_etag(etag, get_state_version(request.user.id))
+
+def summarize(request, queryset):
+    """
+    The count and latest updated time of queryset, worked out once
+    per request so the ETag and Last-Modified functions can share it.
+    """
+    key = queryset.model._meta.db_table
+    if not hasattr(request, '_summaries'):
+        request._summaries = {}
+    if key not in request._summaries:
+        request._summaries[key] = queryset.aggregate(count=Count('id'), updated=Max('updated'))
+    return request._summaries[key]
+
+def task_sheets_etag(request, *args, **kwargs):
+    # the list shows task counts too, which the version covers
+    return format_etag(request.user.id, get_task_sheets_version(request.user.id))
+
+def inbox_items_summary(request):
+    return summarize(request, InboxItem.objects.filter(owner=request.user))
+
+def inbox_items_etag(request, *args, **kwargs):
+    summary = inbox_items_summary(request)
+    return format_etag(request.user.id, summary['count'], summary['updated'])
+
+def inbox_items_last_modified(request, *args, **kwargs):
+    return inbox_items_summary(request)['updated']
+
+@login_required
+def home(request, template_name='home.html'):
+    inbox_items, next_key = InboxItem.objects.get_active_page(request.user,
+            after=decode_cursor(request.GET.get('after')), count=INBOX_PAGE_SIZE)
+    return render_to_response(
+            template_name,
+            {
+                'active_inbox_items': inbox_items,
+                'next_cursor': encode_cursor(next_key),
+                },
+            context_instance=RequestContext(request),
+            )
 
 # task sheets
 
+@login_required
 def active_sheet(request):
-    active_sheet = TaskSheet.objects.get_current()
-    if active_sheet is not None:
-        response = HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': active_sheet.id}))
-    else:
-        response = HttpResponseRedirect(reverse('new_task_sheet'))
-    return response
+    return redirect_to_sheet(get_current_state(request.user.id).task_sheet_id, fallback='new_task_sheet')
 
+@login_required
 def close_task_sheet(request, task_sheet_id):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     if request.method == 'POST':
         task_sheet.closed = datetime.datetime.now()
+        task_sheet.save()
     return HttpResponseRedirect(reverse('home'))
 
+@login_required
+@condition(etag_func=task_sheets_etag)
 def task_sheets_index(request, template_name='pomodoro/task_sheets_index.html'):
     if request.method == 'GET':
-        task_sheets = TaskSheet.objects.all()
+        month = parse_month(request.GET.get('month'))
+        location = request.GET.get('location') or None
+        # the replica only if it has the version the ETag was made from
+        reader = replica.get_reader(since=get_task_sheets_changed(request.user.id))
+        task_sheets, next_key = TaskSheet.objects.get_page(request.user,
+                after=decode_cursor(request.GET.get('after')), count=TASK_SHEETS_PAGE_SIZE,
+                month=month, location=location, reader=reader)
         return render_to_response(
                 template_name,
                 {
                     'task_sheets': task_sheets,
+                    'next_cursor': encode_cursor(next_key),
+                    'month': month and month.strftime(MONTH_FORMAT) or '',
+                    'location': location or '',
                     },
                 context_instance=RequestContext(request),
                 )
     elif request.method == 'POST':
+        # only one task sheet can be open at a time
+        current_task_sheet_id = get_current_state(request.user.id).task_sheet_id
+        if current_task_sheet_id is not None:
+            return redirect_to_sheet(current_task_sheet_id)
         form = TaskSheetForm(request.POST)
         if form.is_valid():
-            task_sheet = form.save()
+            task_sheet = form.save(commit=False)
+            task_sheet.owner = request.user
+            task_sheet.save()
             return HttpResponseRedirect(
                     reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet.id}))
         else:
@@ -49,6 +211,7 @@ def task_sheets_index(request, template_name='pomodoro/task_sheets_index.html'):
                     context_instance=RequestContext(request),
                     )
 
+@login_required
 def new_task_sheet(request, template_name='pomodoro/new_task_sheet.html'):
     if request.method == 'POST':
         return task_sheets_index(request)
@@ -60,11 +223,24 @@ def new_task_sheet(request, template_name='pomodoro/new_task_sheet.html'):
                 },
             context_instance=RequestContext(request),
             )
+class LazyTaskSheetGraph(object):
+    """
+    Loads the sheet's task graph only when the template asks for
+    task_list - templates only call methods, not bare callables.
+    """
+    def __init__(self, task_sheet):
+        self.task_sheet = task_sheet
+
+    def task_list(self):
+        return TaskSheet.objects.load_graph(self.task_sheet).task_list
+
+@login_required
+@condition(etag_func=task_sheet_detail_etag)
 def task_sheet_detail(request, task_sheet_id, template_name='pomodoro/task_sheet_detail.html'):
     try:
-        task_sheet = TaskSheet.objects.select_related().get(id=task_sheet_id)
+        task_sheet = TaskSheet.objects.get(id=task_sheet_id, owner=request.user)
     except TaskSheet.DoesNotExist:
-        raise Http404('No TaskSheet matches the given query.')
+        return archived_task_sheet_detail(request, task_sheet_id, template_name)
 
     # retrieve details
     if request.method == 'POST':
@@ -84,11 +260,18 @@ def task_sheet_detail(request, task_sheet_id, template_name='pomodoro/task_sheet
                     )
     inbox_item_form = InboxItemForm()
     task_form = TaskForm()
-    current_pomodoro = Pomodoro.objects.get_current()
+    # the running pomodoro comes from the cached state and the task
+    # table is cached per sheet version, so the tasks, marks and
+    # pomodoros are only loaded if the table has changed
+    state = get_current_state(request.user.id)
+    current_pomodoro = state.pomodoro_id is not None and state or None
     return render_to_response(
             template_name,
             {
                 'task_sheet': task_sheet,
+                'task_sheet_graph': LazyTaskSheetGraph(task_sheet),
+                'task_sheet_version': get_task_sheet_version(task_sheet.id),
+                'pomodoro_running': current_pomodoro is not None,
                 'inbox_item_form': inbox_item_form,
                 'task_form': task_form,
                 'current_pomodoro': current_pomodoro,
@@ -96,10 +279,31 @@ def task_sheet_detail(request, task_sheet_id, template_name='pomodoro/task_sheet
             context_instance=RequestContext(request),
             )
 
+def archived_task_sheet_detail(request, task_sheet_id, template_name):
+    """
+    Renders an archived sheet with the detail template, read only.
+    """
+    archived = get_object_or_404(ArchivedTaskSheet, id=task_sheet_id, owner=request.user)
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    task_sheet = archived.to_graph()
+    return render_to_response(
+            template_name,
+            {
+                'task_sheet': task_sheet,
+                'task_sheet_graph': task_sheet,
+                'task_sheet_version': get_task_sheet_version(task_sheet.id),
+                'pomodoro_running': False,
+                'archived': True,
+                },
+            context_instance=RequestContext(request),
+            )
+
+@login_required
 def edit_task_sheet(request, task_sheet_id, template_name='pomodoro/edit_task_sheet.html'):
     if request.method == 'POST':
         return task_sheet_detail(request, task_sheet_id)
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     form = TaskSheetForm(instance=task_sheet)
     return render_to_response(
             template_name,
@@ -109,23 +313,27 @@ def edit_task_sheet(request, task_sheet_id, template_name='pomodoro/edit_task_sh
                 },
             context_instance=RequestContext(request),
             )
+@login_required
 def delete_task_sheet(request, task_sheet_id):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     if request.method == 'POST':
         task_sheet.delete()
         return HttpResponseRedirect(reverse('task_sheets_index'))
     
+@login_required
 def complete_task(request, task_sheet_id, task_id):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     task = get_object_or_404(Task, task_sheet=task_sheet, id=task_id)
     if request.method == 'POST':
         task.completed = datetime.datetime.now()
         task.save()
     return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet.id }))
+@login_required
+@condition(etag_func=task_sheet_etag)
 def tasks_index(request, task_sheet_id, template_name='pomodoro/tasks_index.html'):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
     if request.method == 'GET':
-        tasks = Task.objects.filter(task_sheet=task_sheet)
+        task_sheet = get_task_sheet_graph_or_404(task_sheet_id, request.user)
+        tasks = task_sheet.task_list
         return render_to_response(
                 template_name,
                 {
@@ -135,6 +343,7 @@ def tasks_index(request, task_sheet_id, template_name='pomodoro/tasks_index.html
                 context_instance=RequestContext(request),
                 )
     elif request.method == 'POST':
+        task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
         form = TaskForm(request.POST)
         if form.is_valid():
             task = form.save(commit=False)
@@ -152,11 +361,12 @@ def tasks_index(request, task_sheet_id, template_name='pomodoro/tasks_index.html
                     context_instance=RequestContext(request),
                     )
 
+@login_required
 def new_task(request, task_sheet_id, template_name='pomodoro/new_task.html'):
     # Handle POST to new as a create request
     if request.method == 'POST':
         return tasks_index(request, task_sheet_id)
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     form = TaskForm()
     return render_to_response(
             template_name,
@@ -166,9 +376,10 @@ def new_task(request, task_sheet_id, template_name='pomodoro/new_task.html'):
                 },
             context_instance=RequestContext(request),
             )
+@login_required
 def task_detail(request, task_sheet_id, task_id, template_name='pomodoro/task_detail.html'):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
-    task = get_object_or_404(Task, id=task_id)
+    task_sheet = get_task_sheet_graph_or_404(task_sheet_id, request.user)
+    task = get_graph_task_or_404(task_sheet, task_id)
     # retrieve details
     if request.method == 'GET':
         return render_to_response(
@@ -205,12 +416,13 @@ def task_detail(request, task_sheet_id, task_id, template_name='pomodoro/task_de
                     context_instance=RequestContext(request),
                     )
 
+@login_required
 def edit_task(request, task_sheet_id, task_id, template_name='pomodoro/edit_task.html'):
     # if a POST is received, direct it to resource detail for update
     if request.method == 'POST':
         return task_detail(request, task_sheet_id, task_id)
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
-    task = get_object_or_404(Task, id=task_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
+    task = get_object_or_404(Task, task_sheet=task_sheet, id=task_id)
     form = TaskForm(instance=task)
     return render_to_response(
             template_name,
@@ -221,24 +433,48 @@ def edit_task(request, task_sheet_id, task_id, template_name='pomodoro/edit_task
                 },
             context_instance=RequestContext(request),
             )
+@login_required
 def delete_task(request, task_sheet_id, task_id):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
-    task = get_object_or_404(Task, id=task_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
+    task = get_object_or_404(Task, task_sheet=task_sheet, id=task_id)
     if request.method == 'POST':
         task.delete()
         return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet.id}))
     
 
 
+@login_required
 def inbox_item_done(request, inbox_item_id):
-    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id)
+    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id, owner=request.user)
     if request.method == 'POST':
         inbox_item.dealt_with = datetime.datetime.now()
         inbox_item.save()
     return HttpResponseRedirect(reverse('home'))
+@login_required
+def inbox_items_feed(request, template_name='pomodoro/inbox_item_list.html'):
+    """
+    The next page of the dashboard inbox as JSON, for "load more".
+    """
+    inbox_items, next_key = InboxItem.objects.get_active_page(request.user,
+            after=decode_cursor(request.GET.get('after')), count=INBOX_PAGE_SIZE)
+    data = {
+            'items': [
+                {
+                    'id': item.id,
+                    'name': item.name,
+                    'created': item.created.strftime(CURSOR_TIME_FORMAT),
+                    }
+                for item in inbox_items],
+            'html': render_to_string(template_name, {'active_inbox_items': inbox_items}),
+            'next': encode_cursor(next_key),
+            }
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json')
+
+@login_required
+@condition(etag_func=inbox_items_etag, last_modified_func=inbox_items_last_modified)
 def inbox_items_index(request, template_name='pomodoro/inbox_items_index.html'):
     if request.method == 'GET':
-        inbox_items = InboxItem.objects.filter(dealt_with=False)
+        inbox_items = InboxItem.objects.filter(owner=request.user, dealt_with=False)
         return render_to_response(
                 template_name,
                 {
@@ -249,13 +485,10 @@ def inbox_items_index(request, template_name='pomodoro/inbox_items_index.html'):
     elif request.method == 'POST':
         form = InboxItemForm(request.POST)
         if form.is_valid():
-            inbox_item = form.save()
-            # get current task_sheet
-            task_sheet = TaskSheet.objects.get_current()
-            if task_sheet:
-                return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet.id,}))
-            else:
-                return HttpResponseRedirect(reverse('home'))
+            inbox_item = form.save(commit=False)
+            inbox_item.owner = request.user
+            inbox_item.save()
+            return redirect_to_sheet(get_current_state(request.user.id).task_sheet_id)
         else:
             template_name = 'pomodoro/new_inbox_item.html'
             return render_to_response(
@@ -267,6 +500,7 @@ def inbox_items_index(request, template_name='pomodoro/inbox_items_index.html'):
                     context_instance=RequestContext(request),
                     )
 
+@login_required
 def new_inbox_item(request, template_name='pomodoro/new_inbox_item.html'):
     # Handle POST to new as a create request
     if request.method == 'POST':
@@ -279,8 +513,9 @@ def new_inbox_item(request, template_name='pomodoro/new_inbox_item.html'):
                 },
             context_instance=RequestContext(request),
             )
+@login_required
 def inbox_item_detail(request, inbox_item_id, template_name='pomodoro/inbox_item_detail.html'):
-    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id)
+    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id, owner=request.user)
     # retrieve details
     if request.method == 'GET':
         return render_to_response(
@@ -314,11 +549,12 @@ def inbox_item_detail(request, inbox_item_id, template_name='pomodoro/inbox_item
                     context_instance=RequestContext(request),
                     )
 
+@login_required
 def edit_inbox_item(request, inbox_item_id, template_name='pomodoro/edit_inbox_item.html'):
     # if a POST is received, direct it to resource detail for update
     if request.method == 'POST':
         return inbox_item_detail(request, inbox_item_id)
-    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id)
+    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id, owner=request.user)
     form = InboxItemForm(instance=inbox_item)
     return render_to_response(
             template_name,
@@ -328,21 +564,19 @@ def edit_inbox_item(request, inbox_item_id, template_name='pomodoro/edit_inbox_i
                 },
             context_instance=RequestContext(request),
             )
+@login_required
 def delete_inbox_item(request, task_sheet_id, inbox_item_id):
-    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id)
-    task_sheet = TaskSheet.objects.get_current()
+    inbox_item = get_object_or_404(InboxItem, id=inbox_item_id, owner=request.user)
     if request.method == 'POST':
         inbox_item.delete()
-        if task_sheet:
-            return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet.id}))
-        else:
-            return HttpResponseRedirect(reverse('home'))
+        return redirect_to_sheet(get_current_state(request.user.id).task_sheet_id)
 
 
+@login_required
 def reflections_index(request, task_sheet_id, template_name='pomodoro/reflections_index.html'):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
     if request.method == 'GET':
-        reflections = Reflection.objects.filter(task_sheet=task_sheet)
+        task_sheet = get_task_sheet_graph_or_404(task_sheet_id, request.user)
+        reflections = task_sheet.reflection_list
         return render_to_response(
                 template_name,
                 {
@@ -352,6 +586,7 @@ def reflections_index(request, task_sheet_id, template_name='pomodoro/reflection
                 context_instance=RequestContext(request),
                 )
     elif request.method == 'POST':
+        task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
         form = ReflectionForm(request.POST)
         if form.is_valid():
             reflection = form.save(commit=False)
@@ -369,11 +604,12 @@ def reflections_index(request, task_sheet_id, template_name='pomodoro/reflection
                     context_instance=RequestContext(request),
                     )
 
+@login_required
 def new_reflection(request, task_sheet_id, template_name='pomodoro/new_reflection.html'):
     # Handle POST to new as a create request
     if request.method == 'POST':
         return reflections_index(request, task_sheet_id)
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     form = ReflectionForm()
     return render_to_response(
             template_name,
@@ -383,8 +619,9 @@ def new_reflection(request, task_sheet_id, template_name='pomodoro/new_reflectio
                 },
             context_instance=RequestContext(request),
             )
+@login_required
 def reflection_detail(request, task_sheet_id, reflection_id, template_name='pomodoro/reflection_detail.html'):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     reflection = get_object_or_404(Reflection, id=reflection_id, task_sheet=task_sheet)
     # retrieve details
     if request.method == 'GET':
@@ -422,11 +659,12 @@ def reflection_detail(request, task_sheet_id, reflection_id, template_name='pomo
                     context_instance=RequestContext(request),
                     )
 
+@login_required
 def edit_reflection(request, task_sheet_id, reflection_id, template_name='pomodoro/edit_reflection.html'):
     # if a POST is received, direct it to resource detail for update
     if request.method == 'POST':
         return reflection_detail(request, task_sheet_id, reflection_id)
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     reflection = get_object_or_404(Reflection, id=reflection_id, task_sheet=task_sheet)
     form = ReflectionForm(instance=reflection)
     return render_to_response(
@@ -438,43 +676,146 @@ def edit_reflection(request, task_sheet_id, reflection_id, template_name='pomodo
                 },
             context_instance=RequestContext(request),
             )
+@login_required
 def delete_reflection(request, task_sheet_id, reflection_id):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     reflection = get_object_or_404(Reflection, id=reflection_id, task_sheet=task_sheet)
     if request.method == 'POST':
         reflection.delete()
         return HttpResponseRedirect(reverse('reflections_index', kwargs={'task_sheet_id': task_sheet.id}))
     
 
+@login_required
 def complete_pomodoro(request):
-    current_pomodoro = Pomodoro.objects.get_current()
-    if request.method == 'POST' and current_pomodoro is not None:
-        current_pomodoro.completed = datetime.datetime.now()
-        current_pomodoro.save()
-    current_task_sheet = TaskSheet.objects.get_current()
-    if current_task_sheet:
-        response = HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': current_task_sheet.id}))
+    if request.method == 'POST':
+        state = transitions.complete(request.user.id)
     else:
-        response = HttpResponseRedirect(reverse('home'))
-    return response
+        state = get_current_state(request.user.id)
+    return redirect_to_sheet(state.task_sheet_id)
 
+@login_required
 def cancel_pomodoro(request):
-    current_pomodoro = Pomodoro.objects.get_current()
-    if current_pomodoro is not None and request.method == 'POST':
-        current_pomodoro.delete()
-    current_task_sheet = TaskSheet.objects.get_current()
-    if current_task_sheet:
-        response = HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': current_task_sheet.id}))
+    if request.method == 'POST':
+        state = transitions.cancel(request.user.id)
     else:
-        response = HttpResponseRedirect(reverse('home'))
-    return response
+        state = get_current_state(request.user.id)
+    return redirect_to_sheet(state.task_sheet_id)
+
+
+@login_required
+def events_index(request):
+    """
+    Accepts a JSON list of queued pomodoro events and applies them
+    in one go. See pomodoro.events for the format.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        events = simplejson.loads(request.raw_post_data)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid JSON.')
+    if not isinstance(events, list):
+        return HttpResponseBadRequest('Expected a list of events.')
+    results = apply_events(request.user.id, events)
+    return HttpResponse(simplejson.dumps({'results': results}), mimetype='application/json')
 
+POLL_TIMEOUT = 25
+STREAM_DURATION = 5 * 60
 
+def release_connections():
+    """
+    Closes this thread's database and replica connections, which
+    reopen on the next query. The state views spend most of their
+    time waiting on the cache, and a stream's body runs after
+    request_finished has closed everything, so both let go of their
+    connections themselves.
+    """
+    connection.close()
+    replica.close_replicas(None)
+
+def format_time(value):
+    return value and value.strftime(CURSOR_TIME_FORMAT) or None
+
+def state_payload(owner_id, version):
+    current = get_current_state(owner_id)
+    return simplejson.dumps({
+        'version': version,
+        'task_sheet_id': current.task_sheet_id,
+        'pomodoro_id': current.pomodoro_id,
+        'task_id': current.task_id,
+        'start': format_time(current.start),
+        'deadline': format_time(current.deadline),
+        'break_minutes': current.get_break_length(),
+        })
+
+@login_required
+def state(request):
+    """
+    The open task sheet and running pomodoro as a small JSON object.
+    Served from the cache, so it normally costs no queries.
+    """
+    return HttpResponse(state_payload(request.user.id, get_state_version(request.user.id)), mimetype='application/json')
+
+@login_required
+def state_poll(request):
+    """
+    Long-poll version of state: waits until the state version differs
+    from ?version= (or POLL_TIMEOUT seconds pass) before answering.
+    """
+    try:
+        version = int(request.GET.get('version'))
+    except (TypeError, ValueError):
+        version = None
+    if version is not None:
+        release_connections()
+        version = wait_for_state_change(request.user.id, version, POLL_TIMEOUT)
+    else:
+        version = get_state_version(request.user.id)
+    return HttpResponse(state_payload(request.user.id, version), mimetype='application/json')
+
+@login_required
+def state_stream(request):
+    """
+    Server-Sent Events stream of the state. Sends the state straight
+    away and again every time it changes. The stream ends after
+    STREAM_DURATION seconds and EventSource reconnects on its own,
+    passing the last version seen as Last-Event-ID.
+    """
+    owner_id = request.user.id
+    def events(version):
+        try:
+            deadline = time.time() + STREAM_DURATION
+            if version is None:
+                version = get_state_version(owner_id)
+                yield 'id: %d\ndata: %s\n\n' % (version, state_payload(owner_id, version))
+            while time.time() < deadline:
+                release_connections()
+                current = wait_for_state_change(owner_id, version, min(POLL_TIMEOUT, deadline - time.time()))
+                if current != version:
+                    version = current
+                    yield 'id: %d\ndata: %s\n\n' % (version, state_payload(owner_id, version))
+                else:
+                    # keep intermediaries from closing an idle connection
+                    yield ': keepalive\n\n'
+        finally:
+            # also run when the client goes away and the server
+            # closes the response
+            release_connections()
+    try:
+        last_version = int(request.META.get('HTTP_LAST_EVENT_ID'))
+    except (TypeError, ValueError):
+        last_version = None
+    response = HttpResponse(events(last_version), mimetype='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@login_required
+@condition(etag_func=task_sheet_etag)
 def pomodoros_index(request, task_sheet_id, task_id, template_name='pomodoro/pomodoros_index.html'):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
-    task = get_object_or_404(Task, task_sheet=task_sheet, id=task_id)
     if request.method == 'GET':
-        pomodoros = Pomodoro.objects.filter(task=task)
+        task_sheet = get_task_sheet_graph_or_404(task_sheet_id, request.user)
+        task = get_graph_task_or_404(task_sheet, task_id)
+        pomodoros = task.pomodoro_list
         return render_to_response(
                 template_name,
                 {
@@ -484,12 +825,13 @@ def pomodoros_index(request, task_sheet_id, task_id, template_name='pomodoro/pom
                 context_instance=RequestContext(request),
                 )
     elif request.method == 'POST':
-        if not Pomodoro.objects.get_current():
-            Pomodoro.objects.create(task=task)
+        task = get_object_or_404(Task, task_sheet=task_sheet_id, id=task_id, owner=request.user)
+        transitions.start(request.user.id, task)
         return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet_id,}))
 
+@login_required
 def pomodoro_detail(request, task_sheet_id, task_id, pomodoro_id, template_name='pomodoro/pomodoro_detail.html'):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
+    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
     task = get_object_or_404(Task, task_sheet=task_sheet, id=task_id)
     pomodoro = get_object_or_404(Pomodoro, task=task, id=pomodoro_id)
     # retrieve details
@@ -528,36 +870,27 @@ def pomodoro_detail(request, task_sheet_id, task_id, pomodoro_id, template_name=
                     context_instance=RequestContext(request),
                     )
 
+@login_required
+@require_POST
 def add_internal_interruption(request):
-    current_pomodoro = Pomodoro.objects.get_current()
-    if current_pomodoro is not None:
-        Mark.objects.create(task=current_pomodoro.task, type='internal')
-    current_task_sheet = TaskSheet.objects.get_current()
-    if current_task_sheet:
-        response = HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': current_task_sheet.id}))
-    else:
-        response = HttpResponseRedirect(reverse('task_sheets_index'))
-    return response
+    state = transitions.interrupt(request.user.id, 'internal')
+    return redirect_to_sheet(state.task_sheet_id, fallback='task_sheets_index')
 
 
 
+@login_required
+@require_POST
 def add_external_interruption(request):
-    current_pomodoro = Pomodoro.objects.get_current()
-    if current_pomodoro is not None:
-        Mark.objects.create(task=current_pomodoro.task, type='external')
-    current_task_sheet = TaskSheet.objects.get_current()
-    if current_task_sheet:
-        response = HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': current_task_sheet.id}))
-    else:
-        response = HttpResponseRedirect(reverse('task_sheets_index'))
-    return response
+    state = transitions.interrupt(request.user.id, 'external')
+    return redirect_to_sheet(state.task_sheet_id, fallback='task_sheets_index')
 
 
+@login_required
 def marks_index(request, task_sheet_id, task_id, template_name='pomodoro/marks_index.html'):
-    task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id)
-    task = get_object_or_404(Task, task_sheet=task_sheet, id=task_id)
     if request.method == 'GET':
-        marks = Mark.objects.filter(task=task)
+        task_sheet = get_task_sheet_graph_or_404(task_sheet_id, request.user)
+        task = get_graph_task_or_404(task_sheet, task_id)
+        marks = task.mark_list
         return render_to_response(
                 template_name,
                 {
@@ -567,9 +900,92 @@ def marks_index(request, task_sheet_id, task_id, template_name='pomodoro/marks_i
                 context_instance=RequestContext(request),
                 )
     elif request.method == 'POST':
+        task_sheet = get_object_or_404(TaskSheet, id=task_sheet_id, owner=request.user)
+        task = get_object_or_404(Task, task_sheet=task_sheet, id=task_id)
         form = MarkForm(request.POST)
         if form.is_valid():
-            mark = form.save(commit=False)
-            mark.task = task
-            mark.save()
-    return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': current_task_sheet.id}))
+            Mark.objects.add(task.id, form.cleaned_data['type'])
+    return HttpResponseRedirect(reverse('task_sheet_detail', kwargs={'task_sheet_id': task_sheet.id}))
+
+EXPORT_MIMETYPES = {
+        'csv': 'text/csv',
+        'jsonl': 'application/x-ndjson',
+        }
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+@login_required
+def export_data(request, name, format):
+    """
+    Streams one table out as CSV or JSON Lines, optionally filtered
+    by ?start=YYYY-MM-DD, ?end=YYYY-MM-DD and ?location=.
+    """
+    if name not in export.EXPORTS or format not in export.FORMATS:
+        raise Http404('No such export.')
+    content = export.export(name, format,
+            owner=request.user,
+            start=parse_date(request.GET.get('start')),
+            end=parse_date(request.GET.get('end')),
+            location=request.GET.get('location'),
+            )
+    response = HttpResponse(content, mimetype=EXPORT_MIMETYPES[format])
+    response['Content-Disposition'] = 'attachment; filename=%s.%s' % (name, format)
+    return response
+
+@login_required
+def search_results(request, template_name='pomodoro/search.html'):
+    """
+    The user's tasks, inbox items and reflections matching ?q=, best
+    match first, with the matches highlighted. ?format=json gives the
+    results as JSON for search-as-you-type, where the last word can be
+    a prefix.
+    """
+    query = request.GET.get('q', '')
+    as_you_type = request.GET.get('format') == 'json'
+    results = search.search(request.user.id, query, count=SEARCH_PAGE_SIZE, as_you_type=as_you_type)
+    if as_you_type:
+        return HttpResponse(simplejson.dumps({'query': query, 'results': results}),
+                mimetype='application/json')
+    return render_to_response(
+            template_name,
+            {
+                'query': query,
+                'results': results,
+                },
+            context_instance=RequestContext(request),
+            )
+
+def asset(request, path):
+    """
+    A fingerprinted asset from memory, gzipped if the client takes it.
+    The content behind a name never changes so it is cached for good.
+    """
+    asset = assets.get_store().get(path)
+    if asset is None:
+        raise Http404('No asset %s.' % path)
+    content_type, content, zipped = asset
+    if zipped is not None and assets.accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(zipped, mimetype=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(content, mimetype=content_type)
+    response['Content-Length'] = str(len(response.content))
+    response['Cache-Control'] = 'public, max-age=%d' % assets.MAX_AGE
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+def metrics(request):
+    """
+    The per-url request histograms in Prometheus text format, for
+    staff only unless POMODORO_PUBLIC_METRICS is on.
+    """
+    if not getattr(settings, 'POMODORO_PUBLIC_METRICS', False) and not request.user.is_staff:
+        # the admin's login form, which comes back here once logged in
+        return staff_member_required(metrics)(request)
+    return HttpResponse(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Serves the site from gevent's WSGI server, each request on its own
+greenlet instead of holding one of a fixed number of worker threads.
+
+    python serve.py [[address:]port]
+    python serve.py <command> [options]
+
+The second form runs a management command in the same patched process,
+for instance benchmark_shortcuts --server=gevent. application can also
+be handed to any gevent aware server (gunicorn -k gevent serve:application).
+
+The standard library is patched before anything imports Django, so
+sockets and sleeps give way to other requests, and Django's per-thread
+database connections and the state poll condition become per-greenlet.
+The views themselves are unchanged.
+"""
+import sys
+
+try:
+    from gevent import monkey
+except ImportError:
+    sys.stderr.write("Error: serve.py needs gevent (easy_install gevent).\n")
+    sys.exit(1)
+monkey.patch_all()
+
+from django.core.management import setup_environ, execute_manager
+try:
+    import settings # Assumed to be in the same directory.
+except ImportError:
+    sys.stderr.write("Error: Can't find the file 'settings.py' in the directory containing %r.\n" % __file__)
+    sys.exit(1)
+setup_environ(settings)
+
+from django.core.handlers.wsgi import WSGIHandler
+
+application = WSGIHandler()
+
+DEFAULT_ADDRESS = '127.0.0.1'
+DEFAULT_PORT = 8000
+
+def parse_address(value):
+    """
+    (address, port) from [address:]port, or None if value isn't one.
+    """
+    if ':' in value:
+        address, port = value.rsplit(':', 1)
+    else:
+        address, port = DEFAULT_ADDRESS, value
+    if not port.isdigit():
+        return None
+    return address or DEFAULT_ADDRESS, int(port)
+
+def check_settings():
+    # a greenlet waiting on memcached inside a transition would keep
+    # SQLite's write lock, and the next writer blocks the whole
+    # process in SQLite's busy handler until it gives up
+    if settings.DATABASE_ENGINE == 'sqlite3' and settings.CACHE_BACKEND.startswith('memcached:'):
+        sys.stderr.write('Warning: with SQLite keep CACHE_BACKEND in this process (locmem://) '
+                'when serving from greenlets.\n')
+
+def serve(address, port):
+    from gevent.pywsgi import WSGIServer
+    check_settings()
+    sys.stdout.write('Serving on http://%s:%d/\n' % (address, port))
+    WSGIServer((address, port), application).serve_forever()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and parse_address(sys.argv[1]) is None:
+        execute_manager(settings)
+    elif len(sys.argv) > 1:
+        serve(*parse_address(sys.argv[1]))
+    else:
+        serve(DEFAULT_ADDRESS, DEFAULT_PORT)
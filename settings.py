@@ -18,6 +18,11 @@ DATABASE_PASSWORD = ''         # Not used with sqlite3.
 DATABASE_HOST = ''             # Set to empty string for localhost. Not used with sqlite3.
 DATABASE_PORT = ''             # Set to empty string for default. Not used with sqlite3.
 
+# The open task sheet and running pomodoro are cached here. Use a
+# shared backend (memcached://... or file://...) when running more than
+# one process, which includes running run_scheduler.
+CACHE_BACKEND = 'locmem://'
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -60,11 +65,38 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'pomodoro.instrumentation.InstrumentationMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
 )
 
+# Requests running more queries than this are logged with their SQL
+# by the instrumentation middleware. None turns the check off.
+POMODORO_QUERY_BUDGET = 30
+
+# /metrics/ is only shown to staff unless this is on - for a scraper
+# that can't log in, with the url kept off the public network.
+POMODORO_PUBLIC_METRICS = False
+
+# The pomodoro cadence in minutes: pomodoro, short break, long break
+# and how many pomodoros between long breaks.
+POMODORO_LENGTH = 25
+POMODORO_SHORT_BREAK = 5
+POMODORO_LONG_BREAK = 15
+POMODORO_LONG_BREAK_EVERY = 4
+
+# Where the build_assets command writes the fingerprinted copies of
+# MEDIA_ROOT and the URL they are served from.
+POMODORO_ASSETS_ROOT = os.path.join(ROOT_PATH, 'assets')
+POMODORO_ASSETS_URL = '/assets/'
+
+# Stats, exports and the admin's change lists read from a copy of the
+# database refreshed by snapshot_database --every=60, as long as the
+# copy is no more than this many seconds old. The copy goes next to
+# DATABASE_NAME unless POMODORO_REPLICA_NAME says otherwise.
+POMODORO_REPLICA_MAX_AGE = 5 * 60
+
 ROOT_URLCONF = 'pypomo.urls'
 
 TEMPLATE_DIRS = (
@@ -81,6 +113,7 @@ INSTALLED_APPS = (
     'django.contrib.sites',
     'django.contrib.admin',
     'pomodoro',
+    'stats',
 )
 
 try:
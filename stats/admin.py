@@ -0,0 +1,5 @@
+from django.contrib import admin
+from pomodoro.admin import ReplicaAdmin
+from stats.models import DailyStats
+
+admin.site.register(DailyStats, ReplicaAdmin)
@@ -0,0 +1,334 @@
+"""
+Estimate accuracy, interruption rates and streaks for one owner,
+computed over their whole history with NumPy.
+
+load() pulls the owner's task sheets and tasks with values_list into
+arrays - the marks come from the task mark logs, which
+decode_mark_logs unpacks for every task at once rather than mark by
+mark - and analyse() works out all the numbers with grouped
+bincounts, sorts and cumulative sums instead of Python loops. Each
+completed pomodoro is the X mark add_pomodoro_mark writes for it, so
+the Pomodoro table isn't read. Sheets that have been archived aren't
+included. load() reads from the replica when there is a fresh one
+taken since the owner's sheets last changed, and keeps the last few
+Histories in memory until the owner's task sheets version moves on,
+so asking again costs only the analysis.
+
+See the stats_analytics view and the analytics management command.
+"""
+
+import datetime
+
+import numpy
+from django.conf import settings
+
+from pomodoro.models import TaskSheet, Task, MARK_CODES
+from pomodoro.models import get_task_sheets_version, get_task_sheets_changed
+from pomodoro.replica import get_reader, route
+
+EPOCH = datetime.date(1970, 1, 1)
+DAY = 24 * 60 * 60
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+# 1970-01-01, day 0, was a Thursday
+EPOCH_WEEKDAY = 3
+# upper bounds in days of the task age groups
+AGE_BOUNDS = (7, 30, 90, 365)
+AGE_LABELS = ('0-7', '8-30', '31-90', '91-365', '366+')
+PERCENTILES = (50, 90)
+ROLLING_DAYS = 7
+MARK_TYPES = ('pomodoro', 'internal', 'external')
+# mark log letter to index into MARK_TYPES
+TYPE_INDEX = numpy.zeros(256, dtype=numpy.int8)
+for i, type in enumerate(MARK_TYPES):
+    TYPE_INDEX[ord(MARK_CODES[type])] = i
+# the Histories load() keeps in this process, as (owner id,
+# location): (task sheets version, History)
+HISTORY_CACHE_SIZE = getattr(settings, 'POMODORO_ANALYTICS_CACHE_SIZE', 20)
+histories = {}
+
+
+class History(object):
+    """
+    An owner's tasks and marks as parallel arrays. Each task has an
+    index into locations and the day of its sheet, in days since the
+    epoch; each mark has the index of its task, its time in seconds
+    and its index into MARK_TYPES. The day, weekday and hour of each
+    mark are worked out once here, as load() keeps Histories for
+    more than one analysis.
+    """
+    def __init__(self, locations, task_location, task_day, estimate, actual, completed,
+            mark_task, mark_seconds, mark_type):
+        self.locations = locations
+        self.task_location = task_location
+        self.task_day = task_day
+        self.estimate = estimate
+        self.actual = actual
+        self.completed = completed
+        self.mark_task = mark_task
+        self.mark_seconds = mark_seconds
+        self.mark_type = mark_type
+        self.mark_day = mark_seconds // DAY
+        self.mark_weekday = (self.mark_day + EPOCH_WEEKDAY) % 7
+        self.mark_hour = (mark_seconds - self.mark_day * DAY) // 3600
+
+def decode_mark_logs(mark_logs):
+    """
+    Decodes a list of mark logs - see pomodoro.models.encode_mark_log
+    - all at once. Returns arrays of the index of each mark's log, its
+    time in seconds and its type, an index into MARK_TYPES, in log
+    order.
+    """
+    lengths = numpy.fromiter(map(len, mark_logs), dtype=numpy.int64, count=len(mark_logs))
+    chars = numpy.frombuffer(''.join(mark_logs).encode('ascii'), dtype=numpy.uint8)
+    starts = numpy.flatnonzero(chars >= ord('a'))
+    if not len(starts):
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return empty, empty, numpy.zeros(0, dtype=numpy.int8)
+    # each mark is a letter then its digits, up to the next letter;
+    # the marks are parsed a batch of same length numbers at a time
+    ends = numpy.append(starts[1:], len(chars))
+    negative = chars[numpy.minimum(starts + 1, len(chars) - 1)] == ord('-')
+    first_digits = starts + 1 + negative
+    sizes = ends - first_digits
+    deltas = numpy.zeros(len(starts), dtype=numpy.int64)
+    for size in numpy.flatnonzero(numpy.bincount(sizes)):
+        marks = numpy.flatnonzero(sizes == size)
+        at = first_digits[marks]
+        value = numpy.zeros(len(marks), dtype=numpy.int64)
+        for i in range(size):
+            value = value * 10 + (chars[at + i] - ord('0'))
+        deltas[marks] = value
+    deltas[negative] *= -1
+
+    # the number of marks in each log, from where each log starts
+    counts = numpy.diff(numpy.searchsorted(starts, numpy.concatenate(([0], numpy.cumsum(lengths)))))
+    mark_log = numpy.repeat(numpy.arange(len(mark_logs)), counts)
+    seconds = numpy.cumsum(deltas)
+    # every log counts from 0, so take off the running total
+    # of the logs before it
+    first = (numpy.cumsum(counts) - counts)[counts > 0]
+    seconds -= numpy.repeat(seconds[first] - deltas[first], counts[counts > 0])
+    return mark_log, seconds, TYPE_INDEX[chars[starts]]
+
+def load(owner, location=None):
+    """
+    The owner's history, optionally at one location, as a History.
+    Reading and decoding a long history takes longer than analysing
+    it, so a History is reused for as long as the owner's task sheets
+    version - bumped by every change to their sheets, tasks and marks
+    - stays the same. Histories are shared, so don't change them.
+    """
+    key = (owner.id, location or None)
+    # read before the rows, so a change made meanwhile isn't missed
+    version = get_task_sheets_version(owner.id)
+    cached = histories.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    history = read_history(owner, location, get_reader(since=get_task_sheets_changed(owner.id)))
+    if key not in histories and len(histories) >= HISTORY_CACHE_SIZE:
+        histories.popitem()
+    histories[key] = (version, history)
+    return history
+
+def read_history(owner, location, reader):
+    """
+    Reads the owner's history, optionally at one location, into a
+    History, with the task sheets and tasks from the same reader so
+    every task has its sheet.
+    """
+    task_sheets = TaskSheet.objects.filter(owner=owner)
+    if location:
+        task_sheets = task_sheets.filter(location=location)
+    task_sheets = list(route(task_sheets, reader).order_by('id').values_list('id', 'date', 'location'))
+    sheet_ids = numpy.array([row[0] for row in task_sheets], dtype=numpy.int64)
+    sheet_days = numpy.array([(row[1].date() - EPOCH).days for row in task_sheets], dtype=numpy.int64)
+    locations, sheet_location = numpy.unique(
+            numpy.array([row[2] for row in task_sheets], dtype=unicode), return_inverse=True)
+
+    tasks = Task.objects.filter(owner=owner)
+    if location:
+        tasks = tasks.filter(task_sheet__location=location)
+    tasks = list(route(tasks, reader).values_list(
+        'task_sheet', 'estimate', 'pomodoro_count', 'completed', 'mark_log'))
+    sheets = numpy.searchsorted(sheet_ids, numpy.array([row[0] for row in tasks], dtype=numpy.int64))
+    mark_task, mark_seconds, mark_type = decode_mark_logs([row[4] for row in tasks])
+    return History(
+            [unicode(name) for name in locations],
+            sheet_location[sheets],
+            sheet_days[sheets],
+            numpy.array([row[1] for row in tasks], dtype=numpy.float64),
+            numpy.array([row[2] for row in tasks], dtype=numpy.float64),
+            numpy.array([row[3] is not None for row in tasks], dtype=bool),
+            mark_task, mark_seconds, mark_type,
+            )
+
+def group_percentiles(groups, count, values, by_value):
+    """
+    The PERCENTILES of values in each of count groups, interpolated
+    the way numpy.percentile does, given the order that sorts values.
+    Empty groups get 0.
+    """
+    # a stable sort keeps each group in value order
+    order = by_value[numpy.argsort(groups[by_value], kind='mergesort')]
+    values = values[order]
+    sizes = numpy.bincount(groups, minlength=count)
+    starts = (numpy.cumsum(sizes) - sizes)[sizes > 0]
+    results = []
+    for percentile in PERCENTILES:
+        result = numpy.zeros(count)
+        position = (sizes[sizes > 0] - 1) * percentile / 100.0
+        low = numpy.floor(position).astype(numpy.int64)
+        high = numpy.ceil(position).astype(numpy.int64)
+        result[sizes > 0] = values[starts + low] + (values[starts + high] - values[starts + low]) * (position - low)
+        results.append(result)
+    return results
+
+def ratio(numerator, denominator):
+    if not denominator:
+        return None
+    return round(float(numerator) / denominator, 3)
+
+def estimate_accuracy(groups, labels, estimate, actual, ratios, by_ratio):
+    """
+    Compares estimates with the pomodoros actually taken for each
+    group of completed tasks.
+    """
+    count = len(labels)
+    tasks = numpy.bincount(groups, minlength=count)
+    estimated = numpy.bincount(groups, estimate, minlength=count)
+    taken = numpy.bincount(groups, actual, minlength=count)
+    on_estimate = numpy.bincount(groups, (actual <= estimate).astype(numpy.float64), minlength=count)
+    percentiles = list(zip(PERCENTILES, group_percentiles(groups, count, ratios, by_ratio)))
+    result = {}
+    for i in numpy.flatnonzero(tasks):
+        stats = {
+            'tasks': int(tasks[i]),
+            'estimate': ratio(estimated[i], tasks[i]),
+            'actual': ratio(taken[i], tasks[i]),
+            'error': ratio(taken[i] - estimated[i], tasks[i]),
+            'on_estimate': ratio(on_estimate[i], tasks[i]),
+            }
+        for percentile, values in percentiles:
+            stats['ratio_p%d' % percentile] = round(float(values[i]), 3)
+        result[labels[i]] = stats
+    return result
+
+def interruption_rates(groups, labels, mark_type):
+    """
+    Counts the pomodoros and interruptions of each group of marks,
+    with interruptions per pomodoro.
+    """
+    count = len(labels)
+    counts = numpy.bincount(groups * len(MARK_TYPES) + mark_type,
+            minlength=count * len(MARK_TYPES)).reshape(count, len(MARK_TYPES))
+    result = {}
+    for i in numpy.flatnonzero(counts.sum(axis=1)):
+        pomodoros, internal, external = [int(n) for n in counts[i]]
+        result[labels[i]] = {
+            'pomodoros': pomodoros,
+            'internal': internal,
+            'external': external,
+            'internal_rate': ratio(internal, pomodoros),
+            'external_rate': ratio(external, pomodoros),
+            }
+    return result
+
+def get_runs(flags):
+    """
+    The starts and lengths of the runs of True in a boolean array.
+    """
+    edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], flags.astype(numpy.int8), [0]))))
+    return edges[::2], edges[1::2] - edges[::2]
+
+def rolling_sum(values, window):
+    """
+    The sums of each window values ending at each value from the
+    window-th on.
+    """
+    totals = numpy.concatenate(([0], numpy.cumsum(values)))
+    return totals[window:] - totals[:-window]
+
+def analyse(history, today, days=30):
+    """
+    Works out every metric for a History. today is a date; the daily
+    series covers the days up to and including it.
+    """
+    today = (today - EPOCH).days
+    weekday_labels = list(WEEKDAYS)
+    age_labels = list(AGE_LABELS)
+
+    done = history.completed
+    estimate, actual = history.estimate[done], history.actual[done]
+    task_day = history.task_day[done]
+    # actual over estimate, 1 when a task took as long as estimated
+    ratios = actual / numpy.maximum(estimate, 1)
+    by_ratio = numpy.argsort(ratios)
+    def accuracy(groups, labels):
+        return estimate_accuracy(groups, labels, estimate, actual, ratios, by_ratio)
+    estimates = {
+        'all': accuracy(numpy.zeros(len(estimate), dtype=numpy.int64), ['all']).get('all'),
+        'location': accuracy(history.task_location[done], history.locations),
+        'weekday': accuracy((task_day + EPOCH_WEEKDAY) % 7, weekday_labels),
+        'age': accuracy(numpy.searchsorted(AGE_BOUNDS, today - task_day), age_labels),
+        }
+
+    mark_type = history.mark_type
+    mark_day = history.mark_day
+    hour_labels = ['%02d' % hour for hour in range(24)]
+    def rates(groups, labels):
+        return interruption_rates(groups, labels, mark_type)
+    interruptions = {
+        'all': rates(numpy.zeros(len(mark_type), dtype=numpy.int64), ['all']).get('all'),
+        'location': rates(history.task_location[history.mark_task], history.locations),
+        'weekday': rates(history.mark_weekday, weekday_labels),
+        'hour': rates(history.mark_hour, hour_labels),
+        }
+
+    # one slot per day from ROLLING_DAYS - 1 before the series starts,
+    # so the first day has a full window
+    first = today - days - ROLLING_DAYS + 2
+    slots = days + ROLLING_DAYS - 1
+    in_range = (mark_day >= first) & (mark_day <= today)
+    daily_counts = numpy.bincount((mark_day[in_range] - first) * len(MARK_TYPES) + mark_type[in_range],
+            minlength=slots * len(MARK_TYPES)).reshape(slots, len(MARK_TYPES))
+    pomodoros = daily_counts[:, 0]
+    rolling_pomodoros = rolling_sum(pomodoros, ROLLING_DAYS)
+    rolling_interruptions = rolling_sum(daily_counts[:, 1] + daily_counts[:, 2], ROLLING_DAYS)
+    daily = []
+    for i in range(days):
+        slot = i + ROLLING_DAYS - 1
+        daily.append({
+            'date': (EPOCH + datetime.timedelta(days=int(first + slot))).isoformat(),
+            'pomodoros': int(pomodoros[slot]),
+            'internal': int(daily_counts[slot, 1]),
+            'external': int(daily_counts[slot, 2]),
+            'rolling_pomodoros': int(rolling_pomodoros[i]),
+            'rolling_rate': ratio(rolling_interruptions[i], rolling_pomodoros[i]),
+            })
+
+    is_pomodoro = mark_type == 0
+    streaks = {'current': 0, 'longest': 0, 'uninterrupted': 0}
+    if is_pomodoro.any():
+        # days in a row with a pomodoro; the current streak
+        # survives until a whole day goes by without one
+        worked = mark_day[is_pomodoro]
+        worked = worked[worked <= today]
+        if len(worked):
+            start = worked.min()
+            active = numpy.zeros(today - start + 1, dtype=bool)
+            active[worked - start] = True
+            run_starts, lengths = get_runs(active)
+            streaks['longest'] = int(lengths.max())
+            if run_starts[-1] + lengths[-1] >= len(active) - 1:
+                streaks['current'] = int(lengths[-1])
+        # pomodoros in a row on one task with no interruption between them
+        new_task = numpy.flatnonzero(numpy.diff(history.mark_task)) + 1
+        run_starts, lengths = get_runs(numpy.insert(is_pomodoro, new_task, False))
+        streaks['uninterrupted'] = int(lengths.max())
+
+    return {
+        'estimates': estimates,
+        'interruptions': interruptions,
+        'daily': daily,
+        'streaks': streaks,
+        }
@@ -0,0 +1,44 @@
+import datetime
+import sys
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+
+from stats import analytics
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--location', dest='location',
+            help='Only count task sheets from this location.'),
+        make_option('--days', dest='days', type='int', default=30,
+            help='Days in the daily series. Defaults to 30.'),
+    )
+    help = ("Prints a user's estimate accuracy, interruption rates and streaks as JSON. "
+            "With --verbosity=2 the load and analysis times go to stderr.")
+    args = '<username>'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Enter a username.')
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1.')
+        try:
+            owner = User.objects.get(username=args[0])
+        except User.DoesNotExist:
+            raise CommandError('No user %r.' % args[0])
+        verbosity = int(options.get('verbosity', 1))
+
+        started = time.time()
+        history = analytics.load(owner, location=options.get('location'))
+        loaded = time.time()
+        data = analytics.analyse(history, datetime.date.today(), days=options['days'])
+        done = time.time()
+        sys.stdout.write(simplejson.dumps(data, indent=2, sort_keys=True) + '\n')
+        if verbosity > 1:
+            sys.stderr.write('%d tasks, %d marks: loaded in %.1fms, analysed in %.1fms\n' % (
+                len(history.estimate), len(history.mark_type),
+                (loaded - started) * 1000, (done - loaded) * 1000))
@@ -0,0 +1,15 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from stats.models import DailyStats
+
+
+class Command(NoArgsCommand):
+    help = "Rebuilds the DailyStats rollups from the tasks and their marks."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        count = DailyStats.objects.rebuild()
+        if verbosity > 0:
+            sys.stdout.write('Rebuilt %d daily rollup(s).\n' % count)
@@ -0,0 +1,251 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete
+
+from pomodoro.models import TaskSheet, Task, Mark, ArchivedTaskSheet, MARK_GLYPHS
+from pomodoro.models import marks_added, marks_removed, decode_mark_log
+
+
+class DailyStatsManager(models.Manager):
+
+    def bump(self, owner_id, date, location, **counts):
+        """
+        Adds the given amounts to the owner's counters for one day
+        at one location, creating the row if needed.
+        """
+        stats, created = self.get_or_create(owner__id=owner_id, date=date, location=location,
+                defaults={'owner_id': owner_id})
+        # apply the increments in the database so concurrent
+        # bumps don't overwrite each other
+        self.filter(id=stats.id).update(**dict(
+            (name, F(name) + amount) for name, amount in counts.items()))
+
+    def refresh_tasks(self, owner_id, date, location):
+        """
+        Recomputes the owner's completed task totals for one day at
+        one location from the Task table.
+        """
+        start = datetime.datetime.combine(date, datetime.time.min)
+        end = start + datetime.timedelta(days=1)
+        tasks = Task.objects.filter(
+                owner=owner_id,
+                task_sheet__location=location,
+                completed__gte=start,
+                completed__lt=end,
+                ).values_list('estimate', 'pomodoro_count')
+        stats, created = self.get_or_create(owner__id=owner_id, date=date, location=location,
+                defaults={'owner_id': owner_id})
+        self.filter(id=stats.id).update(
+                tasks_completed=len(tasks),
+                estimated_pomodoros=sum([estimate for estimate, actual in tasks]),
+                actual_pomodoros=sum([actual for estimate, actual in tasks]),
+                )
+
+    @transaction.commit_on_success
+    def rebuild(self):
+        """
+        Throws away all the rollups and rebuilds them from
+        the tasks and their marks, and the archived task sheets.
+        """
+        rollups = {}
+        def get_rollup(owner_id, date, location):
+            key = (owner_id, date, location)
+            if key not in rollups:
+                rollups[key] = DailyStats(owner_id=owner_id, date=date, location=location)
+            return rollups[key]
+
+        mark_logs = Task.objects.exclude(mark_log='').values_list('owner', 'mark_log', 'task_sheet__location')
+        for owner_id, mark_log, location in mark_logs.iterator():
+            for mark_time, type in decode_mark_log(mark_log):
+                field = MARK_TYPE_FIELDS.get(type)
+                if field:
+                    rollup = get_rollup(owner_id, mark_time.date(), location)
+                    setattr(rollup, field, getattr(rollup, field) + 1)
+
+        tasks = Task.objects.filter(completed__isnull=False).values_list(
+                'owner', 'completed', 'estimate', 'pomodoro_count', 'task_sheet__location')
+        for owner_id, completed, estimate, actual, location in tasks.iterator():
+            rollup = get_rollup(owner_id, completed.date(), location)
+            rollup.tasks_completed += 1
+            rollup.estimated_pomodoros += estimate
+            rollup.actual_pomodoros += actual
+
+        # the archive keeps the marks but not their times, so those
+        # of an archived sheet are counted on the sheet's day
+        glyph_fields = dict([(MARK_GLYPHS[type], field) for type, field in MARK_TYPE_FIELDS.items()])
+        for archived in ArchivedTaskSheet.objects.iterator():
+            tasks, reflections = archived.unpack()
+            for task in tasks:
+                for glyph in task.mark_string:
+                    field = glyph_fields.get(glyph)
+                    if field:
+                        rollup = get_rollup(archived.owner_id, archived.date.date(), archived.location)
+                        setattr(rollup, field, getattr(rollup, field) + 1)
+                if task.completed:
+                    rollup = get_rollup(archived.owner_id, task.completed.date(), archived.location)
+                    rollup.tasks_completed += 1
+                    rollup.estimated_pomodoros += task.estimate
+                    rollup.actual_pomodoros += task.pomodoro_count
+
+        self.all().delete()
+        for rollup in rollups.values():
+            rollup.save()
+        return len(rollups)
+
+
+class DailyStats(models.Model):
+    """
+    Pre-aggregated productivity numbers for one owner's day at one
+    location. Kept up to date by signals on the marks and Task so
+    the stats pages never have to scan the raw history.
+    """
+    owner = models.ForeignKey(User, related_name='daily_stats')
+    date = models.DateField()
+    location = models.CharField(max_length=50)
+    pomodoros = models.PositiveIntegerField(default=0)
+    internal_interruptions = models.PositiveIntegerField(default=0)
+    external_interruptions = models.PositiveIntegerField(default=0)
+    tasks_completed = models.PositiveIntegerField(default=0)
+    estimated_pomodoros = models.PositiveIntegerField(default=0)
+    actual_pomodoros = models.PositiveIntegerField(default=0)
+
+    objects = DailyStatsManager()
+
+    class Meta:
+        unique_together = (('owner', 'date', 'location'),)
+        ordering = ('-date', 'location')
+        verbose_name_plural = 'daily stats'
+
+    def __unicode__(self):
+        return '%s - %s' % (self.location, self.date.strftime('%Y-%m-%d'))
+
+
+MARK_TYPE_FIELDS = {
+        'pomodoro': 'pomodoros',
+        'internal': 'internal_interruptions',
+        'external': 'external_interruptions',
+        }
+
+#### SIGNALS ####
+
+def remember_task(sender, instance, **kwargs):
+    # what the rollups have the task under, to take it out again if
+    # that changes
+    instance._stats_counted = (instance.completed, instance.task_sheet_id)
+
+post_init.connect(remember_task, sender=Task, dispatch_uid='stats_remember_task')
+
+def count_task(sender, instance, **kwargs):
+    counted = None
+    if instance.completed:
+        counted = (instance.completed.date(), instance.task_sheet.location)
+        DailyStats.objects.refresh_tasks(instance.owner_id, *counted)
+    old_completed, old_task_sheet_id = getattr(instance, '_stats_counted', (None, None))
+    remember_task(sender, instance)
+    moved = old_task_sheet_id is not None and old_task_sheet_id != instance.task_sheet_id
+    if not moved and (old_completed is None or counted and old_completed.date() == counted[0]):
+        return
+    # uncompleted, completed on another day or moved to another sheet
+    old_locations = TaskSheet.objects.filter(id=old_task_sheet_id).values_list('location', flat=True)
+    if not old_locations:
+        return
+    if moved and old_locations[0] != instance.task_sheet.location:
+        move_marks(instance.owner_id, [(instance.id, instance.mark_log)],
+                old_locations[0], instance.task_sheet.location)
+    if old_completed and (old_completed.date(), old_locations[0]) != counted:
+        DailyStats.objects.refresh_tasks(instance.owner_id, old_completed.date(), old_locations[0])
+
+post_save.connect(count_task, sender=Task, dispatch_uid='stats_count_task')
+
+def uncount_task(sender, instance, **kwargs):
+    locations = TaskSheet.objects.filter(id=instance.task_sheet_id).values_list('location', flat=True)
+    if not locations:
+        return
+    if instance.completed:
+        # the task is gone, so it drops out of the recount
+        DailyStats.objects.refresh_tasks(instance.owner_id, instance.completed.date(), locations[0])
+    # and its marks go with it
+    marks = [(instance.id, mark_time, type) for mark_time, type in decode_mark_log(instance.mark_log)]
+    bump_marks(marks, -1, {instance.id: (instance.owner_id, locations[0])})
+
+post_delete.connect(uncount_task, sender=Task, dispatch_uid='stats_uncount_task')
+
+def remember_task_sheet(sender, instance, **kwargs):
+    instance._stats_location = instance.location
+
+post_init.connect(remember_task_sheet, sender=TaskSheet, dispatch_uid='stats_remember_task_sheet')
+
+def move_task_sheet(sender, instance, created, **kwargs):
+    """
+    Moves the sheet's marks and completed tasks to its new location.
+    """
+    old_location = getattr(instance, '_stats_location', None)
+    instance._stats_location = instance.location
+    if created or old_location is None or old_location == instance.location:
+        return
+    tasks = Task.objects.filter(task_sheet=instance.id).values_list('id', 'owner', 'mark_log', 'completed')
+    move_marks(instance.owner_id, [(id, mark_log) for id, owner_id, mark_log, completed in tasks],
+            old_location, instance.location)
+    for date in set([completed.date() for id, owner_id, mark_log, completed in tasks if completed]):
+        for location in (old_location, instance.location):
+            DailyStats.objects.refresh_tasks(instance.owner_id, date, location)
+
+post_save.connect(move_task_sheet, sender=TaskSheet, dispatch_uid='stats_move_task_sheet')
+
+def move_marks(owner_id, mark_logs, old_location, new_location):
+    """
+    Moves the marks in (task id, mark log) pairs of the owner's from
+    one location's rollups to another's.
+    """
+    marks = []
+    for task_id, mark_log in mark_logs:
+        marks.extend([(task_id, mark_time, type) for mark_time, type in decode_mark_log(mark_log)])
+    task_ids = set([task_id for task_id, mark_log in mark_logs])
+    bump_marks(marks, -1, dict([(task_id, (owner_id, old_location)) for task_id in task_ids]))
+    bump_marks(marks, 1, dict([(task_id, (owner_id, new_location)) for task_id in task_ids]))
+
+def bump_marks(marks, sign, places=None):
+    """
+    Adds sign to the counters of each (task id, time, type) mark.
+    places maps task ids to (owner id, location) and is looked up
+    if not given, along with whether the tasks are completed: a
+    completed task's actual pomodoros are recounted when its X marks
+    change, since the raw UPDATEs on its counters send no post_save.
+    """
+    # completed pomodoros are counted through the X mark
+    # that add_pomodoro_mark writes for them
+    completed = {}
+    if places is None:
+        places = {}
+        for id, owner_id, location, task_completed in Task.objects.filter(
+                id__in=set([task_id for task_id, mark_time, type in marks]),
+                ).values_list('id', 'owner', 'task_sheet__location', 'completed'):
+            places[id] = (owner_id, location)
+            if task_completed:
+                completed[id] = task_completed
+    counts = {}
+    for task_id, mark_time, type in marks:
+        field = MARK_TYPE_FIELDS.get(type)
+        if field and task_id in places:
+            owner_id, location = places[task_id]
+            day_counts = counts.setdefault((owner_id, mark_time.date(), location), {})
+            day_counts[field] = day_counts.get(field, 0) + sign
+    for (owner_id, date, location), day_counts in counts.items():
+        DailyStats.objects.bump(owner_id, date, location, **day_counts)
+    recount = set([(places[task_id][0], completed[task_id].date(), places[task_id][1])
+        for task_id, mark_time, type in marks if type == 'pomodoro' and task_id in completed])
+    for owner_id, date, location in recount:
+        DailyStats.objects.refresh_tasks(owner_id, date, location)
+
+def count_marks(sender, marks, **kwargs):
+    bump_marks(marks, 1)
+
+marks_added.connect(count_marks, sender=Mark, dispatch_uid='stats_count_marks')
+
+def uncount_marks(sender, marks, **kwargs):
+    bump_marks(marks, -1)
+
+marks_removed.connect(uncount_marks, sender=Mark, dispatch_uid='stats_uncount_marks')
@@ -0,0 +1,198 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pomodoro import archive
+from pomodoro.models import TaskSheet, Task, Pomodoro, Mark
+from stats.models import DailyStats
+
+class DailyStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='office')
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='report', estimate=2)
+        self.client.login(username='ben', password='secret')
+
+    def work(self):
+        pomodoro = Pomodoro.objects.create(task=self.task)
+        Mark.objects.add(self.task.id, 'internal')
+        Mark.objects.add(self.task.id, 'external')
+        pomodoro.completed = datetime.datetime.now()
+        pomodoro.save()
+        task = Task.objects.get(id=self.task.id)
+        task.completed = datetime.datetime.now()
+        task.save()
+
+    def snapshot(self):
+        return [(s.owner_id, s.date, s.location, s.pomodoros, s.internal_interruptions,
+            s.external_interruptions, s.tasks_completed, s.estimated_pomodoros,
+            s.actual_pomodoros) for s in DailyStats.objects.all()]
+
+    def test_signals_update_rollups(self):
+        self.work()
+        stats = DailyStats.objects.get(owner=self.user, date=datetime.date.today(), location='office')
+        self.failUnlessEqual(stats.pomodoros, 1)
+        self.failUnlessEqual(stats.internal_interruptions, 1)
+        self.failUnlessEqual(stats.external_interruptions, 1)
+        self.failUnlessEqual(stats.tasks_completed, 1)
+        self.failUnlessEqual(stats.estimated_pomodoros, 2)
+        self.failUnlessEqual(stats.actual_pomodoros, 1)
+
+    def test_rebuild_matches_incremental(self):
+        self.work()
+        incremental = self.snapshot()
+        DailyStats.objects.all().delete()
+        DailyStats.objects.rebuild()
+        self.failUnlessEqual(self.snapshot(), incremental)
+
+    def test_delete_reverses_rollups(self):
+        self.work()
+        Task.objects.get(id=self.task.id).delete()
+        stats = DailyStats.objects.get(owner=self.user, date=datetime.date.today(), location='office')
+        self.failUnlessEqual((stats.pomodoros, stats.internal_interruptions, stats.external_interruptions,
+            stats.tasks_completed, stats.estimated_pomodoros, stats.actual_pomodoros), (0, 0, 0, 0, 0, 0))
+        # as a rebuild would have it
+        self.failUnlessEqual(DailyStats.objects.rebuild(), 0)
+
+    def rollups(self):
+        return [(s.date, s.location, s.pomodoros, s.tasks_completed, s.actual_pomodoros)
+                for s in DailyStats.objects.exclude(pomodoros=0, tasks_completed=0).order_by('date', 'location')]
+
+    def test_recompleted_task_leaves_old_day(self):
+        self.work()
+        today = datetime.date.today()
+        task = Task.objects.get(id=self.task.id)
+        task.completed = task.completed - datetime.timedelta(days=1)
+        task.save()
+        self.failUnlessEqual(self.rollups(), [(today - datetime.timedelta(days=1), 'office', 0, 1, 1),
+            (today, 'office', 1, 0, 0)])
+        task.completed = None
+        task.save()
+        self.failUnlessEqual(self.rollups(), [(today, 'office', 1, 0, 0)])
+
+    def test_pomodoros_after_completion_are_counted(self):
+        self.work()
+        Mark.objects.add(self.task.id, 'pomodoro')
+        stats = DailyStats.objects.get(owner=self.user, location='office')
+        self.failUnlessEqual((stats.pomodoros, stats.actual_pomodoros), (2, 2))
+
+    def test_location_change_moves_rollups(self):
+        self.work()
+        task_sheet = TaskSheet.objects.get(id=self.task_sheet.id)
+        task_sheet.location = 'home'
+        task_sheet.save()
+        self.failUnlessEqual(self.rollups(), [(datetime.date.today(), 'home', 1, 1, 1)])
+        incremental = self.snapshot()
+        DailyStats.objects.rebuild()
+        self.failUnlessEqual([row for row in incremental if any(row[3:])], self.snapshot())
+
+    def test_rebuild_keeps_archived_sheets(self):
+        self.work()
+        self.task_sheet.closed = datetime.datetime.now()
+        self.task_sheet.save()
+        # the newest sheet and task are never archived
+        Task.objects.create(task_sheet=TaskSheet.objects.create(owner=self.user, location='home'),
+                name='plan', estimate=1)
+        incremental = self.snapshot()
+        self.failUnlessEqual(archive.archive(datetime.datetime.now() + datetime.timedelta(minutes=1)), 1)
+        self.failUnlessEqual(Task.objects.filter(id=self.task.id).count(), 0)
+        DailyStats.objects.rebuild()
+        self.failUnlessEqual(self.snapshot(), incremental)
+
+    def test_stats_page(self):
+        self.work()
+        response = self.client.get('/stats/')
+        self.failUnlessEqual(response.status_code, 200)
+        self.failUnlessEqual(response.context['daily_stats'][0]['pomodoros'], 1)
+        self.client.logout()
+        self.failUnlessEqual(self.client.get('/stats/').status_code, 302)
+
+    def test_owners_are_kept_apart(self):
+        self.work()
+        other = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        task_sheet = TaskSheet.objects.create(owner=other, location='office')
+        task = Task.objects.create(task_sheet=task_sheet, name='email', estimate=1)
+        Mark.objects.add(task.id, 'internal')
+        self.failUnlessEqual(DailyStats.objects.get(owner=self.user).internal_interruptions, 1)
+        self.failUnlessEqual(DailyStats.objects.get(owner=other).internal_interruptions, 1)
+        response = self.client.get('/stats/')
+        self.failUnlessEqual(response.context['daily_stats'][0]['internal_interruptions'], 1)
+        self.client.login(username='ann', password='secret')
+        response = self.client.get('/stats/')
+        self.failUnlessEqual(response.context['daily_stats'][0]['pomodoros'], 0)
+        self.failUnlessEqual(list(response.context['locations']), ['office'])
+
+from django.utils import simplejson
+
+from pomodoro.models import decode_mark_log, to_seconds
+from stats import analytics
+
+class AnalyticsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'secret')
+        self.client.login(username='ben', password='secret')
+        self.task_sheet = TaskSheet.objects.create(owner=self.user, location='office')
+        TaskSheet.objects.filter(id=self.task_sheet.id).update(date=datetime.datetime(2010, 3, 8, 8, 0))
+        self.task = Task.objects.create(task_sheet=self.task_sheet, name='report', estimate=2,
+                completed=datetime.datetime(2010, 3, 9, 11, 0))
+        self.empty = Task.objects.create(task_sheet=self.task_sheet, name='plan', estimate=1)
+        Mark.objects.bulk_add([
+            (self.task.id, datetime.datetime(2010, 3, 8, 9, 0), 'pomodoro'),
+            (self.task.id, datetime.datetime(2010, 3, 8, 9, 30), 'internal'),
+            (self.task.id, datetime.datetime(2010, 3, 9, 9, 0), 'pomodoro'),
+            (self.task.id, datetime.datetime(2010, 3, 9, 10, 0), 'pomodoro'),
+            ])
+        self.other = Task.objects.create(task_sheet=self.task_sheet, name='email', estimate=1)
+        Mark.objects.add(self.other.id, 'external', datetime.datetime(2010, 3, 9, 10, 10))
+
+    def analyse(self):
+        return analytics.analyse(analytics.load(self.user), datetime.date(2010, 3, 9), days=2)
+
+    def test_decode_matches_models(self):
+        mark_logs = list(Task.objects.order_by('id').values_list('mark_log', flat=True))
+        mark_log, seconds, mark_type = analytics.decode_mark_logs(mark_logs)
+        expected = []
+        for i, log in enumerate(mark_logs):
+            expected.extend([(i, to_seconds(time), analytics.MARK_TYPES.index(type))
+                for time, type in decode_mark_log(log)])
+        self.failUnlessEqual(zip(mark_log.tolist(), seconds.tolist(), mark_type.tolist()), expected)
+
+    def test_estimates(self):
+        estimates = self.analyse()['estimates']
+        self.failUnlessEqual(estimates['all'], {'tasks': 1, 'estimate': 2.0, 'actual': 3.0, 'error': 1.0,
+            'on_estimate': 0.0, 'ratio_p50': 1.5, 'ratio_p90': 1.5})
+        self.failUnlessEqual(estimates['location'].keys(), ['office'])
+        self.failUnlessEqual(estimates['weekday'].keys(), ['Mon'])
+        self.failUnlessEqual(estimates['age'].keys(), ['0-7'])
+
+    def test_interruptions(self):
+        interruptions = self.analyse()['interruptions']
+        self.failUnlessEqual(interruptions['all'], {'pomodoros': 3, 'internal': 1, 'external': 1,
+            'internal_rate': 0.333, 'external_rate': 0.333})
+        self.failUnlessEqual(interruptions['hour']['09']['internal_rate'], 0.5)
+        self.failUnlessEqual(interruptions['weekday']['Tue']['external'], 1)
+
+    def test_daily_and_streaks(self):
+        results = self.analyse()
+        self.failUnlessEqual([(day['date'], day['pomodoros'], day['rolling_pomodoros'], day['rolling_rate'])
+            for day in results['daily']], [('2010-03-08', 1, 1, 1.0), ('2010-03-09', 2, 3, 0.667)])
+        self.failUnlessEqual(results['streaks'], {'current': 2, 'longest': 2, 'uninterrupted': 2})
+
+    def test_load_is_cached_until_changed(self):
+        history = analytics.load(self.user)
+        self.failUnless(analytics.load(self.user) is history)
+        self.failIf(analytics.load(self.user, location='office') is history)
+        Mark.objects.add(self.other.id, 'internal', datetime.datetime(2010, 3, 9, 10, 20))
+        reloaded = analytics.load(self.user)
+        self.failIf(reloaded is history)
+        self.failUnlessEqual(len(reloaded.mark_type), len(history.mark_type) + 1)
+
+    def test_view(self):
+        response = self.client.get('/stats/analytics/', {'location': 'home'})
+        self.failUnlessEqual(response.status_code, 200)
+        data = simplejson.loads(response.content)
+        self.failUnlessEqual(data['estimates']['all'], None)
+        self.failUnlessEqual(len(data['daily']), 30)
+        self.client.logout()
+        self.failUnlessEqual(self.client.get('/stats/analytics/').status_code, 302)
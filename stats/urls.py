@@ -0,0 +1,7 @@
+from django.conf.urls.defaults import *
+
+
+urlpatterns = patterns('stats.views',
+    url(r'^$', 'stats_index', name='stats'),
+    url(r'^analytics/$', 'stats_analytics', name='stats_analytics'),
+)
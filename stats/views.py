@@ -0,0 +1,70 @@
+import datetime
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+from django.shortcuts import render_to_response
+from django.template import RequestContext
+from django.utils import simplejson
+
+from pomodoro.replica import route
+from stats.models import DailyStats
+from stats import analytics
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 366 * 2
+BAR_WIDTH = 300
+COUNTERS = ('pomodoros', 'internal_interruptions', 'external_interruptions',
+        'tasks_completed', 'estimated_pomodoros', 'actual_pomodoros')
+
+def get_days(request):
+    try:
+        return max(1, min(int(request.GET.get('days', DEFAULT_DAYS)), MAX_DAYS))
+    except ValueError:
+        return DEFAULT_DAYS
+
+@login_required
+def stats_index(request, template_name='stats/stats_index.html'):
+    days = get_days(request)
+    location = request.GET.get('location')
+    since = datetime.date.today() - datetime.timedelta(days=days)
+
+    rollups = route(DailyStats.objects.filter(owner=request.user, date__gt=since))
+    if location:
+        rollups = rollups.filter(location=location)
+
+    # sum the locations for each day - at most a few hundred rows
+    daily = []
+    days_by_date = {}
+    for rollup in rollups.order_by('-date').values('date', *COUNTERS):
+        day = days_by_date.get(rollup['date'])
+        if day is None:
+            day = days_by_date[rollup['date']] = rollup
+            daily.append(day)
+        else:
+            for name in COUNTERS:
+                day[name] += rollup[name]
+
+    most_pomodoros = max([day['pomodoros'] for day in daily] + [1])
+    for day in daily:
+        day['bar_width'] = day['pomodoros'] * BAR_WIDTH // most_pomodoros
+    locations = route(DailyStats.objects.filter(owner=request.user)).values_list('location', flat=True).distinct().order_by('location')
+    return render_to_response(
+            template_name,
+            {
+                'daily_stats': daily,
+                'days': days,
+                'location': location,
+                'locations': locations,
+                },
+            context_instance=RequestContext(request),
+            )
+
+@login_required
+def stats_analytics(request):
+    """
+    The owner's estimate accuracy, interruption rates, daily series
+    for the last days days and streaks as JSON - see stats.analytics.
+    """
+    history = analytics.load(request.user, location=request.GET.get('location'))
+    data = analytics.analyse(history, datetime.date.today(), days=get_days(request))
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json')